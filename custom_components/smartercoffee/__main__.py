@@ -0,0 +1,372 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Author Identity: Sergiy Maysak
+# Copyright: 2019-2023 Sergiy Maysak. All rights reserved.
+
+"""
+Command line tool for SmarterCoffee makers, run from Home Assistant config dir
+or from repository root, Home Assistant is not needed:
+
+    python -m custom_components.smartercoffee discover
+    python -m custom_components.smartercoffee monitor 192.168.1.88
+    python -m custom_components.smartercoffee brew 192.168.1.88 --cups 4 --strength 1
+    python -m custom_components.smartercoffee set 192.168.1.88 hot_plate on
+    python -m custom_components.smartercoffee bench --memory --controllers 1000
+    python -m custom_components.smartercoffee chaos
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from .smartercodec import FRAMES, decode_buffer, encode_response, split_frames
+from .smartercontroller import SmarterCoffeeController, Logger
+from .smarterdiscovery import SmarterDiscovery, DEVICE_TYPE_COFFEEMAKER
+from .smarterfaults import CHAOS_SCENARIOS, run_chaos
+from .smarterstandin import SmarterCoffeeStandIn
+from .smartertrace import read_trace, DIRECTION_RECEIVED
+from .smartertransport import MemoryTransport
+
+# seconds to wait for first state of device after connect
+FIRST_STATE_TIMEOUT = 10.0
+
+# frames decoded by codec benchmark
+DECODE_BENCH_BUFFERS = 100000
+
+# captured reads are fed through controller repeatedly until that many frames are replayed
+REPLAY_BENCH_FRAMES = 100000
+
+ON_VALUES = ('on', 'true', 'yes', '1')
+OFF_VALUES = ('off', 'false', 'no', '0')
+
+# setting name: (turn on method, turn off method) or (method taking int value,)
+SETTINGS = {
+    'cups': ('set_cups',),
+    'strength': ('set_strength',),
+    'beans': ('turn_use_beans_on', 'turn_use_beans_off'),
+    'hot_plate': ('turn_hot_plate_on', 'turn_hot_plate_off'),
+    'carafe_detection': ('turn_carafe_detection_on', 'turn_carafe_detection_off'),
+    'one_cup_mode': ('turn_one_cup_mode_on', 'turn_one_cup_mode_off'),
+}
+
+
+def _controller(args, loop):
+    return SmarterCoffeeController(ip_address=args.host, port=args.port, loop=loop,
+        logger=Logger() if args.verbose else None, capture_path=args.capture,
+        transport=getattr(args, 'transport', None))
+
+
+async def _connected(args):
+    loop = asyncio.get_running_loop()
+    controller = _controller(args, loop)
+    state_arrived = loop.create_future()
+
+    def _on_state(maker):
+        print(maker, flush=True)
+        if not state_arrived.done():
+            state_arrived.set_result(None)
+
+    controller.start_monitoring(_on_state,
+        lambda maker, event_type, data: print(f'event {event_type}: {data}', flush=True))
+    try:
+        await asyncio.wait_for(state_arrived, timeout=FIRST_STATE_TIMEOUT)
+    except asyncio.TimeoutError:
+        await controller.stop_monitoring()
+        raise SystemExit(f'no state received from {args.host}:{args.port}')
+    return controller
+
+
+async def _discover(args):
+    devices = await asyncio.wait_for(SmarterDiscovery(asyncio.get_running_loop()).find(),
+        timeout=args.timeout)
+    for device in devices:
+        kind = 'coffee maker' if device.device_type == DEVICE_TYPE_COFFEEMAKER else 'kettle'
+        interface = device.interface.name if device.interface is not None else 'broadcast'
+        print(f'{kind} at {device.host_info.ip_address}:{device.host_info.port} '
+              f'mac {device.mac_address or "unknown"} fw {device.fw_version} via {interface}')
+    return 0
+
+
+async def _monitor(args):
+    controller = await _connected(args)
+    try:
+        if args.duration is not None:
+            await asyncio.sleep(args.duration)
+        else:
+            await asyncio.Event().wait()
+    finally:
+        await controller.stop_monitoring()
+    return 0
+
+
+async def _run_commands(args, commands):
+    controller = await _connected(args)
+    try:
+        for method, *values in commands:
+            result = await getattr(controller, method)(*values)
+            print(f'{method}: {result}', flush=True)
+        # let device report state changed by commands
+        await asyncio.sleep(args.wait)
+    finally:
+        await controller.stop_monitoring()
+    return 0
+
+
+async def _brew(args):
+    return await _run_commands(args, [('brew', args.cups, args.strength,
+        not args.filter, args.hot_plate_time)])
+
+
+async def _set(args):
+    methods = SETTINGS[args.setting]
+    value = args.value.lower()
+    if len(methods) == 1:
+        try:
+            return await _run_commands(args, [(methods[0], int(value))])
+        except ValueError:
+            raise SystemExit(f'{args.setting} expects number, got {args.value}')
+    if value not in ON_VALUES + OFF_VALUES:
+        raise SystemExit(f'{args.setting} expects on or off, got {args.value}')
+    return await _run_commands(args, [(methods[0] if value in ON_VALUES else methods[1],)])
+
+
+def _bench_decode():
+    buffer = encode_response('command', result=0) + encode_response('status',
+        status=0x15, water_level=0x13, wifi_strength=3, strength=2, cups=3)
+    started = time.perf_counter()
+    for _ in range(DECODE_BENCH_BUFFERS):
+        decode_buffer(buffer)
+    elapsed = time.perf_counter() - started
+    print(f'decode: {DECODE_BENCH_BUFFERS / elapsed:.0f} buffers/s '
+          f'({elapsed / DECODE_BENCH_BUFFERS * 1e6:.2f} us per buffer)')
+
+
+async def _bench_replay(trace_path):
+    """
+    Feed captured device output through controller frame reassembly and decoding
+    at CPU speed. Reads are loaded first and notify coalescing is not involved,
+    so only receive path is timed.
+    """
+    reads = [data for timestamp, direction, data in read_trace(trace_path)
+             if direction == DIRECTION_RECEIVED and len(data) > 0]
+    frames = sum(len(split_frames(data)) for data in reads)
+    if frames == 0:
+        print('replay: no frames captured')
+        return
+    controller = SmarterCoffeeController(ip_address='replay', loop=asyncio.get_running_loop(),
+        logger=None)
+    rounds = max(1, REPLAY_BENCH_FRAMES // frames)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for data in reads:
+            controller._received(data)
+    elapsed = time.perf_counter() - started
+    # let handed off messages be applied before controller is dropped
+    await asyncio.sleep(0)
+    print(f'replay: {frames * rounds} frames in {elapsed * 1000:.2f} ms '
+          f'({frames * rounds / elapsed:.0f} frames/s through controller receive path)')
+
+
+async def _bench_scale(args):
+    """
+    Run many controllers against one stand-in over in-memory pipes.
+    Every controller runs its own io thread and loop as it does in Home Assistant,
+    so this measures thread-per-controller cost, not a single loop driving them all.
+    """
+    loop = asyncio.get_running_loop()
+    standin = SmarterCoffeeStandIn(status_interval=args.status_interval)
+    transport = MemoryTransport(standin.serve)
+    waiting = set(range(args.controllers))
+    all_ready = loop.create_future()
+
+    def _state_handler(index):
+        def _on_state(maker):
+            waiting.discard(index)
+            if len(waiting) == 0 and not all_ready.done():
+                all_ready.set_result(None)
+        return _on_state
+
+    started = time.perf_counter()
+    controllers = [SmarterCoffeeController(ip_address=f'memory-{index}', loop=loop, logger=None,
+        transport=transport) for index in range(args.controllers)]
+    try:
+        for index, controller in enumerate(controllers):
+            controller.start_monitoring(_state_handler(index))
+        await asyncio.wait_for(all_ready, timeout=FIRST_STATE_TIMEOUT + args.controllers * 0.01)
+        connected = time.perf_counter() - started
+        threads = threading.active_count()
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(controller.fetch_one_cup_mode_status()
+                                         for controller in controllers))
+        queried = time.perf_counter() - started
+    finally:
+        await asyncio.gather(*(controller.stop_monitoring() for controller in controllers))
+    answered = sum(1 for result in results if result == 'ok')
+    print(f'scale: {args.controllers} controllers, one io thread each '
+          f'({threads} threads running), '
+          f'got first state in {connected:.2f} s, '
+          f'{answered} queries answered in {queried * 1000:.2f} ms')
+
+
+async def _bench(args):
+    _bench_decode()
+
+    standin = None
+    if args.memory:
+        standin = SmarterCoffeeStandIn(status_interval=args.status_interval)
+        args.host, args.transport = 'memory', MemoryTransport(standin.serve)
+    elif args.local:
+        standin = SmarterCoffeeStandIn(status_interval=args.status_interval)
+        args.host, args.port = standin.host, await standin.start()
+    elif args.host is None:
+        raise SystemExit('host is required unless --local or --memory is given')
+
+    fd, trace_path = tempfile.mkstemp(suffix='.sctr')
+    os.close(fd)
+    args.capture = trace_path
+    controller = await _connected(args)
+    try:
+        # command round trip bypasses command queue and its rate limit
+        rtts = []
+        for _ in range(args.count):
+            started = time.perf_counter()
+            await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(
+                controller._send_cmd_io(FRAMES['get_mode']), controller.io_loop))
+            rtts.append(time.perf_counter() - started)
+        rtts.sort()
+        print(f'command rtt: {len(rtts)} commands, '
+              f'median {statistics.median(rtts) * 1000:.2f} ms, '
+              f'p95 {rtts[int(len(rtts) * 0.95) - 1] * 1000:.2f} ms, '
+              f'max {rtts[-1] * 1000:.2f} ms')
+
+        # frames received by monitor during idle period, taken from capture
+        idle_started = time.monotonic()
+        await asyncio.sleep(args.duration)
+    finally:
+        await controller.stop_monitoring()
+        if standin is not None:
+            await standin.stop()
+
+    try:
+        reads = [data for timestamp, direction, data in read_trace(trace_path)
+                 if direction == DIRECTION_RECEIVED and timestamp >= idle_started]
+        frames = sum(len(split_frames(data)) for data in reads)
+        print(f'frame rate: {frames / args.duration:.2f} frames/s '
+              f'({len(reads)} reads in {args.duration:.1f} s)')
+        await _bench_replay(trace_path)
+    finally:
+        os.remove(trace_path)
+
+    if args.controllers > 0:
+        await _bench_scale(args)
+    return 0
+
+
+async def _chaos_scenario(args, name, faults):
+    result = await run_chaos(faults, duration=args.duration, read_timeout=args.read_timeout,
+        reconnect_delay=args.reconnect_delay, status_interval=args.status_interval,
+        seed=args.seed, memory=args.memory, logger=Logger() if args.verbose else None)
+    injected = ', '.join(f'{kind} {count}' for kind, count in result.faults.items())
+
+    def _recovered(seconds, lost='never'):
+        if result.failed_at is None:
+            return 'n/a'
+        return f'{seconds:.2f} s' if seconds is not None else lost
+
+    print(f'{name:10} commands ok {result.commands_ok:3} failed {result.commands_failed:2}  '
+          f'command recovery {_recovered(result.command_recovery, "no loss"):7}  '
+          f'available again {_recovered(result.available_again):7}  '
+          f'connections {result.connections}  leaked tasks {result.leaked_tasks} '
+          f'threads {result.leaked_threads}  faults: {injected or "none"}', flush=True)
+    return result.leaked_tasks == 0 and result.leaked_threads == 0 and result.commands_ok > 0
+
+
+async def _chaos(args):
+    unknown = [name for name in args.scenario if name not in CHAOS_SCENARIOS]
+    if len(unknown) > 0:
+        raise SystemExit(f'unknown scenarios: {", ".join(unknown)}')
+    passed = [await _chaos_scenario(args, name, CHAOS_SCENARIOS[name]) for name in args.scenario]
+    return 0 if all(passed) else 1
+
+
+def _parser():
+    parser = argparse.ArgumentParser(prog='python -m custom_components.smartercoffee',
+        description='SmarterCoffee maker command line tool.')
+    parser.add_argument('-v', '--verbose', action='store_true', help='log controller activity')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    discover = commands.add_parser('discover', help='find makers in local network')
+    discover.add_argument('--timeout', type=float, default=30.0)
+    discover.set_defaults(run=_discover)
+
+    def _device_parser(name, run, help, host_required=True):
+        command = commands.add_parser(name, help=help)
+        command.add_argument('host', nargs=None if host_required else '?')
+        command.add_argument('--port', type=int, default=2081)
+        command.add_argument('--capture', metavar='PATH', help='write protocol trace to file')
+        command.set_defaults(run=run)
+        return command
+
+    monitor = _device_parser('monitor', _monitor, 'print decoded states and brew events')
+    monitor.add_argument('--duration', type=float, help='seconds to monitor, forever by default')
+
+    brew = _device_parser('brew', _brew, 'start brewing')
+    brew.add_argument('--cups', type=int, default=3)
+    brew.add_argument('--strength', type=int, default=2, choices=(0, 1, 2))
+    brew.add_argument('--filter', action='store_true', help='brew without grinding beans')
+    brew.add_argument('--hot-plate-time', type=int, default=5)
+    brew.add_argument('--wait', type=float, default=3.0)
+
+    setting = _device_parser('set', _set, 'change single setting')
+    setting.add_argument('setting', choices=sorted(SETTINGS))
+    setting.add_argument('value')
+    setting.add_argument('--wait', type=float, default=3.0)
+
+    bench = _device_parser('bench', _bench, 'measure decoding, command rtt and frame rate',
+        host_required=False)
+    bench.add_argument('--local', action='store_true', help='run against local stand-in device')
+    bench.add_argument('--memory', action='store_true',
+        help='run against local stand-in device over in-memory pipe instead of TCP')
+    bench.add_argument('--controllers', type=int, default=0,
+        help='also run that many controllers, each with its own io thread, '
+             'against stand-in over in-memory pipes')
+    bench.add_argument('--count', type=int, default=50, help='commands sent to measure rtt')
+    bench.add_argument('--duration', type=float, default=10.0,
+        help='seconds to count received frames')
+    bench.add_argument('--status-interval', type=float, default=0.2,
+        help='status push interval of local stand-in')
+
+    chaos = commands.add_parser('chaos',
+        help='inject faults between controller and local stand-in device, report recovery')
+    chaos.add_argument('scenario', nargs='*', default=list(CHAOS_SCENARIOS),
+        help=f'scenarios to run: {", ".join(CHAOS_SCENARIOS)} - all by default')
+    chaos.add_argument('--duration', type=float, default=5.0, help='seconds per scenario')
+    chaos.add_argument('--read-timeout', type=float, default=1.0)
+    chaos.add_argument('--reconnect-delay', type=float, default=0.5)
+    chaos.add_argument('--status-interval', type=float, default=0.1)
+    chaos.add_argument('--seed', type=int, default=1)
+    chaos.add_argument('--memory', action='store_true',
+        help='connect to stand-in over in-memory pipe instead of TCP')
+    chaos.set_defaults(run=_chaos)
+    return parser
+
+
+def main(argv=None):
+    args = _parser().parse_args(argv)
+    try:
+        return asyncio.run(args.run(args))
+    except KeyboardInterrupt:
+        return 130
+    except (OSError, asyncio.TimeoutError) as exc:
+        print(f'{args.command} failed: {exc!r}', file=sys.stderr)
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -14,7 +14,8 @@ from homeassistant.core import callback
 
 from .const import DOMAIN as SMARTER_COFFEE_DOMAIN
 from .const import MAKERS
-from . import SmarterCoffeeBaseEntity
+from .coordinator import SmarterCoffeeBaseEntity
+from .coordinator import async_setup_maker_entities
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -33,9 +34,7 @@ async def async_setup_entry(hass, config_entry, async_add_entities):
             ]
         )
 
-    coordinator = hass.data[SMARTER_COFFEE_DOMAIN]
-    for maker in coordinator.makers:
-        build_entities(maker)
+    async_setup_maker_entities(hass, config_entry, build_entities)
 
 
 class SmarterCoffeeBinarySensor(SmarterCoffeeBaseEntity, BinarySensorEntity):
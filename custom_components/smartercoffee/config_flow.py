@@ -3,20 +3,55 @@
 
 """Config flow for SmarterCoffee Integration."""
 
-from homeassistant.core import HomeAssistant
+from collections.abc import Awaitable
+
+import voluptuous as vol
+
+from homeassistant import config_entries
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers import config_entry_flow
 
-from .const import DOMAIN
-from . import SmarterDevicesCoordinator
+from .const import DOMAIN, CONF_IO_WORKER_PROCESSES
+from .coordinator import SmarterDevicesCoordinator
 
 import logging
 
 _LOGGER = logging.getLogger(__name__)
 
+# more workers than that do not pay off for a household of makers
+MAX_IO_WORKER_PROCESSES = 8
+
 async def _async_has_devices(hass: HomeAssistant) -> bool:
     """Return if there are devices that can be discovered."""    
     devices = await SmarterDevicesCoordinator.async_find_devices(hass.loop)
     return len(devices) > 0
 
 
-config_entry_flow.register_discovery_flow(DOMAIN, "SmarterCoffee Machine Integration", _async_has_devices)
+class SmarterCoffeeConfigFlow(config_entry_flow.DiscoveryFlowHandler[Awaitable[bool]], domain=DOMAIN):
+    """Discovery flow with options."""
+
+    def __init__(self) -> None:
+        super().__init__(DOMAIN, "SmarterCoffee Machine Integration", _async_has_devices)
+
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry):
+        return SmarterCoffeeOptionsFlow(config_entry)
+
+
+class SmarterCoffeeOptionsFlow(config_entries.OptionsFlow):
+    """Options of io of makers."""
+
+    def __init__(self, config_entry):
+        self._config_entry = config_entry
+
+    async def async_step_init(self, user_input=None):
+        if user_input is not None:
+            return self.async_create_entry(title="", data=user_input)
+
+        processes = self._config_entry.options.get(CONF_IO_WORKER_PROCESSES,
+            SmarterDevicesCoordinator.IO_WORKER_PROCESSES)
+        return self.async_show_form(step_id="init", data_schema=vol.Schema({
+            vol.Required(CONF_IO_WORKER_PROCESSES, default=processes):
+                vol.All(vol.Coerce(int), vol.Range(min=0, max=MAX_IO_WORKER_PROCESSES)),
+        }))
@@ -5,4 +5,7 @@
 
 DOMAIN = "smartercoffee"
 MAKERS = 'makers'
-CONFIG_ENTRY = 'config_entry'
\ No newline at end of file
+CONFIG_ENTRY = 'config_entry'
+
+# options of config entry
+CONF_IO_WORKER_PROCESSES = 'io_worker_processes'
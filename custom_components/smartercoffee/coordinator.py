@@ -0,0 +1,834 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Author Identity: Sergiy Maysak
+# Copyright: 2019-2023 Sergiy Maysak. All rights reserved.
+
+"""SmarterCoffee makers, services and base entity of Home Assistant integration."""
+from __future__ import annotations
+
+import asyncio
+import async_timeout
+import time
+import logging
+from datetime import timedelta
+
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant, SupportsResponse
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers import device_registry as dr
+from homeassistant.helpers import entity_registry as er
+from homeassistant.helpers.event import async_call_later, async_track_time_interval
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util
+
+from homeassistant.core import callback
+from homeassistant.const import (
+    # CONF_HOST,
+    # CONF_PORT,
+    # EVENT_HOMEASSISTANT_START,
+    EVENT_HOMEASSISTANT_STOP,
+)
+
+from homeassistant.helpers.dispatcher import (
+    async_dispatcher_send,
+    async_dispatcher_connect,
+)
+from homeassistant.helpers.entity import Entity
+
+from .const import DOMAIN
+from .const import MAKERS
+from .const import CONFIG_ENTRY
+from .const import CONF_IO_WORKER_PROCESSES
+
+from . smarterdiscovery import DeviceInfo
+
+SMARTERCOFFEE_UPDATE = f'{DOMAIN}_update'
+SMARTERCOFFEE_NEW_MAKERS = f'{DOMAIN}_new_makers'
+# fired on HA bus as smartercoffee_brew_started, smartercoffee_grinding_done, smartercoffee_brew_finished
+SMARTERCOFFEE_EVENT_PREFIX = DOMAIN
+
+NOTIFICATION_ID = 'smartercoffee_notification'
+NOTIFICATION_TITLE = "SmarterCoffee Setup"
+
+PLATFORMS = ["binary_sensor", "switch", "sensor", "select", "button"]
+
+STORAGE_VERSION = 1
+STORAGE_KEY = f'{DOMAIN}.schedules'
+# last state reported by every maker, restored until device reports again after restart
+STATES_STORAGE_KEY = f'{DOMAIN}.states'
+
+_LOGGER = logging.getLogger(__name__)
+
+class SmarterCoffeeException(Exception):
+    """SmarterCoffee exception."""
+
+    def __init__(self, message):
+        """Initialize SmarterCoffeeException."""
+        super(SmarterCoffeeException, self).__init__(message)
+        self.message = message
+
+class SmarterDevicesCoordinator:
+    """Central object to manage multiple coffee makers."""
+    
+    SECONDS_BETWEEN_DISCOVERY = 10
+    MAX_SECONDS_BETWEEN_DISCOVERY = 300
+    # how many makers may be connecting at the same time
+    MAX_CONCURRENT_CONNECTS = 8
+    # seconds given to every single maker to connect
+    CONNECT_TIMEOUT = 10
+    # seconds given to all makers together to stop
+    SHUTDOWN_TIMEOUT = 10
+    # default of io_worker_processes option - run controllers io in that many worker
+    # processes, 0 - in HA process
+    IO_WORKER_PROCESSES = 0
+    # seconds pooled brew request waits for a maker by default
+    POOL_MAX_WAIT = 600
+    # seconds state changes are collected before saving them - limits disk writes
+    STATE_SAVE_DELAY = 60
+
+    def __init__(self, config_entry, hass):
+        self._config_entry = config_entry
+        self._hass = hass
+        # makers indexed by mac address and by HA device registry id
+        self._makers_by_mac = {}
+        self._makers_by_device_id = {}
+        self._scan_delay = 0
+        self._stop = None
+        self._connect_semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_CONNECTS)
+        self._platforms_loaded = False
+        from . smarterpolling import SmarterPollingScheduler
+        self._polling = SmarterPollingScheduler()
+        self._stop_polling = None
+        self._io_pool = None
+        self._io_worker_processes = config_entry.options.get(CONF_IO_WORKER_PROCESSES,
+            self.IO_WORKER_PROCESSES)
+        from . smarterschedule import BrewScheduler
+        self._store = Store(hass, STORAGE_VERSION, STORAGE_KEY)
+        self._schedules = BrewScheduler(hass.loop, self._async_fire_schedule,
+            self._schedules_changed)
+        self._states_store = Store(hass, STORAGE_VERSION, STATES_STORAGE_KEY)
+        # saved state by mac address, kept for makers not found yet as well
+        self._saved_states = {}
+        self._states_save_pending = False
+        from . smarterpool import BrewPool
+        self._brew_pool = BrewPool(lambda: [maker.api for maker in self.makers])
+        # queued pool requests are served once makers report new state
+        self._stop_pool_updates = async_dispatcher_connect(hass, SMARTERCOFFEE_UPDATE,
+            self._makers_updated)
+
+    @property
+    def schedules(self) -> BrewScheduler:
+        return self._schedules
+
+    @property
+    def brew_pool(self) -> BrewPool:
+        return self._brew_pool
+
+    @property
+    def makers(self) -> list[SmarterCoffeeDevice]:
+        return list(self._makers_by_mac.values())
+
+    @property
+    def default_maker(self) -> SmarterCoffeeDevice | None:
+        """First added maker - used when service call has no target."""
+        return next(iter(self._makers_by_mac.values()), None)
+
+    def maker_for_mac(self, mac_address) -> SmarterCoffeeDevice | None:
+        return self._makers_by_mac.get(mac_address)
+
+    def maker_for_device_id(self, device_id) -> SmarterCoffeeDevice | None:
+        return self._makers_by_device_id.get(device_id)
+
+    @classmethod
+    async def async_find_devices(cls, loop) -> list[DeviceInfo]:
+        """Run discovery for 10 seconds."""
+        devices = []
+        try:
+            from . smarterdiscovery import SmarterDiscovery
+            coffee_finder = SmarterDiscovery(loop=loop)
+
+            async with async_timeout.timeout(10):
+                devices = await coffee_finder.find()
+        except asyncio.TimeoutError:
+            _LOGGER.info('SmarterCoffee discovery has timeouted out.')
+        except AssertionError as error:
+            _LOGGER.info(f'SmarterCoffee discover got AssertionError: {error}')
+        except Exception as ex:
+            _LOGGER.info(f'SmarterCoffee discover got exception: {str(ex)}')
+        
+        _LOGGER.info(f'returning SmarterCoffee devices: {devices}')
+        return devices
+
+    async def async_schedule_discovery(self, *_) -> None:
+        """Periodically discover new SmarterCofee devices."""
+        _LOGGER.info("Start discovery for SmarterCofee devices in local network...")
+        devices = []
+        try:
+            devices = await self.async_find_devices(self._hass.loop)
+            await self.async_add_devices(self._hass, devices)
+        finally:
+            self._scan_delay = min(
+                self._scan_delay + self.SECONDS_BETWEEN_DISCOVERY,
+                self.MAX_SECONDS_BETWEEN_DISCOVERY)
+
+            if devices is None or len(devices) <= 0:
+                _LOGGER.info(f'Reschedule discover in: {self._scan_delay} seconds')
+                self._stop = async_call_later(self._hass, self._scan_delay,
+                    self.async_schedule_discovery)
+
+    async def async_add_devices(self, hass, devices):
+        """Connect newly found devices concurrently and expose their entities."""
+        new_makers = []
+        for deviceInfo in devices:
+            if deviceInfo.mac_address in self._makers_by_mac:
+                continue
+
+            maker = self._makeCoffeeMaker(deviceInfo)
+            device = register_device(hass, maker, self._config_entry)
+            maker.device_id = device.id
+            self._makers_by_mac[maker.mac_address] = maker
+            self._makers_by_device_id[device.id] = maker
+            new_makers.append(maker)
+
+        if len(new_makers) == 0:
+            return
+
+        if self._stop_polling is None:
+            self._stop_polling = async_track_time_interval(hass, self._async_poll,
+                timedelta(seconds=self._polling.POLL_TICK))
+        # every maker is exposed once its own connect ends - unreachable one holds back no one
+        await asyncio.gather(*[self._async_setup_maker(hass, maker) for maker in new_makers])
+
+    async def _async_setup_maker(self, hass, maker):
+        """Connect maker and expose its entities, forwarding platforms for the first one."""
+        await self._async_connect_maker(maker)
+        if self._makers_by_mac.get(maker.mac_address) is not maker:
+            # removed while connecting
+            return
+
+        # schedules fallen due before their maker was found fire now
+        self._schedules.release(maker.mac_address)
+        self._polling.add(maker.mac_address, maker.api)
+        maker.platforms_loaded = True
+        if not self._platforms_loaded:
+            self._platforms_loaded = True
+            await hass.config_entries.async_forward_entry_setups(self._config_entry, PLATFORMS)
+        else:
+            # platforms are set up or being set up - they build entities of makers
+            # flagged before their setup and get the rest from this signal
+            async_dispatcher_send(hass, SMARTERCOFFEE_NEW_MAKERS, [maker])
+
+    async def async_add_device(self, hass, deviceInfo):
+        """Add newly found device."""
+        await self.async_add_devices(hass, [deviceInfo])
+
+    async def async_remove_maker(self, mac_address) -> bool:
+        """Stop and forget maker with mac address specified."""
+        maker = self._makers_by_mac.pop(mac_address, None)
+        if maker is None:
+            return False
+
+        self._makers_by_device_id.pop(maker.device_id, None)
+        self._polling.remove(mac_address)
+        self._schedules.cancel_maker(mac_address)
+        self._saved_states.pop(mac_address, None)
+        self._states_store.async_delay_save(self._states_data, self.STATE_SAVE_DELAY)
+        await maker.shutdown()
+        return True
+
+    async def async_load_schedules(self):
+        """Restore brew schedules stored before restart."""
+        data = await self._store.async_load()
+        if data is not None:
+            self._schedules.load(data.get('schedules'))
+            _LOGGER.info(f'Restored {len(self._schedules)} SmarterCoffee brew schedules')
+
+    async def async_load_states(self):
+        """Load maker states saved before restart - restored when makers are created."""
+        data = await self._states_store.async_load()
+        if data is not None:
+            self._saved_states = data.get('states', {})
+            _LOGGER.info(f'Loaded saved state of {len(self._saved_states)} SmarterCoffee makers')
+
+    def _states_data(self):
+        self._states_save_pending = False
+        for maker in self.makers:
+            state = maker.api.persistent_state()
+            if state is not None:
+                self._saved_states[maker.mac_address] = state
+        return {'states': self._saved_states}
+
+    def _schedules_data(self):
+        return {'schedules': self._schedules.as_list()}
+
+    @callback
+    def _schedules_changed(self):
+        self._store.async_delay_save(self._schedules_data, 1.0)
+
+    @callback
+    def _makers_updated(self):
+        self._brew_pool.notify()
+        # store resets its timer on every call - schedule once so frequent updates can not defer it
+        if not self._states_save_pending:
+            self._states_save_pending = True
+            self._states_store.async_delay_save(self._states_data, self.STATE_SAVE_DELAY)
+
+    async def _async_fire_schedule(self, entry):
+        """Brew scheduled coffee if maker is ready for it."""
+        from . smarterschedule import MISSED_GRACE_SECONDS
+        maker = self.maker_for_mac(entry.mac_address)
+        missed = entry.when < time.time() - MISSED_GRACE_SECONDS
+        if maker is None and not missed:
+            # makers are added by discovery - schedule waits until its maker is found
+            _LOGGER.info(f'Hold scheduled brew {entry} until its maker is discovered')
+            self._schedules.hold(entry)
+            return
+
+        if missed:
+            error = 'error: schedule missed'
+        elif maker is None:
+            error = 'error: maker not found'
+        else:
+            error = maker.brew_precondition_error()
+        event_data = {'schedule_id': entry.schedule_id, 'mac_address': entry.mac_address,
+            'device_id': maker.device_id if maker is not None else None}
+        if error is not None:
+            _LOGGER.warning(f'Skipped scheduled brew {entry}: {error}')
+            self._hass.bus.async_fire(f'{DOMAIN}_schedule_skipped', {**event_data, 'reason': error})
+            return
+
+        _LOGGER.info(f'Executing scheduled brew {entry}')
+        try:
+            result = await maker.async_run(maker.api.brew(**entry.params))
+        except asyncio.TimeoutError:
+            result = 'error: timeout'
+        self._hass.bus.async_fire(f'{DOMAIN}_schedule_fired', {**event_data, 'result': result})
+
+    async def _async_poll(self, *_):
+        """Query makers for state they do not push by themselves."""
+        sent = await self._polling.async_tick()
+        if sent > 0:
+            _LOGGER.debug(f'SmarterCoffee polling sent {sent} queries')
+
+    async def _async_connect_maker(self, maker):
+        """Connect single maker within concurrency limit and start monitoring it."""
+        async with self._connect_semaphore:
+            try:
+                await maker.connect(self.CONNECT_TIMEOUT)
+            except asyncio.TimeoutError:
+                _LOGGER.warning(f'SmarterCoffee {maker.mac_address} did not connect '
+                    f'in {self.CONNECT_TIMEOUT} seconds - monitor will retry')
+            except Exception as ex:
+                _LOGGER.warning(f'SmarterCoffee {maker.mac_address} failed to connect: {ex}')
+        # monitor reconnects on its own, so start it even if connect failed
+        maker.start_monitor()
+
+    def _makeCoffeeMaker(self, deviceInfo) -> SmarterCoffeeDevice:
+        """Factory for new SmarterCoffeeDevice instance."""
+        from . smartercontroller import SmarterCoffeeController
+        host = deviceInfo.host_info
+        mac = deviceInfo.mac_address
+        restored_state = self._saved_states.get(mac)
+        _LOGGER.info(f"Creating smarter coffee at host {host}, mac: {mac}, "
+            f"restored state: {restored_state is not None}")
+
+        if self._io_worker_processes > 0:
+            if self._io_pool is None:
+                from . smarterworkers import ShardedControllerPool
+                self._io_pool = ShardedControllerPool(self._hass.loop, self._io_worker_processes)
+            controller = self._io_pool.controller(ip_address=host.ip_address,
+                port=host.port, mac=mac, restored_state=restored_state)
+        else:
+            controller = SmarterCoffeeController(ip_address=host.ip_address, 
+                port=host.port, mac=mac, loop=self._hass.loop, restored_state=restored_state)
+        maker = SmarterCoffeeDevice(self._hass, controller, deviceInfo)
+
+        return maker
+    
+    async def shutdown(self):
+        self._stop = None
+        self._schedules.shutdown()
+        self._stop_pool_updates()
+        await self._store.async_save(self._schedules_data())
+        await self._states_store.async_save(self._states_data())
+        if self._stop_polling is not None:
+            self._stop_polling()
+            self._stop_polling = None
+        makers = self.makers
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*[maker.shutdown() for maker in makers], return_exceptions=True),
+                timeout=self.SHUTDOWN_TIMEOUT)
+        except asyncio.TimeoutError:
+            _LOGGER.warning(f'SmarterCoffee makers did not stop in {self.SHUTDOWN_TIMEOUT} seconds')
+        if self._io_pool is not None:
+            await self._io_pool.shutdown()
+            self._io_pool = None
+
+class SmarterCoffeeDevice:
+    """Principal object to control SmarterCoffee maker."""
+
+    # seconds service calls and entity actions wait for maker reply, including queueing
+    COMMAND_TIMEOUT = 30
+
+    def __init__(self, hass, api, device_info: DeviceInfo):
+        """Designated initializer for SmarterCoffee platform."""
+        self.hass = hass
+        self.api = api
+        self.device_info = device_info
+        self.device_id = None
+        self.platforms_loaded = False
+
+    @property
+    def manufacturername(self):
+        return "Smarter"
+
+    @property
+    def productname(self):
+        return "Smarter Coffee v. 1.0"
+
+    @property
+    def fw_version(self):
+        return self.device_info.fw_version
+
+    async def connect(self, timeout) -> bool:
+        # controller cancels connecting in its io thread when deadline passes
+        async with async_timeout.timeout(timeout):
+            connected = await self.api.connect(timeout)
+        return connected
+
+    async def async_run(self, command):
+        """Await controller command coroutine within COMMAND_TIMEOUT and return its reply."""
+        async with async_timeout.timeout(self.COMMAND_TIMEOUT):
+            return await command
+
+    def start_monitor(self):
+        def _state_changed(maker):
+            _LOGGER.info("Arrived smarter coffee state update {}".format(self.api))
+            async_dispatcher_send(self.hass, SMARTERCOFFEE_UPDATE)
+
+        def _brew_event(maker, event_type, data):
+            _LOGGER.info(f"Arrived smarter coffee {event_type} event {data}")
+            self.hass.bus.async_fire(f'{SMARTERCOFFEE_EVENT_PREFIX}_{event_type}',
+                {'device_id': self.device_id, 'mac_address': self.mac_address, **data})
+        
+        self.api.start_monitoring(_state_changed, _brew_event)
+
+    async def async_stop_monitor(self):
+        await self.api.stop_monitoring()
+
+    async def turn_on(self, switch_class):
+        if switch_class == 'use_beans':
+            return await self.async_run(self.api.turn_use_beans_on())
+        elif switch_class == 'hot_plate':
+            return await self.async_run(self.api.turn_hot_plate_on())
+        elif switch_class == 'brew':
+            return await self.async_run(self.api.start_brew())
+        elif switch_class == 'carafe_detection':
+            return await self.async_run(self.api.turn_carafe_detection_on())
+        elif switch_class == 'one_cup_mode':
+            return await self.async_run(self.api.turn_one_cup_mode_on())
+
+    async def turn_off(self, switch_class):
+        if switch_class == 'use_beans':
+            return await self.async_run(self.api.turn_use_beans_off())
+        elif switch_class == 'hot_plate':
+            return await self.async_run(self.api.turn_hot_plate_off())
+        elif switch_class == 'brew':
+            return await self.async_run(self.api.stop_brew())
+        elif switch_class == 'carafe_detection':
+            return await self.async_run(self.api.turn_carafe_detection_off())
+        elif switch_class == 'one_cup_mode':
+            return await self.async_run(self.api.turn_one_cup_mode_off())
+
+    def is_on(self, switch_class):
+        if switch_class == 'use_beans':
+            return self.api.use_beans
+        elif switch_class == 'hot_plate':
+            return self.api.hot_plate
+        elif switch_class == 'brew':
+            return self.api.state in ['brewing', 'boiling', 'grinding']
+        elif switch_class == 'carafe_detection':
+            return self.api.carafe_detection
+        elif switch_class == 'one_cup_mode':
+            return self.api.one_cup_mode
+
+    async def shutdown(self):
+        _LOGGER.info("[SMARTERCOFFEE] Stopping monitor and disconnecting")
+        await self.async_stop_monitor()
+    
+    def brew_precondition_error(self) -> str | None:
+        """Return reason why maker can not start brewing now or None."""
+        if not self.api.available:
+            return 'error: maker is not available'
+        if self.api.stale:
+            # restored state is not proof of water and carafe
+            return 'error: maker has not reported since restart'
+        if self.api.state in ['brewing', 'boiling', 'grinding']:
+            return 'error: Already brewing'
+        if not self.api.enoughwater:
+            return 'error: Not enough water'
+        if self.api.carafe_detection and not self.api.carafe:
+            return 'error: No carafe'
+        return None
+
+    @property
+    def mac_address(self) -> str:
+        return self.api.mac_address
+
+
+async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
+    """Set up SmarterCoffee Machine Integration from a config entry."""
+    try:
+        coordinator = SmarterDevicesCoordinator(entry, hass)
+        hass.data[DOMAIN] = coordinator
+
+        await coordinator.async_load_schedules()
+        await coordinator.async_load_states()
+        await coordinator.async_schedule_discovery()
+        register_services(hass)
+
+        async def _shutdown(event):
+            coordinator = hass.data[DOMAIN]
+            await coordinator.shutdown()
+
+        entry.async_on_unload(hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, _shutdown))
+        # makers are created again with io in HA process or in workers as options say
+        entry.async_on_unload(entry.add_update_listener(_async_options_updated))
+    except Exception as ex:
+        _LOGGER.error(f'Unable to connect to SmarterCoffee: {ex}')
+        hass.components.persistent_notification.create(
+            "Error: {}<br />"
+            "Please restart hass after fixing this."
+            "".format(ex),
+            title=NOTIFICATION_TITLE,
+            notification_id=NOTIFICATION_ID)
+        return False
+
+    return True
+
+async def _async_options_updated(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    await hass.config_entries.async_reload(entry.entry_id)
+
+async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
+    """Unload a config entry."""
+    coordinator = hass.data[DOMAIN]
+    await coordinator.shutdown()
+    unload_ok = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
+    if unload_ok:
+        hass.data[DOMAIN] = None
+
+    return unload_ok
+
+async def async_remove_config_entry_device(
+    hass: HomeAssistant, entry: ConfigEntry, device_entry: dr.DeviceEntry
+) -> bool:
+    """Allow removing coffee maker device from UI."""
+    coordinator = hass.data[DOMAIN]
+    maker = coordinator.maker_for_device_id(device_entry.id)
+    if maker is not None:
+        await coordinator.async_remove_maker(maker.mac_address)
+    return True
+
+def register_device(hass: HomeAssistant, maker: SmarterCoffeeDevice, entry: ConfigEntry) -> dr.DeviceEntry:
+    """Register coffee machine device."""
+    device_registry = dr.async_get(hass)
+
+    return device_registry.async_get_or_create(
+        config_entry_id=entry.entry_id,
+        connections={(dr.CONNECTION_NETWORK_MAC, maker.api.mac_address)},
+        identifiers={(DOMAIN, maker.api.mac_address)},
+        manufacturer=maker.manufacturername,
+        name="SmarterCoffee Maker",
+        model=maker.productname,
+        sw_version=maker.fw_version,
+    )
+
+def register_services(hass):
+    """Register coffee machine custom services."""
+    async def async_handle_brew_coffee(service):
+        try:
+            _LOGGER.info(f"Handle brew_coffee service {service.data}")
+            params = _brew_params(service.data)
+            if service.data.get('pool', False):
+                return await async_brew_from_pool(hass, service, params)
+
+            coffee_makers = async_get_makers_for_service(hass, service)
+            _LOGGER.info(f"Executing brew_coffee {params} makers: {coffee_makers}")
+
+            results = await async_dispatch_to_makers(coffee_makers,
+                lambda maker: maker.api.brew(**params))
+            _LOGGER.info(f"Executed brew_coffee service with results: {results}")
+            return {'results': results}
+        except Exception as ex:
+            _LOGGER.error(f"Unable to call brew_coffee service: {ex}")
+            # response mode callers get the failure instead of empty response
+            raise HomeAssistantError(f"Unable to call brew_coffee service: {ex}") from ex
+    
+    async def async_handle_warm_plate(service):
+        """Handle warm plate request."""
+        try:
+            _LOGGER.info(f"Handle handle_warm service {service.data}")
+
+            hot_plate_time_str = service.data.get('hot_plate_time', 15)
+            coffee_makers = async_get_makers_for_service(hass, service)
+            _LOGGER.info(f"Executing handle_warm hot_plate_time: {hot_plate_time_str} makers: {coffee_makers}")
+
+            if hot_plate_time_str == 'Off':
+                command = lambda maker: maker.api.turn_hot_plate_off()
+            else:
+                command = lambda maker: maker.api.turn_hot_plate_on(int(hot_plate_time_str))
+            results = await async_dispatch_to_makers(coffee_makers, command)
+            _LOGGER.info(f"Executed warm_plate service with results: {results}")
+            return {'results': results}
+        except Exception as ex:
+            _LOGGER.error(f"Unable to call warm_plate service: {ex}")
+            raise HomeAssistantError(f"Unable to call warm_plate service: {ex}") from ex
+
+    async def async_handle_schedule_brew(service):
+        """Handle request to brew at specified time."""
+        try:
+            _LOGGER.info(f"Handle schedule_brew service {service.data}")
+            when = dt_util.parse_datetime(str(service.data['at']))
+            if when is None:
+                raise ValueError(f"invalid time {service.data['at']}")
+            if when.tzinfo is None:
+                when = when.replace(tzinfo=dt_util.DEFAULT_TIME_ZONE)
+
+            params = _brew_params(service.data)
+            coordinator = hass.data[DOMAIN]
+            schedules = {}
+            for maker in async_get_makers_for_service(hass, service):
+                entry = coordinator.schedules.add(maker.mac_address, when.timestamp(), params)
+                schedules[maker.mac_address] = entry.schedule_id
+            _LOGGER.info(f"Scheduled brew at {when}: {schedules}")
+            return {'schedules': schedules}
+        except Exception as ex:
+            _LOGGER.error(f"Unable to call schedule_brew service: {ex}")
+            raise HomeAssistantError(f"Unable to call schedule_brew service: {ex}") from ex
+
+    async def async_handle_cancel_scheduled_brew(service):
+        """Handle request to cancel brew schedule."""
+        coordinator = hass.data[DOMAIN]
+        schedule_id = service.data.get('schedule_id')
+        if schedule_id is not None:
+            cancelled = coordinator.schedules.cancel(schedule_id)
+        elif _has_targets(service):
+            # never fall back to default maker - that would wipe its schedules silently
+            cancelled = sum(coordinator.schedules.cancel_maker(maker.mac_address)
+                for maker in async_get_makers_for_service(hass, service, use_default=False))
+        else:
+            raise HomeAssistantError('cancel_scheduled_brew needs schedule_id or target makers')
+        _LOGGER.info(f"Cancelled brew schedules: {cancelled}")
+
+    # register services
+    hass.services.async_register(DOMAIN, 'brew_coffee', async_handle_brew_coffee,
+        supports_response=SupportsResponse.OPTIONAL)
+    hass.services.async_register(DOMAIN, 'warm_plate', async_handle_warm_plate,
+        supports_response=SupportsResponse.OPTIONAL)
+    hass.services.async_register(DOMAIN, 'schedule_brew', async_handle_schedule_brew,
+        supports_response=SupportsResponse.OPTIONAL)
+    hass.services.async_register(DOMAIN, 'cancel_scheduled_brew',
+        async_handle_cancel_scheduled_brew)
+
+
+def _brew_params(data) -> dict:
+    """Convert brew service fields to SmarterCoffeeController.brew arguments."""
+    cups_str = data.get('cups', 3)
+    cups = int(cups_str)
+
+    grind_str = data.get('use_beans', 'Beans')
+    grind = 1 if grind_str == 'Beans' else 0
+    
+    strength_str = data.get('strength', "Strong")
+    strength_map = {'Weak': 1, 'Medium': 2, 'Strong': 3}
+    strength = 3
+    if strength_str in strength_map:
+        strength = strength_map[strength_str]
+
+    hot_plate_time_str = data.get('hot_plate_time', 15)
+    hot_plate_time = 0 if hot_plate_time_str == 'Off' else int(hot_plate_time_str)
+
+    return {'cups': cups, 'strength': strength, 'grind': grind,
+        'hot_plate_time': hot_plate_time}
+
+
+async def async_dispatch_to_makers(makers, command) -> dict:
+    """Run command on all makers concurrently, return results keyed by mac address."""
+    outcomes = await asyncio.gather(*[maker.async_run(command(maker)) for maker in makers],
+        return_exceptions=True)
+
+    results = {}
+    for maker, outcome in zip(makers, outcomes):
+        if isinstance(outcome, asyncio.TimeoutError):
+            _LOGGER.error(f"Command timed out for maker {maker.mac_address}")
+            outcome = 'error: timeout'
+        elif isinstance(outcome, asyncio.CancelledError):
+            _LOGGER.error(f"Command cancelled for maker {maker.mac_address}")
+            outcome = 'error: cancelled'
+        elif isinstance(outcome, BaseException):
+            _LOGGER.error(f"Command failed for maker {maker.mac_address}: {outcome}")
+            outcome = f'error: {outcome}'
+        results[maker.mac_address] = outcome
+    return results
+
+
+async def async_brew_from_pool(hass, service, params) -> dict:
+    """Brew on the best targeted maker, or the best of all makers, waiting while all are busy."""
+    coordinator = hass.data[DOMAIN]
+    pool = coordinator.brew_pool
+    targeted = async_get_makers_for_service(hass, service, use_default=False)
+    if len(targeted) == 0 and _has_targets(service):
+        return {'results': {}, 'pool': {**pool.stats(), 'error': 'error: no makers targeted'}}
+    candidates = [maker.mac_address for maker in targeted] if len(targeted) > 0 else None
+    max_wait = float(service.data.get('max_wait', coordinator.POOL_MAX_WAIT))
+
+    try:
+        async with async_timeout.timeout(max_wait):
+            api, waited = await pool.acquire(candidates)
+    except asyncio.TimeoutError:
+        _LOGGER.warning(f'No SmarterCoffee maker could brew within {max_wait} seconds')
+        return {'results': {}, 'pool': {**pool.stats(), 'error': 'error: all makers are busy'}}
+
+    maker = coordinator.maker_for_mac(api.mac_address)
+    _LOGGER.info(f'Pool picked maker {api.mac_address} after waiting {waited:.1f} seconds')
+    result = 'error: maker not found'
+    try:
+        if maker is not None:
+            result = await maker.async_run(api.brew(**params))
+    except asyncio.TimeoutError:
+        result = 'error: timeout'
+    except Exception as ex:
+        result = f'error: {ex}'
+    finally:
+        pool.release(api, brewing=result == 'ok')
+    _LOGGER.info(f"Executed pooled brew_coffee with result: {result}")
+    return {'results': {api.mac_address: result},
+            'pool': {**pool.stats(), 'mac_address': api.mac_address, 'waited': waited}}
+
+
+def _has_targets(service) -> bool:
+    """True if service call names any device, area or entity."""
+    return any(len(_as_list(service.data.get(key))) > 0
+               for key in ('device_id', 'area_id', 'entity_id'))
+
+
+def _as_list(value) -> list:
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value]
+    return list(value)
+
+
+@callback
+def async_get_makers_for_service(hass, service, use_default=True) -> list[SmarterCoffeeDevice]:
+    """
+    Get coffee makers targeted by service via devices, areas or entities.
+    Call without any target gets default maker if use_default is set,
+    targets matching no maker get nothing.
+    """
+    device_ids = _as_list(service.data.get('device_id'))
+    area_ids = _as_list(service.data.get('area_id'))
+    entity_ids = _as_list(service.data.get('entity_id'))
+
+    if len(area_ids) > 0:
+        device_registry = dr.async_get(hass)
+        for area_id in area_ids:
+            device_ids.extend(device.id for device in
+                dr.async_entries_for_area(device_registry, area_id))
+
+    if len(entity_ids) > 0:
+        entity_registry = er.async_get(hass)
+        for entity_id in entity_ids:
+            entity = entity_registry.async_get(entity_id)
+            if entity is not None and entity.device_id is not None:
+                device_ids.append(entity.device_id)
+
+    coordinator = hass.data[DOMAIN]
+    makers = {}
+    for device_id in device_ids:
+        maker = coordinator.maker_for_device_id(device_id)
+        if maker is not None:
+            makers[maker.mac_address] = maker
+    _LOGGER.info(f'Found coffee makers: {list(makers)} for targets: {device_ids}')
+
+    if len(makers) == 0 and _has_targets(service):
+        _LOGGER.error(f'No coffee makers found for service {service.service} targets: '
+            f'devices {device_ids}, areas {area_ids}, entities {entity_ids}')
+    elif len(makers) == 0 and use_default and coordinator.default_maker is not None:
+        maker = coordinator.default_maker
+        makers[maker.mac_address] = maker
+
+    return list(makers.values())
+
+
+@callback
+def async_setup_maker_entities(hass, config_entry, build_entities):
+    """Build platform entities for known makers and for makers found later."""
+    coordinator = hass.data[DOMAIN]
+    for maker in coordinator.makers:
+        if maker.platforms_loaded:
+            build_entities(maker)
+
+    @callback
+    def _add_makers(makers):
+        for maker in makers:
+            build_entities(maker)
+
+    config_entry.async_on_unload(
+        async_dispatcher_connect(hass, SMARTERCOFFEE_NEW_MAKERS, _add_makers))
+
+
+class SmarterCoffeeBaseEntity(Entity):
+    """Representation of a Base Entity for SmarterCoffee."""
+    def __init__(self, maker, name):
+        """Constructor with name."""
+        self._name = name
+        self._unsub_dispatcher = None
+        self._maker = maker
+    
+    @property
+    def should_poll(self):
+        """Return the polling state."""
+        return False
+
+    async def async_added_to_hass(self):
+        """Set up a listener when this entity is added to HA."""
+        @callback
+        def _refresh():
+            self.async_schedule_update_ha_state(force_refresh=True)
+
+        self._unsub_dispatcher = async_dispatcher_connect(self.hass,
+            SMARTERCOFFEE_UPDATE, _refresh)
+    
+    async def async_will_remove_from_hass(self):
+        _LOGGER.info("async_will_remove_from_hass")
+        self._unsub_dispatcher()
+
+    @property
+    def name(self):
+        """Return the name of the sensor."""
+        return self._name
+
+    @property
+    def available(self):
+        """Return true if switch is available."""
+        return self.coffemaker.api.available
+
+    @property
+    def extra_state_attributes(self):
+        """Mark state restored from previous run until maker reports fresh one."""
+        restored_at = self.coffemaker.api.restored_at
+        if restored_at is None:
+            return None
+        return {'restored': True,
+                'restored_at': dt_util.utc_from_timestamp(restored_at).isoformat()}
+
+    @property
+    def coffemaker(self):
+        return self._maker
+
+    @property
+    def _mac_address(self):
+        return self.coffemaker.mac_address
@@ -0,0 +1,37 @@
+# Author Identity: Sergiy Maysak
+# Copyright: 2023 Sergiy Maysak. All rights reserved.
+
+"""Diagnostics support for SmarterCoffee Integration."""
+from __future__ import annotations
+
+from typing import Any
+
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .const import DOMAIN
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> dict[str, Any]:
+    """Return diagnostics for all discovered coffee makers."""
+    coordinator = hass.data[DOMAIN]
+    makers = []
+    for maker in coordinator.makers:
+        api = maker.api
+        stats = await api.fetch_stats()
+        makers.append({
+            'mac_address': maker.mac_address,
+            'fw_version': maker.fw_version,
+            'available': api.available,
+            'restored_at': api.restored_at,
+            'state': repr(api),
+            'pending_updates': sorted(api.pending_updates),
+            'command_queue': stats['command_queue'],
+            'handoff': stats['handoff'],
+            'history_bytes': api.status_history.bytes_size,
+            'history': api.status_history.records(),
+        })
+    return {'makers': makers, 'schedules': coordinator.schedules.as_list(),
+        'brew_pool': coordinator.brew_pool.stats()}
@@ -14,7 +14,8 @@ from homeassistant.core import callback
 
 from .const import DOMAIN as SMARTER_COFFEE_DOMAIN
 from .const import MAKERS
-from . import SmarterCoffeeBaseEntity
+from .coordinator import SmarterCoffeeBaseEntity
+from .coordinator import async_setup_maker_entities
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -33,9 +34,7 @@ async def async_setup_entry(hass, config_entry, async_add_entities):
             ]
         )
 
-    coordinator = hass.data[SMARTER_COFFEE_DOMAIN]
-    for maker in coordinator.makers:
-        build_entities(maker)
+    async_setup_maker_entities(hass, config_entry, build_entities)
 
 
 class SmarterCoffeeSelect(SmarterCoffeeBaseEntity, SelectEntity):
@@ -61,7 +60,7 @@ class SmarterCoffeeSelect(SmarterCoffeeBaseEntity, SelectEntity):
         """Set an option of the coffee maker device."""
         api = self.coffemaker.api
         if self._select_class == 'cups':
-            await api.set_cups(int(option))
+            await self.coffemaker.async_run(api.set_cups(int(option)))
 
     @property
     def unique_id(self):
@@ -79,7 +78,7 @@ class SmarterCoffeeStrengthSelect(SmarterCoffeeSelect):
         """Set an option of strength."""
         if option in self.options:
             value = self.options.index(option)
-            await self.coffemaker.api.set_strength(value)
+            await self.coffemaker.async_run(self.coffemaker.api.set_strength(value))
 
 
 class SmarterCoffeeHotPlateSelect(SmarterCoffeeSelect):
@@ -99,7 +98,7 @@ class SmarterCoffeeHotPlateSelect(SmarterCoffeeSelect):
         """Set an option of hot plate."""
         api = self.coffemaker.api
         if option == 'Off':
-            await api.turn_hot_plate_off()
+            await self.coffemaker.async_run(api.turn_hot_plate_off())
         else:
-            await api.turn_hot_plate_on(int(option))
+            await self.coffemaker.async_run(api.turn_hot_plate_on(int(option)))
 
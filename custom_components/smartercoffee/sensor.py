@@ -10,7 +10,8 @@ import async_timeout
 from .const import DOMAIN as SMARTER_COFFEE_DOMAIN
 from .const import MAKERS
 
-from . import SmarterCoffeeBaseEntity
+from .coordinator import SmarterCoffeeBaseEntity
+from .coordinator import async_setup_maker_entities
 from homeassistant.helpers.entity import Entity
 from homeassistant.core import callback
 
@@ -30,9 +31,7 @@ async def async_setup_entry(hass, config_entry, async_add_entities):
             ]
         )
 
-    coordinator = hass.data[SMARTER_COFFEE_DOMAIN]
-    for maker in coordinator.makers:
-        build_entities(maker)
+    async_setup_maker_entities(hass, config_entry, build_entities)
 
 
 class SmarterCoffeeSensor(SmarterCoffeeBaseEntity):
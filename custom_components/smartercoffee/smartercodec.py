@@ -0,0 +1,222 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Author Identity: Sergiy Maysak
+# Copyright: 2019-2023 Sergiy Maysak. All rights reserved.
+
+"""
+SmarterCoffee v1.0 wire protocol.
+Every frame is: message id, fields (one byte each), COMMAND_SUFFIX.
+Messages are described by tables below, encoders and decoders are built from them.
+"""
+
+import collections
+import struct
+
+COMMAND_BREW = 0x33
+COMMAND_BREW_STOP = 0x34
+COMMAND_SET_STRENGTH = 0x35
+COMMAND_SET_CUPS = 0x36
+COMMAND_BREW_DEFAULT = 0x37
+COMMAND_DEFAULTS = 0x48
+COMMAND_TOGGLE_BEANS = 0x3c
+COMMAND_TURN_HOT_PLATE_ON = 0x3e
+COMMAND_TURN_HOT_PLATE_OFF = 0x4a
+
+COMMAND_GET_CARAFE_REQUIRED = 0x4c
+COMMAND_SET_CARAFE_REQUIRED = 0x4b
+
+# set mode 'one cup' or 'carafe' - default is carafe
+COMMAND_SET_MODE = 0x4e
+# command to fetch current mode (cup or carafe)
+COMMAND_GET_MODE = 0x4f
+
+COMMAND_DISCOVER = 0x64
+
+COMMAND_SUFFIX = 0x7e
+
+RESPONSE_ID_COMMAND = 0x03
+RESPONSE_ID_STATUS = 0x32
+RESPONSE_DEFAULTS = 0x49
+RESPONSE_ID_CARAFE = 0x4d
+RESPONSE_ID_MODE = 0x50
+RESPONSE_DISCOVERY = 0x65
+
+REPLY_TABLE = {
+    0x0: 'ok',
+    0x1: 'error: Already brewing',
+    0x2: 'error: No carafe',
+    0x3: 'error: Not enough water',
+    0x4: 'error: You sent wrong value',
+    0x05: 'error: no carafe',
+    0x06: 'error: no water',
+    0x07: 'error: low water, could not finish',
+    0x0d: 'error: timer errror',
+    0x68: 'error: wifi error',
+    0x69: 'error: invalid command'
+}
+
+water_level_message_types = {
+    0x0: 'empty',
+    0x1: 'low',
+    0x2: 'half',
+    0x3: 'full',
+}
+
+strength_message_types = {
+    0x0: 'weak',
+    0x1: 'medium',
+    0x2: 'strong',
+}
+
+# out of range value is replaced by default
+Field = collections.namedtuple('Field', 'name, min, max, default')
+
+MessageSpec = collections.namedtuple('MessageSpec', 'name, id, fields')
+
+COMMAND_SPECS = (
+    MessageSpec('brew', COMMAND_BREW, (
+        Field('cups', 1, 12, 3),
+        Field('strength', 0, 2, 2),
+        Field('hot_plate_time', 0, 40, 5),
+        Field('grind', 0, 1, 1),
+    )),
+    MessageSpec('stop_brew', COMMAND_BREW_STOP, ()),
+    MessageSpec('set_strength', COMMAND_SET_STRENGTH, (Field('strength', 0, 2, 0),)),
+    MessageSpec('set_cups', COMMAND_SET_CUPS, (Field('cups', 1, 12, 3),)),
+    MessageSpec('brew_default', COMMAND_BREW_DEFAULT, ()),
+    MessageSpec('get_defaults', COMMAND_DEFAULTS, ()),
+    MessageSpec('toggle_beans', COMMAND_TOGGLE_BEANS, ()),
+    MessageSpec('hot_plate_on', COMMAND_TURN_HOT_PLATE_ON, (Field('hot_plate_time', 5, 40, 5),)),
+    MessageSpec('hot_plate_off', COMMAND_TURN_HOT_PLATE_OFF, ()),
+    MessageSpec('get_carafe_required', COMMAND_GET_CARAFE_REQUIRED, ()),
+    # 0 - carafe required, 1 - not required
+    MessageSpec('set_carafe_required', COMMAND_SET_CARAFE_REQUIRED, (Field('not_required', 0, 1, 0),)),
+    MessageSpec('set_mode', COMMAND_SET_MODE, (Field('one_cup', 0, 1, 0),)),
+    MessageSpec('get_mode', COMMAND_GET_MODE, ()),
+    MessageSpec('discover', COMMAND_DISCOVER, ()),
+)
+
+RESPONSE_SPECS = (
+    MessageSpec('command', RESPONSE_ID_COMMAND, (Field('result', 0, 255, 0),)),
+    MessageSpec('status', RESPONSE_ID_STATUS, (
+        Field('status', 0, 255, 0),
+        Field('water_level', 0, 255, 0),
+        Field('wifi_strength', 0, 255, 0),
+        Field('strength', 0, 255, 0),
+        Field('cups', 0, 255, 0),
+    )),
+    MessageSpec('defaults', RESPONSE_DEFAULTS, (
+        Field('cups', 0, 255, 0),
+        Field('strength', 0, 255, 0),
+        Field('beans', 0, 255, 0),
+        Field('hot_plate_time', 0, 255, 0),
+    )),
+    MessageSpec('carafe', RESPONSE_ID_CARAFE, (Field('value', 0, 255, 0),)),
+    MessageSpec('mode', RESPONSE_ID_MODE, (Field('value', 0, 255, 0),)),
+    MessageSpec('discovery', RESPONSE_DISCOVERY, (
+        Field('device_type', 0, 255, 0),
+        Field('fw_version', 0, 255, 0),
+    )),
+)
+
+_SUFFIX = bytes([COMMAND_SUFFIX])
+
+# single field commands with ranges up to this size get all frames prebuilt
+_MAX_PREBUILT_RANGE = 64
+
+
+def _constrained(field, value):
+    if isinstance(value, bool):
+        value = int(value)
+    if not isinstance(value, int) or value < field.min or value > field.max:
+        return field.default
+    return value
+
+
+class _Encoder:
+    __slots__ = ('spec', '_frames')
+
+    def __init__(self, spec):
+        self.spec = spec
+        self._frames = None
+        if len(spec.fields) == 0:
+            self._frames = {(): bytes([spec.id]) + _SUFFIX}
+        elif len(spec.fields) == 1:
+            field = spec.fields[0]
+            if field.max - field.min < _MAX_PREBUILT_RANGE:
+                self._frames = {(value,): bytes([spec.id, value]) + _SUFFIX
+                                for value in range(field.min, field.max + 1)}
+
+    def __call__(self, *args, **kwargs):
+        fields = self.spec.fields
+        if len(args) + len(kwargs) > len(fields):
+            raise TypeError(f'{self.spec.name} takes {len(fields)} fields')
+        values = list(args)
+        for field in fields[len(args):]:
+            values.append(kwargs.get(field.name, field.default))
+        values = tuple(_constrained(field, value) for field, value in zip(fields, values))
+        if self._frames is not None:
+            return self._frames[values]
+        return bytes([self.spec.id, *values]) + _SUFFIX
+
+
+class _Decoder:
+    __slots__ = ('spec', '_names', '_struct')
+
+    def __init__(self, spec):
+        self.spec = spec
+        self._names = tuple(field.name for field in spec.fields)
+        self._struct = struct.Struct(f'{len(spec.fields)}B')
+
+    def __call__(self, frame):
+        if len(frame) < self._struct.size + 1:
+            raise ValueError(f'{self.spec.name} frame is too short: {bytes(frame).hex()}')
+        return dict(zip(self._names, self._struct.unpack_from(frame, 1)))
+
+
+ENCODERS = {spec.name: _Encoder(spec) for spec in COMMAND_SPECS}
+DECODERS = {spec.id: _Decoder(spec) for spec in RESPONSE_SPECS}
+RESPONSE_NAMES = {spec.id: spec.name for spec in RESPONSE_SPECS}
+COMMAND_NAMES = {spec.id: spec.name for spec in COMMAND_SPECS}
+
+# frames without fields encoded once
+FRAMES = {spec.name: ENCODERS[spec.name]() for spec in COMMAND_SPECS if len(spec.fields) == 0}
+
+
+def encode(name, *args, **kwargs) -> bytes:
+    """Encode command by spec name, constraining field values to allowed range."""
+    return ENCODERS[name](*args, **kwargs)
+
+
+def split_frames(buffer):
+    """Split buffer into frames without suffix, skipping empty ones."""
+    return [frame for frame in bytes(buffer).split(_SUFFIX) if len(frame) > 0]
+
+
+def decode(frame):
+    """Decode single frame (without suffix) into (name, fields dict)."""
+    decoder = DECODERS.get(frame[0])
+    if decoder is None:
+        raise ValueError(f'unknown message id {hex(frame[0])}')
+    return decoder.spec.name, decoder(frame)
+
+
+def decode_buffer(buffer):
+    """Decode all known frames in buffer into list of (name, fields dict), skipping broken ones."""
+    messages = []
+    for frame in split_frames(buffer):
+        decoder = DECODERS.get(frame[0])
+        if decoder is None:
+            continue
+        try:
+            messages.append((decoder.spec.name, decoder(frame)))
+        except ValueError:
+            continue
+    return messages
+
+
+def encode_response(name, **values) -> bytes:
+    """Encode device side message - used by device stand-ins and tests."""
+    spec = next(spec for spec in RESPONSE_SPECS if spec.name == name)
+    return bytes([spec.id] + [_constrained(field, values.get(field.name, field.default))
+                              for field in spec.fields]) + _SUFFIX
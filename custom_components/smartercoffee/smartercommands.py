@@ -0,0 +1,269 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Author Identity: Sergiy Maysak
+# Copyright: 2019-2023 Sergiy Maysak. All rights reserved.
+
+"""Priority scheduler of commands sent to SmarterCoffee device."""
+
+import asyncio
+import functools
+import heapq
+import itertools
+import time
+
+# lower value is sent first
+PRIORITY_SAFETY = 0     # stop brew, turn hot plate off
+PRIORITY_NORMAL = 1     # brew, settings changes
+PRIORITY_POLL = 2       # status queries
+
+PRIORITY_NAMES = {
+    PRIORITY_SAFETY: 'safety',
+    PRIORITY_NORMAL: 'normal',
+    PRIORITY_POLL: 'poll',
+}
+
+QUEUE_FULL = 'error: command queue full'
+SUPERSEDED = 'error: command superseded'
+
+
+class TokenBucket:
+    """Allows burst commands at once and then rate commands per second."""
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._tokens = float(burst)
+        self._updated = clock()
+
+    def try_acquire(self) -> float:
+        """Take token and return 0 or return seconds to wait for next token."""
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            return 0.0
+        return (1.0 - self._tokens) / self.rate
+
+
+class _QueuedCommand:
+    __slots__ = ('priority', 'seq', 'command', 'key', 'future', 'enqueued_at',
+                 'cancelled', 'throttled', 'sent')
+
+    def __init__(self, priority, seq, command, key, future, enqueued_at):
+        self.priority = priority
+        self.seq = seq
+        self.command = command
+        self.key = key
+        self.future = future
+        self.enqueued_at = enqueued_at
+        self.cancelled = False
+        self.throttled = False
+        self.sent = False
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class _PriorityStats:
+    __slots__ = ('sent', 'superseded', 'rejected', 'throttled', 'cancelled',
+                 'total_delay', 'max_delay')
+
+    def __init__(self):
+        self.sent = 0
+        self.superseded = 0
+        self.rejected = 0
+        self.throttled = 0
+        self.cancelled = 0
+        self.total_delay = 0.0
+        self.max_delay = 0.0
+
+    def as_dict(self):
+        return {
+            'sent': self.sent,
+            'superseded': self.superseded,
+            'rejected': self.rejected,
+            'throttled': self.throttled,
+            'cancelled': self.cancelled,
+            'avg_delay': self.total_delay / self.sent if self.sent else 0.0,
+            'max_delay': self.max_delay,
+        }
+
+
+class CommandScheduler:
+    """
+    Bounded priority queue of commands executed one by one.
+    Commands are rate limited by optional limiter (TokenBucket) except
+    ones with priority up to exempt_priority which are never delayed.
+    Cancelling returned future drops queued command or cancels its execution.
+    All methods except stats() must be called on the io loop.
+    """
+
+    def __init__(self, execute, max_depth=16, clock=time.monotonic,
+                 limiter=None, exempt_priority=PRIORITY_SAFETY):
+        """Init with coroutine function used to send single command."""
+        self._execute = execute
+        self._max_depth = max_depth
+        self._clock = clock
+        self._limiter = limiter
+        self._exempt_priority = exempt_priority
+        self._heap = []
+        self._depth = 0
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._task = None
+        # command being executed right now
+        self._sending = None
+        self._stats = {priority: _PriorityStats() for priority in PRIORITY_NAMES}
+
+    @property
+    def depth(self) -> int:
+        """Amount of commands waiting to be sent."""
+        return self._depth
+
+    def submit(self, command, priority=PRIORITY_NORMAL, key=None, supersedes=()):
+        """
+        Queue command and return future with result of its execution.
+        Queued commands with the same key or with a key listed in supersedes are cancelled.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        stats = self._stats[priority]
+
+        stale_keys = set(supersedes)
+        if key is not None:
+            stale_keys.add(key)
+        if len(stale_keys) > 0:
+            for entry in self._heap:
+                if not entry.cancelled and entry.key in stale_keys and entry.priority >= priority:
+                    self._cancel(entry, SUPERSEDED)
+                    self._stats[entry.priority].superseded += 1
+
+        if self._depth >= self._max_depth:
+            worst = max((entry for entry in self._heap if not entry.cancelled), default=None)
+            if worst is None or worst.priority <= priority:
+                stats.rejected += 1
+                future.set_result(QUEUE_FULL)
+                return future
+            self._cancel(worst, QUEUE_FULL)
+            self._stats[worst.priority].rejected += 1
+
+        entry = _QueuedCommand(priority, next(self._seq), command, key, future, self._clock())
+        heapq.heappush(self._heap, entry)
+        self._depth += 1
+        future.add_done_callback(functools.partial(self._future_done, entry))
+
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        if self._task is None:
+            self._task = loop.create_task(self._run())
+        return future
+
+    def stats(self) -> dict:
+        """Queueing delay and counters per priority class."""
+        return {PRIORITY_NAMES[priority]: stats.as_dict()
+                for priority, stats in self._stats.items()}
+
+    def close(self, result=None):
+        """
+        Stop sending and cancel all queued commands and the one being sent.
+        Their futures get result instead of being cancelled if it is given.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        entries = list(self._heap)
+        if self._sending is not None:
+            entries.append(self._sending)
+            self._sending = None
+        for entry in entries:
+            if entry.cancelled or entry.future.done():
+                continue
+            entry.cancelled = True
+            if result is None:
+                entry.future.cancel()
+            else:
+                entry.future.set_result(result)
+        self._heap = []
+        self._depth = 0
+        # event is bound to loop - next submit may come from new io loop
+        self._wakeup = None
+
+    def _future_done(self, entry, future):
+        """Drop command cancelled by caller while it is still queued."""
+        if future.cancelled() and not entry.cancelled and not entry.sent:
+            entry.cancelled = True
+            self._depth -= 1
+            self._stats[entry.priority].cancelled += 1
+
+    def _cancel(self, entry, reason):
+        entry.cancelled = True
+        self._depth -= 1
+        if not entry.future.done():
+            entry.future.set_result(reason)
+
+    async def _run(self):
+        while True:
+            while len(self._heap) == 0:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+
+            entry = self._heap[0]
+            if not entry.cancelled and entry.future.cancelled():
+                # caller gave up and its done callback has not run yet
+                self._future_done(entry, entry.future)
+            if entry.cancelled:
+                heapq.heappop(self._heap)
+                continue
+
+            if self._limiter is not None and entry.priority > self._exempt_priority:
+                wait = self._limiter.try_acquire()
+                if wait > 0:
+                    if not entry.throttled:
+                        entry.throttled = True
+                        self._stats[entry.priority].throttled += 1
+                    # wake up earlier if more urgent command arrives
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+            heapq.heappop(self._heap)
+            self._depth -= 1
+            entry.sent = True
+
+            delay = self._clock() - entry.enqueued_at
+            stats = self._stats[entry.priority]
+            stats.sent += 1
+            stats.total_delay += delay
+            stats.max_delay = max(stats.max_delay, delay)
+
+            execution = asyncio.ensure_future(self._execute(entry.command))
+            # caller gave up - stop waiting for device reply
+            entry.future.add_done_callback(lambda _, execution=execution: execution.cancel())
+            self._sending = entry
+            try:
+                await asyncio.wait((execution,))
+            except asyncio.CancelledError:
+                execution.cancel()
+                entry.future.cancel()
+                raise
+            finally:
+                self._sending = None
+
+            if execution.cancelled():
+                if entry.future.cancelled():
+                    stats.cancelled += 1
+                entry.future.cancel()
+                continue
+            exception = execution.exception()
+            if entry.future.done():
+                continue
+            if exception is not None:
+                entry.future.set_exception(exception)
+            else:
+                entry.future.set_result(execution.result())
@@ -4,10 +4,52 @@
 # Copyright: 2019-2022 Sergiy Maysak. All rights reserved.
 
 import asyncio
-from array import array
+import collections
 from threading import Thread
+import time
 import functools
-import concurrent.futures
+
+from .smarterhistory import StatusHistory
+from .smartersession import BrewSessionTracker
+from .smartertrace import TraceWriter, DIRECTION_RECEIVED, DIRECTION_SENT
+from .smartertransport import TcpTransport
+from .smarterstreams import StreamHub, LatestValueHandoff, POLICY_LATEST, POLICY_DROP_OLDEST
+from .smartercodec import (
+    COMMAND_BREW,
+    COMMAND_BREW_STOP,
+    COMMAND_SET_STRENGTH,
+    COMMAND_SET_CUPS,
+    COMMAND_BREW_DEFAULT,
+    COMMAND_DEFAULTS,
+    COMMAND_TOGGLE_BEANS,
+    COMMAND_TURN_HOT_PLATE_ON,
+    COMMAND_TURN_HOT_PLATE_OFF,
+    COMMAND_GET_CARAFE_REQUIRED,
+    COMMAND_SET_CARAFE_REQUIRED,
+    COMMAND_SET_MODE,
+    COMMAND_GET_MODE,
+    COMMAND_SUFFIX,
+    COMMAND_NAMES,
+    RESPONSE_ID_STATUS,
+    RESPONSE_ID_COMMAND,
+    RESPONSE_DEFAULTS,
+    RESPONSE_ID_CARAFE,
+    RESPONSE_ID_MODE,
+    REPLY_TABLE,
+    FRAMES,
+    water_level_message_types,
+    strength_message_types,
+    encode,
+    decode_buffer,
+    split_frames,
+)
+from .smartercommands import (
+    CommandScheduler,
+    TokenBucket,
+    PRIORITY_SAFETY,
+    PRIORITY_NORMAL,
+    PRIORITY_POLL,
+)
 
 USE_FILTER_ONLY = 0
 USE_BEANS = 1
@@ -21,59 +63,108 @@ STATE_WATER_EMPTY = 'water-empty'   # not enought water
 STATE_BOILING = 'boiling'
 STATE_DESCALING = 'descaling'
 
-water_level_message_types = {
-    0x0: 'empty',
-    0x1: 'low',
-    0x2: 'half',
-    0x3: 'full',
+# stop commands overtake everything queued, queries go last
+COMMAND_PRIORITIES = {
+    COMMAND_BREW_STOP: PRIORITY_SAFETY,
+    COMMAND_TURN_HOT_PLATE_OFF: PRIORITY_SAFETY,
+    COMMAND_DEFAULTS: PRIORITY_POLL,
+    COMMAND_GET_CARAFE_REQUIRED: PRIORITY_POLL,
+    COMMAND_GET_MODE: PRIORITY_POLL,
+}
+
+# commands where only the latest queued one matters
+COMMANDS_LATEST_WINS = {
+    COMMAND_BREW_STOP,
+    COMMAND_SET_STRENGTH,
+    COMMAND_SET_CUPS,
+    COMMAND_DEFAULTS,
+    COMMAND_TURN_HOT_PLATE_ON,
+    COMMAND_TURN_HOT_PLATE_OFF,
+    COMMAND_GET_CARAFE_REQUIRED,
+    COMMAND_SET_CARAFE_REQUIRED,
+    COMMAND_SET_MODE,
+    COMMAND_GET_MODE,
+}
+
+# queued commands cancelled by newer command
+COMMAND_SUPERSEDES = {
+    COMMAND_BREW_STOP: (COMMAND_BREW, COMMAND_BREW_DEFAULT),
+    COMMAND_TURN_HOT_PLATE_OFF: (COMMAND_TURN_HOT_PLATE_ON,),
+    COMMAND_TURN_HOT_PLATE_ON: (COMMAND_TURN_HOT_PLATE_OFF,),
 }
 
-strength_message_types = {
-    0x0: 'weak',
-    0x1: 'medium',
-    0x2: 'strong',
+# status queries and responses answering them
+QUERY_RESPONSES = {
+    COMMAND_GET_CARAFE_REQUIRED: RESPONSE_ID_CARAFE,
+    COMMAND_GET_MODE: RESPONSE_ID_MODE,
 }
 
-COMMAND_BREW = 0x33
-COMMAND_BREW_STOP = 0x34
-COMMAND_SET_STRENGTH = 0x35
-COMMAND_SET_CUPS = 0x36
-COMMAND_BREW_DEFAULT = 0x37
-COMMAND_DEFAULTS = 0x48
-COMMAND_TOGGLE_BEANS = 0x3c
-COMMAND_TURN_HOT_PLATE_ON = 0x3e
-COMMAND_TURN_HOT_PLATE_OFF = 0x4a
-
-COMMAND_GET_CARAFE_REQUIRED = 0x4c
-COMMAND_SET_CARAFE_REQUIRED = 0x4b
-
-# set mode 'one cup' or 'carafe' - default is carafe
-COMMAND_SET_MODE = 0x4e
-# command to fetch current mode (cup or carafe)
-COMMAND_GET_MODE = 0x4f
-
-COMMAND_SUFFIX = 0x7e
-
-RESPONSE_ID_STATUS = 0x32
-RESPONSE_ID_COMMAND = 0x03
-RESPONSE_DEFAULTS = 0x49
-RESPONSE_ID_CARAFE = 0x4d
-RESPONSE_ID_MODE = 0x50
-
-REPLY_TABLE = {
-    0x0: 'ok',
-    0x1: 'error: Already brewing',
-    0x2: 'error: No carafe',
-    0x3: 'error: Not enough water',
-    0x4: 'error: You sent wrong value',
-    0x05: 'error: no carafe',
-    0x06: 'error: no water',
-    0x07: 'error: low water, could not finish',
-    0x0d: 'error: timer errror',
-    0x68: 'error: wifi error',
-    0x69: 'error: invalid command'
+# messages answering commands, all other commands are answered by command reply
+COMMAND_REPLIES = {
+    COMMAND_DEFAULTS: 'defaults',
+    COMMAND_GET_CARAFE_REQUIRED: 'carafe',
+    COMMAND_GET_MODE: 'mode',
 }
 
+# seconds after which unanswered query is not considered in flight anymore
+QUERY_IN_FLIGHT_TIMEOUT = 30.0
+
+# outgoing frames limit protecting device wifi - burst of frames, then frames per second
+COMMAND_BURST = 5
+COMMAND_RATE = 2.0
+
+# max seconds state change notifications are held to merge them into one handler call
+NOTIFY_COALESCE_DELAY = 0.05
+
+# seconds given to controller to stop its io thread
+SHUTDOWN_TIMEOUT = 5.0
+
+# seconds io tasks not owned by controller get to finish before they are cancelled on stop
+SHUTDOWN_GRACE = 0.5
+
+# seconds to wait for device to confirm optimistically applied state
+OPTIMISTIC_TIMEOUT = 5.0
+
+# attributes never reported in status - successful ack of their command confirms them
+ACK_CONFIRMED_ATTRIBUTES = ('carafe_detection', 'one_cup_mode')
+
+# seconds to wait for connection and for device reply to command if caller sets no deadline
+CONNECT_TIMEOUT = 30.0
+COMMAND_REPLY_TIMEOUT = 10.0
+
+# seconds reply arriving after COMMAND_REPLY_TIMEOUT is still taken as late reply of expired
+# command, so it is not mistaken for reply of the next command waiting for the same message
+LATE_REPLY_WINDOW = 10.0
+
+# device pushes status regularly - silence for this long means connection is dead
+READ_TIMEOUT = 30.0
+
+# seconds to wait before reconnecting to device after connection is lost
+RECONNECT_DELAY = 120
+
+# longest tail of received data without frame suffix kept for the next read
+MAX_PARTIAL_FRAME = 64
+
+# result of command not answered in COMMAND_REPLY_TIMEOUT or before connection was lost
+NO_REPLY = 'error: no reply from device'
+
+# result of command queued or waiting for reply when monitoring is stopped
+SHUTTING_DOWN = 'error: shutting down'
+
+# controller attributes describing device state
+STATE_FIELDS = (
+    'available', 'state', 'cups', 'water_level', 'enoughwater', 'wifi_strength',
+    'strength', 'use_beans', 'hot_plate_time', 'hot_plate', 'carafe',
+    'carafe_detection', 'one_cup_mode',
+)
+
+# state fields persisted between runs - availability is never restored
+RESTORED_FIELDS = tuple(field for field in STATE_FIELDS if field != 'available')
+
+# decoded message received from device, timestamp is unix time of read
+Frame = collections.namedtuple('Frame', 'timestamp, name, fields')
+
+
 
 class Logger:
     @classmethod
@@ -95,29 +186,88 @@ def as_hex_string(bytes):
 
 def split_response(response):
     """Find all response messages in a single buffer."""
-    binary = array('B', response)
-    return binary.tobytes().split(COMMAND_SUFFIX.to_bytes(1, 'big'))
+    return split_frames(response)
+
+
+class _PendingUpdate:
+    """Optimistically applied attribute waiting for device confirmation."""
+    __slots__ = ('accepted', 'observed', 'command_id', 'timer')
+
+    def __init__(self, accepted, observed, command_id, timer):
+        self.accepted = accepted
+        self.observed = observed
+        self.command_id = command_id
+        self.timer = timer
+
+
+class _ReplyWaiter:
+    """Command written to device and waiting for its reply message."""
+    __slots__ = ('name', 'command_id', 'future', 'expired')
+
+    def __init__(self, name, command_id, future):
+        self.name = name
+        self.command_id = command_id
+        self.future = future
+        self.expired = False
 
 
 class SmarterCoffeeController:
-    def __init__(self, ip_address, port=2081, mac=None, loop=None, logger=Logger.defaultLogger()):
+    def __init__(self, ip_address, port=2081, mac=None, loop=None, logger=Logger.defaultLogger(),
+                 history_size=StatusHistory.DEFAULT_CAPACITY, capture_path=None,
+                 command_rate=COMMAND_RATE, command_burst=COMMAND_BURST, transport=None,
+                 restored_state=None):
         """
         Init controller with ip address and main even loop.
         Main even loop will be notified when state of device is changed.
+        transport opens connections to device, TcpTransport by default -
+        see smartertransport for in-memory and replay ones.
+        restored_state is persistent_state() saved by previous run, shown
+        until device reports its status.
         """
         self._loop = loop if loop is not None else asyncio.get_event_loop()
         self.io_loop = None
         self._thread = None
         self._io_lock = None
+        # stop commands are exempt from rate limit
+        # scheduler serializes writes only, replies are awaited outside of it
+        self._commands = CommandScheduler(self._write_cmd_io,
+            limiter=TokenBucket(rate=command_rate, burst=command_burst),
+            exempt_priority=PRIORITY_SAFETY)
 
         self._mac_address = mac
         self._ip_address = ip_address
         self._port = port
         self._logger = logger
+        self._transport = transport if transport is not None else TcpTransport()
+        self.read_timeout = READ_TIMEOUT
+        self.reconnect_delay = RECONNECT_DELAY
         self._reader = None
         self._writer = None
-        self._previous_data = None
+        # single task reading device and routing replies to commands waiting for them
+        self._read_task = None
+        # task keeping connection open while monitoring
+        self._monitor_task = None
+        self._reply_waiters = collections.deque()
+        self._partial_frame = b''
+        self._previous_status = None
         self._update_status_in_progress = False
+        self._handler = None
+        self._notify_handle = None
+        # state change notifications requested and handler calls made after coalescing
+        self.notify_requests = 0
+        self.notify_calls = 0
+        self._pending = {}
+        # monotonic time of last sent query per command id and of last answer per response id
+        self._queried_at = {}
+        self._answered_at = {}
+        self.status_history = StatusHistory(history_size)
+        self.brew_sessions = BrewSessionTracker()
+        self._trace = TraceWriter(capture_path) if capture_path is not None else None
+        self._event_handler = None
+        self._state_streams = StreamHub()
+        self._frame_streams = StreamHub()
+        # io thread hands only the latest message of every kind to main loop
+        self._handoff = LatestValueHandoff(self._loop, self._apply_handoff)
         self.monitoring = False
 
         self.available = True
@@ -136,117 +286,260 @@ class SmarterCoffeeController:
         self.carafe_detection = True
         self.one_cup_mode = False
 
+        # unix time restored state was saved at, None once device reported status
+        self.restored_at = None
+        if restored_state is not None:
+            self.restore_state(restored_state)
+
     @property
     def mac_address(self):
         return self._mac_address
 
+    def start_capture(self, path):
+        """Append all sent and received frames to binary trace file at path."""
+        self.stop_capture()
+        self._trace = TraceWriter(path)
+
+    def stop_capture(self):
+        trace = self._trace
+        if trace is None:
+            return
+        self._trace = None
+        if self.io_loop is not None:
+            # writes happen in io thread - close after them
+            self.io_loop.call_soon_threadsafe(trace.close)
+        else:
+            trace.close()
+
+    def _capture(self, direction, data):
+        if self._trace is not None:
+            self._trace.write(direction, data)
+
+    def states(self, maxsize=1, policy=POLICY_LATEST):
+        """
+        Subscribe to state snapshots taken once per coalesced state change:
+        async with controller.states() as states: async for snapshot in states: ...
+        """
+        return self._state_streams.subscribe(maxsize, policy)
+
+    def frames(self, maxsize=64, policy=POLICY_DROP_OLDEST):
+        """Subscribe to every decoded message received from device, duplicates included."""
+        return self._frame_streams.subscribe(maxsize, policy)
+
+    def snapshot(self) -> dict:
+        """Immutable copy of current state."""
+        values = {field: getattr(self, field) for field in STATE_FIELDS}
+        values['mac_address'] = self._mac_address
+        values['pending_updates'] = frozenset(self._pending)
+        values['restored_at'] = self.restored_at
+        values['timestamp'] = time.time()
+        return values
+
+    @property
+    def stale(self) -> bool:
+        """True while state is restored from previous run and not reported by device yet."""
+        return self.restored_at is not None
+
+    def restore_state(self, values):
+        """Show state saved by persistent_state() until device reports status."""
+        for field in RESTORED_FIELDS:
+            if field in values:
+                setattr(self, field, values[field])
+        self.restored_at = values.get('saved_at', time.time())
+
+    def persistent_state(self) -> dict | None:
+        """Device reported state worth saving for next run, None if nothing fresh to save."""
+        if self.stale or self._device_value('state') == 'unknown':
+            return None
+        values = {field: self._device_value(field) for field in RESTORED_FIELDS}
+        values['saved_at'] = time.time()
+        return values
+
+    @property
+    def stream_stats(self):
+        """Queue counters of state and frame subscribers."""
+        return {'states': self._state_streams.stats(), 'frames': self._frame_streams.stats()}
+
+    @property
+    def handoff_stats(self):
+        """Counters of messages handed from io thread to main loop and dropped as stale."""
+        return self._handoff.stats()
+
+    def _publish_frames(self, messages):
+        """Publish decoded messages to frame subscribers. Called from background thread."""
+        if not self._frame_streams:
+            return
+        now = time.time()
+        for name, fields in messages:
+            self._frame_streams.publish(Frame(now, name, fields))
+
+    def _hand_off(self, messages, command_id=None):
+        """
+        Pass decoded messages to main loop. Not yet applied message of the same kind
+        is replaced, so stalled main loop catches up with current state at once.
+        Called from background thread.
+        """
+        for name, fields in messages:
+            key = (name, command_id) if name == 'command' else name
+            self._handoff.put(key, (name, fields, command_id))
+
+    @property
+    def pending_updates(self):
+        """Names of attributes applied optimistically and not confirmed yet."""
+        return set(self._pending)
+
+    @property
+    def command_queue_stats(self):
+        """Queueing delay and counters of commands per priority class."""
+        return self._commands.stats()
+
+    async def fetch_stats(self) -> dict:
+        """Command queue and handoff counters - worker proxy fetches them from its process."""
+        return {'command_queue': self.command_queue_stats, 'handoff': self.handoff_stats}
+
     @property
     def is_io_ready(self):
         return self._reader is not None and self._writer is not None
 
-    async def connect(self):
+    async def connect(self, timeout=CONNECT_TIMEOUT):
+        """
+        Connect to device and return True if connected. Cancelling caller
+        or passing timeout cancels connecting in io thread as well.
+        """
         if self.is_io_ready:
             self._log('Already connected - return')
             return True
 
         self._start_worker_thread_if_needed()
-        future = asyncio.run_coroutine_threadsafe(self._connect_io(), self.io_loop)
-        return future
+        return await self._run_io(asyncio.wait_for(self._connect_io(), timeout=timeout))
+
+    async def _run_io(self, coro):
+        """Run coroutine in io thread, cancel it there when caller is cancelled."""
+        future = asyncio.run_coroutine_threadsafe(coro, self.io_loop)
+        return await asyncio.wrap_future(future)
 
     async def _connect_io(self):
         async with self._io_lock:
             if self.is_io_ready:
                 return self.is_io_ready
 
-            self._reader, self._writer = await asyncio.open_connection(
+            self._reader, self._writer = await self._transport.open_connection(
                 host=self._ip_address, port=self._port)
             if self.is_io_ready:
                 self._log('Connection esteblished to {}'.format(self._ip_address))
-                await self._fetch_defaults()
+                self._partial_frame = b''
+                self._read_task = asyncio.ensure_future(self._read_io())
+                self._fetch_defaults()
             else:
                 self._log('Failed to open connection')
 
         return self.is_io_ready
 
-    async def _run_monitor(self, handler=None):
-        needs_reconnect_timeout = False
-
-        if not self.is_io_ready:
-            succeed = await asyncio.wait_for(self._connect_io(), timeout=30.0)
-            self._loop.call_soon_threadsafe(
-                functools.partial(self._set_availability, succeed, handler))
+    async def _read_io(self):
+        """
+        The only reader of connection. Routes replies to commands waiting for them
+        and hands everything over to main loop. Called from background thread.
+        """
+        try:
+            while True:
+                data = await asyncio.wait_for(self._reader.read(64), timeout=self.read_timeout)
+                self._capture(DIRECTION_RECEIVED, data)
+                if len(data) == 0:
+                    self._log('Connection closed by server...')
+                    break
+                self._received(data)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            self._log(f'got exception while reading smartercoffee {exc!r}')
+        await self._disconnect_io()
+
+    def _received(self, data):
+        """Decode complete frames of data. Called from background thread."""
+        data = self._partial_frame + data
+        end = data.rfind(COMMAND_SUFFIX)
+        self._partial_frame = data[end + 1:][-MAX_PARTIAL_FRAME:]
+        if end < 0:
+            return
 
-        needs_reconnect_timeout = succeed is not True
+        messages = decode_buffer(data[:end + 1])
+        self._publish_frames(messages)
+        for name, fields in messages:
+            command_id = self._route_reply(name, fields)
+            if name == 'status':
+                # device repeats unchanged status all the time
+                if fields == self._previous_status:
+                    continue
+                self._previous_status = fields
+                self._log(f'Received: {as_hex_string(data)}')
+            self._hand_off([(name, fields)], command_id)
+
+    def _route_reply(self, name, fields):
+        """Complete the oldest command waiting for message name and return its id."""
+        for waiter in self._reply_waiters:
+            if waiter.name == name:
+                self._reply_waiters.remove(waiter)
+                if waiter.expired:
+                    # late reply - its command already got NO_REPLY
+                    self._log(f'late {name} reply of command {waiter.command_id:#x} discarded')
+                elif not waiter.future.done():
+                    waiter.future.set_result(fields)
+                return waiter.command_id
+        return None
+
+    async def _run_monitor(self):
+        """Keep connection to device open while monitoring. Called from background thread."""
         self._log('Start monitoring state')
+        self._monitor_task = asyncio.current_task()
         while self.monitoring:
             try:
-                if needs_reconnect_timeout:
-                    self._log('Waiting for 2 minutes before attempt to reconnect...')
-                    await asyncio.sleep(120)
-
                 if not self.is_io_ready:
-                    self._log('Reconnecting...')
-                    connected = await asyncio.wait_for(self._connect_io(), timeout=30.0)
+                    self._log('Connecting...')
+                    connected = await asyncio.wait_for(self._connect_io(), timeout=CONNECT_TIMEOUT)
                     if not connected:
                         raise EOFError()
-
-                if self.is_io_ready and needs_reconnect_timeout:
-                    needs_reconnect_timeout = False
-                    self._loop.call_soon_threadsafe(
-                        functools.partial(self._set_availability, True, handler))
-
-                # Wait for 1 second
-                await asyncio.sleep(1)
-
-                # self._log(f'State monitor will read at: {self.io_loop.time()}')
-                async with self._io_lock:
-                    data = await asyncio.wait_for(self._reader.read(20), timeout=30.0)
-                    if len(data) == 0:
-                        self._log('Connection closed by server...')
-                        raise EOFError()
-                    message = data
-
-                if self._previous_data != message:
-                    self._log(f'Received: {as_hex_string(data)}')
-                    # schedule message handling to main run loop
-                    self._loop.call_soon_threadsafe(
-                        functools.partial(self._handle_message, message, handler))
-                    self._previous_data = message
+                self._handoff.put('available', True)
+                # reader ends when connection is lost, wait() leaves it running if monitor is cancelled
+                if self._read_task is not None:
+                    await asyncio.wait((self._read_task,))
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
                 self._log(f'got exception while monitoring smartercoffee {e}')
                 await self._disconnect_io()
-                self._loop.call_soon_threadsafe(
-                    functools.partial(self._set_availability, False, handler))
-                needs_reconnect_timeout = True
+            self._handoff.put('available', False)
+            if self.monitoring:
+                self._log(f'Waiting for {self.reconnect_delay} seconds before attempt to reconnect...')
+                await asyncio.sleep(self.reconnect_delay)
         self._log('Monitor stopped')
 
-    def _handle_message(self, message, handler):
+    def _apply_handoff(self, values):
+        """Apply latest values handed over by io thread. Executed on main thread."""
+        for key, value in values.items():
+            if key == 'available':
+                self.available = value
+            else:
+                self._apply_message(*value)
+        self._notify()
+
+    def _apply_message(self, name, fields, command_id=None):
         try:
-            responses = split_response(message)
-            for single_message in responses:
-                if len(single_message) < 1:
-                    continue
-                bytes_array = array('B', single_message)
-                id = bytes_array[0]
-                if id == RESPONSE_ID_STATUS:
-                    self._parse(bytes_array)
-                elif id == RESPONSE_ID_CARAFE or id == RESPONSE_ID_MODE:
-                    self._parse_carafe_or_cups_status(bytes_array)
-                elif id == RESPONSE_DEFAULTS:
-                    self._parse_defaults(bytes_array)
-                elif id == RESPONSE_ID_COMMAND:
-                    result = REPLY_TABLE[bytes_array[1]]
-                    self._log(f'result of command {result}')
+            if name == 'status':
+                self.restored_at = None
+                self._parse(fields)
+            elif name == 'carafe' or name == 'mode':
+                self._parse_carafe_or_cups_status(name, fields)
+            elif name == 'defaults':
+                self._parse_defaults(fields)
+            elif name == 'command':
+                result = REPLY_TABLE.get(fields['result'], 'error: unknown response')
+                self._log(f'result of command {result}')
+                if fields['result'] != 0 and command_id is not None:
+                    self._rollback_command(command_id)
+                elif command_id is not None:
+                    self._confirm_command(command_id)
         except Exception as exc:
             self._log(f'exception during parsing {exc}')
-        if handler is not None:
-            handler(self)
-
-    def _set_availability(self, available, handler):
-        """Update availability changed in io thread. Called in main thread."""
-        self.available = available
-        if handler is not None:
-            handler(self)
 
     def _start_worker_thread_if_needed(self):
         if self.io_loop is not None:
@@ -258,55 +551,100 @@ class SmarterCoffeeController:
                 asyncio.set_event_loop(loop)
                 self._io_lock = asyncio.Lock()
                 loop.run_forever()
-            except KeyboardInterrupt:
                 self._log('io worker thread stopped')
-                for task in asyncio.all_tasks(loop):
-                    loop.run_until_complete(task)
-                loop.stop()    # Received Ctrl+C
-                loop.close()
             except Exception as exc:
               self._log(f'exception during io worker thread run {exc}') 
+            finally:
+                loop.close()
             self._log('io worker thread exit.')
 
         self.io_loop = asyncio.new_event_loop()
-        self._thread = Thread(target=_io_worker, args=(self.io_loop,))
+        # daemon - never keep process alive if io thread failed to stop in time
+        self._thread = Thread(target=_io_worker, args=(self.io_loop,),
+            name=f'smartercoffee-io-{self._ip_address}', daemon=True)
         self._thread.start()
 
-    def start_monitoring(self, handler):
+    def start_monitoring(self, handler, event_handler=None):
+        """
+        Start reading device state. handler(controller) is called on state changes,
+        event_handler(controller, event_type, data) on brew session events.
+        """
         if self.monitoring:
             self._log('Already monitoring - return')
             return
 
         self.monitoring = True
+        self._handler = handler
+        self._event_handler = event_handler
         self._start_worker_thread_if_needed()
-        asyncio.run_coroutine_threadsafe(self._run_monitor(handler), self.io_loop)
+        asyncio.run_coroutine_threadsafe(self._run_monitor(), self.io_loop)
 
-    async def stop_monitoring(self):
+    async def stop_monitoring(self, timeout=SHUTDOWN_TIMEOUT):
+        """Stop monitoring, cancel queued commands and stop io thread within timeout."""
         if not self.monitoring:
             self._log('Already stopped - return')
             return
         
         self.monitoring = False
         self._log('Set monitoring flag to False')
-        disconnected = await self.disconnect()
-        if disconnected:
-            self._shutdown_thread()
+        await self._shutdown_thread(timeout)
+        self._state_streams.close()
+        self._frame_streams.close()
+
+    async def _shutdown_thread(self, timeout):
+        """Stop io loop and join its thread without blocking the calling loop."""
+        io_loop, thread = self.io_loop, self._thread
+        if io_loop is None:
+            return
 
-    def _shutdown_thread(self):
         self._log('Shutting down the io thread')
-        def _generate_abort():
-            raise KeyboardInterrupt()
-        
-        self.io_loop.call_soon_threadsafe(
-            functools.partial(_generate_abort))
-
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
         try:
-            self._thread.join()
+            future = asyncio.run_coroutine_threadsafe(self._stop_io(), io_loop)
+            await asyncio.wait_for(asyncio.wrap_future(future), timeout=timeout)
+        except Exception as exc:
+            self._log(f'io did not stop cleanly: {exc!r}')
         finally:
+            io_loop.call_soon_threadsafe(io_loop.stop)
+
+        await loop.run_in_executor(None, thread.join, max(0.0, deadline - loop.time()))
+        if thread.is_alive():
+            self._log('IO thread did not stop in time - abandon it')
+        else:
             self._log('IO thread joined')
-            self._thread = None
-            self.io_loop = None
-            self._io_lock = None
+        self._thread = None
+        self.io_loop = None
+        self._io_lock = None
+
+    async def _stop_io(self):
+        """
+        Answer queued commands and commands waiting for reply with SHUTTING_DOWN,
+        stop reader and monitor and close connection. Called from background thread.
+        """
+        self._commands.close(SHUTTING_DOWN)
+        waiters, self._reply_waiters = self._reply_waiters, collections.deque()
+        for waiter in waiters:
+            if not waiter.future.done():
+                waiter.future.set_result(SHUTTING_DOWN)
+
+        own_tasks = [task for task in (self._read_task, self._monitor_task)
+                     if task is not None and not task.done()]
+        self._monitor_task = None
+        for task in own_tasks:
+            task.cancel()
+        await asyncio.gather(*own_tasks, return_exceptions=True)
+        await self._disconnect_io()
+
+        # commands of callers return their results now, tasks of transport see EOF
+        others = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        if len(others) > 0:
+            _, pending = await asyncio.wait(others, timeout=SHUTDOWN_GRACE)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        if self._trace is not None:
+            self._trace.flush()
 
     async def disconnect(self):
         """Disconnects IO. Called from main thread."""
@@ -314,7 +652,7 @@ class SmarterCoffeeController:
             self._log('Already connected - return')
             return True
 
-        return asyncio.run_coroutine_threadsafe(self._disconnect_io(), self.io_loop)
+        return await self._run_io(self._disconnect_io())
 
     async def _disconnect_io(self):
         """Private handler of disconnect io request. Called from background thread."""
@@ -325,11 +663,19 @@ class SmarterCoffeeController:
             return
         
         async with self._io_lock:
+            read_task, self._read_task = self._read_task, None
+            if read_task is not None and read_task is not asyncio.current_task():
+                read_task.cancel()
             self._writer.close()
             # dont wait for close as it hangs sometimes - see https://github.com/encode/httpx/pull/640
             # await self._writer.wait_closed()            
             self._writer = None
             self._reader = None
+            self._previous_status = None
+            waiters, self._reply_waiters = self._reply_waiters, collections.deque()
+            for waiter in waiters:
+                if not waiter.future.done():
+                    waiter.future.set_result(None)
             self._log(f'Connection to {self._ip_address} closed.')
 
         return self._writer == None
@@ -342,10 +688,10 @@ class SmarterCoffeeController:
         
         return self._writer.is_closing()
 
-    async def _fetch_defaults(self):
-        """Internal method to fetch default setting of device."""
-        cmd = self._command_id(COMMAND_DEFAULTS)
-        return await self._sendCommand(cmd)
+    def _fetch_defaults(self):
+        """Queue fetch of default settings of device. Called from background thread."""
+        # not awaited - reply is sent after connect releases io lock
+        return self._submit_command(FRAMES['get_defaults'])
 
     async def brew(self, cups=3, strength=2, grind=True, hot_plate_time=5):
         """Brew coffee with parameters specified - amount of cups, strength, use grinder, keep plate warm."""
@@ -356,44 +702,48 @@ class SmarterCoffeeController:
         
         self._log(f'Sending brew {cups_value} cups, strength {strength_value}'
                    ' grind {use_grinder} hot_plate {hot_plate_time_value}')
-        cmd = bytearray([COMMAND_BREW, cups_value, strength_value, 
-                         hot_plate_time_value, use_grinder,
-                         COMMAND_SUFFIX])        
+        cmd = encode('brew', cups=cups_value, strength=strength_value,
+                     hot_plate_time=hot_plate_time_value, grind=use_grinder)
         self.hot_plate_time = hot_plate_time_value
+        self._apply_optimistic(COMMAND_BREW, 'state', self._brew_states(use_grinder))
         return await self._sendCommand(cmd)
 
     async def start_brew(self):
         """Brew with defaults."""
-        cmd = self._command_id(COMMAND_BREW_DEFAULT)
+        cmd = FRAMES['brew_default']
+        self._apply_optimistic(COMMAND_BREW_DEFAULT, 'state', self._brew_states(self.use_beans))
         return await self._sendCommand(cmd)
 
     async def stop_brew(self):
         """Stop current brew."""
-        cmd = self._command_id(COMMAND_BREW_STOP)
+        cmd = FRAMES['stop_brew']
+        self._apply_optimistic(COMMAND_BREW_STOP, 'state', ('ready', 'heating plate'))
         return await self._sendCommand(cmd)
 
     async def set_cups(self, cups):
         """Set amount of cups."""
         self._log('sending cups: {}'.format(cups))
-        data = self._command_in_range(COMMAND_SET_CUPS, cups,
-            min=1, max=12, default=3)
+        data = encode('set_cups', cups)
+        self._apply_optimistic(COMMAND_SET_CUPS, 'cups', (data[1],))
         return await self._sendCommand(data)
 
     async def set_strength(self, strength):
         """Set level of coffee strength (0-weak, 1-medium, 2-strong)."""
         self._log('sending set streight {}'.format(strength))
-        data = self._command_in_range(COMMAND_SET_STRENGTH, strength,
-            min=0, max=2, default=0)
+        data = encode('set_strength', strength)
+        self._apply_optimistic(COMMAND_SET_STRENGTH, 'strength',
+            (strength_message_types[data[1]],))
         return await self._sendCommand(data)
 
     async def toggle_grind(self):
         """Set use grinder of not."""
-        cmd = self._command_id(COMMAND_TOGGLE_BEANS)
+        cmd = FRAMES['toggle_beans']
         return await self._sendCommand(cmd)
 
     async def turn_use_beans_on(self):
         """Set use beans. Does nothing if its already set."""
         if not self.use_beans:
+            self._apply_optimistic(COMMAND_TOGGLE_BEANS, 'use_beans', (True,))
             return await self.toggle_grind()
         
         # return status 'ok'
@@ -402,6 +752,7 @@ class SmarterCoffeeController:
     async def turn_use_beans_off(self):
         """Set use beans. Doe nothing if its already set."""
         if self.use_beans:
+            self._apply_optimistic(COMMAND_TOGGLE_BEANS, 'use_beans', (False,))
             return await self.toggle_grind()
         
         # return status 'ok'
@@ -409,185 +760,292 @@ class SmarterCoffeeController:
 
     async def turn_hot_plate_on(self, hot_plate_time=5):
         self._log('sending hot_plate_time: {}'.format(hot_plate_time))
-        data = self._command_in_range(COMMAND_TURN_HOT_PLATE_ON,
-            hot_plate_time, min=5, max=40, default=5)
+        data = encode('hot_plate_on', hot_plate_time)
         self.hot_plate_time = self._constrained(hot_plate_time, min=5, max=40, default=5)
+        self._apply_optimistic(COMMAND_TURN_HOT_PLATE_ON, 'hot_plate', (True,))
         return await self._sendCommand(data)
 
     async def turn_hot_plate_off(self):
-        cmd = self._command_id(COMMAND_TURN_HOT_PLATE_OFF)
+        cmd = FRAMES['hot_plate_off']
+        self._apply_optimistic(COMMAND_TURN_HOT_PLATE_OFF, 'hot_plate', (False,))
         return await self._sendCommand(cmd)
 
     async def fetch_carafe_detection_status(self):
-        cmd = self._command_id(COMMAND_GET_CARAFE_REQUIRED)
-        return await self._sendCommand(cmd)
+        return await self.query(COMMAND_GET_CARAFE_REQUIRED)
 
     async def fetch_one_cup_mode_status(self):
-        cmd = self._command_id(COMMAND_GET_MODE)
-        return await self._sendCommand(cmd)        
+        return await self.query(COMMAND_GET_MODE)
+
+    async def query(self, command_id):
+        """Send status query (COMMAND_GET_CARAFE_REQUIRED or COMMAND_GET_MODE)."""
+        self._queried_at[command_id] = time.monotonic()
+        return await self._sendCommand(FRAMES[COMMAND_NAMES[command_id]])
+
+    def query_needed(self, command_id, max_age):
+        """
+        Return False if query was answered within max_age seconds
+        or if it is still in flight. Executed on main thread.
+        """
+        now = time.monotonic()
+        answered_at = self._answered_at.get(QUERY_RESPONSES[command_id])
+        if answered_at is not None and now - answered_at < max_age:
+            return False
+
+        queried_at = self._queried_at.get(command_id)
+        if queried_at is not None and now - queried_at < QUERY_IN_FLIGHT_TIMEOUT:
+            if answered_at is None or answered_at < queried_at:
+                return False
+        return True
 
     async def turn_carafe_detection_on(self):
-        # force set new state
-        self.carafe_detection = True
-        cmd = bytearray([COMMAND_SET_CARAFE_REQUIRED, 0x0, COMMAND_SUFFIX])
+        self._apply_optimistic(COMMAND_SET_CARAFE_REQUIRED, 'carafe_detection', (True,))
+        cmd = encode('set_carafe_required', 0)
         return await self._sendCommand(cmd)
 
     async def turn_carafe_detection_off(self):
-        # force set new state
-        self.carafe_detection = False
-        cmd = bytearray([COMMAND_SET_CARAFE_REQUIRED, 0x1, COMMAND_SUFFIX])
+        self._apply_optimistic(COMMAND_SET_CARAFE_REQUIRED, 'carafe_detection', (False,))
+        cmd = encode('set_carafe_required', 1)
         return await self._sendCommand(cmd)
 
     async def turn_one_cup_mode_on(self):
-        cmd = bytearray([COMMAND_SET_MODE, 0x1, COMMAND_SUFFIX])
+        self._apply_optimistic(COMMAND_SET_MODE, 'one_cup_mode', (True,))
+        cmd = encode('set_mode', 1)
         return await self._sendCommand(cmd)
     
     async def turn_one_cup_mode_off(self):
-        cmd = bytearray([COMMAND_SET_MODE, 0x0, COMMAND_SUFFIX])
+        self._apply_optimistic(COMMAND_SET_MODE, 'one_cup_mode', (False,))
+        cmd = encode('set_mode', 0)
         return await self._sendCommand(cmd)
 
-    def _command_id(self, command_id):
-        return bytearray([command_id, COMMAND_SUFFIX])
+    def _brew_states(self, use_beans):
+        """States device reports once brew is started."""
+        return ('grinding', 'brewing') if use_beans else ('brewing',)
 
-    def _command_in_range(self, command_id, value, min, max, default):
-        constrained_value = default
-        if value <= max and value >= min:
-            constrained_value = value
+    def _apply_optimistic(self, command_id, attribute, accepted):
+        """
+        Show first of accepted values right away until device confirms any of them.
+        Rolled back to device reported value on command error or after OPTIMISTIC_TIMEOUT.
+        Executed on main thread.
+        """
+        pending = self._pending.pop(attribute, None)
+        if pending is not None:
+            pending.timer.cancel()
+            observed = pending.observed
+        else:
+            observed = getattr(self, attribute)
+
+        timer = self._loop.call_later(OPTIMISTIC_TIMEOUT,
+            functools.partial(self._rollback, attribute))
+        self._pending[attribute] = _PendingUpdate(accepted, observed, command_id, timer)
+        setattr(self, attribute, accepted[0])
+        self._notify()
+
+    def _observe(self, attribute, value):
+        """Store value reported by device, reconciling it with pending optimistic update."""
+        pending = self._pending.get(attribute)
+        if pending is None:
+            setattr(self, attribute, value)
+            return
+
+        pending.observed = value
+        if value in pending.accepted:
+            pending.timer.cancel()
+            del self._pending[attribute]
+            setattr(self, attribute, value)
 
-        return bytearray([command_id, constrained_value, COMMAND_SUFFIX])
+    def _device_value(self, attribute):
+        """Last value reported by device, ignoring optimistic update."""
+        pending = self._pending.get(attribute)
+        return pending.observed if pending is not None else getattr(self, attribute)
+
+    def _rollback(self, attribute):
+        pending = self._pending.pop(attribute, None)
+        if pending is None:
+            return
+
+        pending.timer.cancel()
+        self._log(f'{attribute} was not confirmed by device - roll back to {pending.observed}')
+        setattr(self, attribute, pending.observed)
+        self._notify()
+
+    def _confirm_command(self, command_id):
+        """Keep optimistic value of attribute status frames never carry once device acked it."""
+        for attribute in ACK_CONFIRMED_ATTRIBUTES:
+            pending = self._pending.get(attribute)
+            if pending is not None and pending.command_id == command_id:
+                pending.timer.cancel()
+                del self._pending[attribute]
+
+    def _rollback_command(self, command_id):
+        for attribute, pending in list(self._pending.items()):
+            if pending.command_id == command_id:
+                self._rollback(attribute)
+
+    def _notify(self):
+        """
+        Request handler call. All requests made within NOTIFY_COALESCE_DELAY
+        result in a single call. Executed on main thread.
+        """
+        self.notify_requests += 1
+        if self._notify_handle is not None:
+            return
+        if NOTIFY_COALESCE_DELAY > 0:
+            self._notify_handle = self._loop.call_later(NOTIFY_COALESCE_DELAY, self._flush_notify)
+        else:
+            self._notify_handle = self._loop.call_soon(self._flush_notify)
+
+    def _flush_notify(self):
+        self._notify_handle = None
+        self.notify_calls += 1
+        if self._state_streams:
+            self._state_streams.publish(self.snapshot())
+        if self._handler is not None:
+            self._handler(self)
 
     async def _sendCommand(self, command_bytes):
+        """
+        Queue command in background thread and return device reply from REPLY_TABLE.
+        Deadline of caller (asyncio.timeout, wait_for) or its cancellation
+        removes queued command or stops waiting for its reply in io thread.
+        """
         self._start_worker_thread_if_needed()
-        # request sending command in own background thread
-        future = asyncio.run_coroutine_threadsafe(
-            self._send_cmd_io(command_bytes), self.io_loop)
-        
-        # future.result() never completes and we dont really need result of command sending
-        # so just return True
-        return True
-        
-        # try:
-        #     result = future.result()
-        # except concurrent.futures.TimeoutError:
-        #     print('The coroutine took too long, cancelling the task...')
-        #     future.cancel()
-        #     result = 'failed'
-        # except Exception as exc:
-        #     print(f'The coroutine raised an exception: {exc!r}')
-        # else:
-        #     print(f'The coroutine returned: {result!r}')
-
-        # return result
+        return await self._run_io(self._command_io(command_bytes))
+
+    async def _command_io(self, command_bytes):
+        written = await self._submit_command(command_bytes)
+        if not asyncio.isfuture(written):
+            # rejected by queue or not sent at all
+            return written
+        return self._reply_result(await written, command_bytes[0])
+
+    def _submit_command(self, command_bytes):
+        """Queue command according to its priority. Called from background thread."""
+        command_id = command_bytes[0]
+        return self._commands.submit(command_bytes,
+            priority=COMMAND_PRIORITIES.get(command_id, PRIORITY_NORMAL),
+            key=command_id if command_id in COMMANDS_LATEST_WINS else None,
+            supersedes=COMMAND_SUPERSEDES.get(command_id, ()))
 
     async def _send_cmd_io(self, bytes):
+        """Write command bypassing command queue and wait for its reply. Called from background thread."""
+        written = await self._write_cmd_io(bytes)
+        if not asyncio.isfuture(written):
+            return written
+        return self._reply_result(await written, bytes[0])
+
+    async def _write_cmd_io(self, bytes):
+        """
+        Write command and return future of its reply routed by reader, so
+        next command is written without waiting for reads of any kind.
+        Called by command scheduler, the only writer.
+        """
         if self._is_disconnecting:
             self._log(f'io is disconnecting - reject command: {as_hex_string(bytes)}')
             return
 
         if not self.is_io_ready:
-            succeed = await asyncio.wait_for(self._connect_io(), timeout=30.0)
+            try:
+                succeed = await asyncio.wait_for(self._connect_io(), timeout=CONNECT_TIMEOUT)
+            except (asyncio.TimeoutError, OSError) as exc:
+                self._log(f'failed to connect for command: {exc!r}')
+                succeed = False
             if succeed is False:
                 return 'error: no connection to device'
 
-        self._log(f'gonna send command: {as_hex_string(bytes)}')
-        async with self._io_lock:
-            self._writer.write(bytes)
-            await self._writer.drain()
-            self._log(f'command sent - waiting for results')
-            reply = await self._reader.read(20)
-
-        try:
-            a = array('B', reply)
-            self._log(f'arrived cmd response: {as_hex_string(a)}')
-            self._loop.call_soon_threadsafe(
-                        functools.partial(self._handle_message, a, None))
-            result = REPLY_TABLE[0] # useless - to remove?
-        except Exception as exc:
-            self._log(f'exception during read cmd status {exc}')
-            result = 'error: unknown response'
+        loop = asyncio.get_running_loop()
+        waiter = _ReplyWaiter(COMMAND_REPLIES.get(bytes[0], 'command'), bytes[0],
+            loop.create_future())
+        self._reply_waiters.append(waiter)
+        # waiters of commands nobody awaits (defaults) must not pile up either
+        loop.call_later(COMMAND_REPLY_TIMEOUT, self._expire_reply, waiter)
 
+        self._log(f'gonna send command: {as_hex_string(bytes)}')
+        self._writer.write(bytes)
+        self._capture(DIRECTION_SENT, bytes)
+        await self._writer.drain()
+        self._log(f'command sent - waiting for results')
+        return waiter.future
+
+    def _expire_reply(self, waiter):
+        """Answer command with NO_REPLY, keep waiter a while to catch its late reply."""
+        if not waiter.future.done():
+            waiter.future.set_result(None)
+        if waiter in self._reply_waiters:
+            waiter.expired = True
+            asyncio.get_running_loop().call_later(LATE_REPLY_WINDOW, self._drop_reply, waiter)
+
+    def _drop_reply(self, waiter):
+        if waiter in self._reply_waiters:
+            self._reply_waiters.remove(waiter)
+
+    def _reply_result(self, fields, command_id):
+        """Map fields of reply message to REPLY_TABLE result."""
+        if fields is None:
+            result = NO_REPLY
+        elif isinstance(fields, str):
+            # io stopped before reply arrived
+            result = fields
+        elif COMMAND_REPLIES.get(command_id, 'command') == 'command':
+            result = REPLY_TABLE.get(fields['result'], 'error: unknown response')
+        else:
+            result = REPLY_TABLE[0]
         self._log(f'result of command {result}')
         return result
 
-    def _parse_carafe_or_cups_status(self, message):
+    def _parse_carafe_or_cups_status(self, name, fields):
         """Parse arrived carafe defect or one cup mode status. Executed on main thread."""
-        try:
-            a = array('B', message)
-            if a[0] == RESPONSE_ID_CARAFE:
-                self.carafe_detection = not (a[1] != 0)
-                self._log(f'Carafe detection is {self.carafe_detection}')
-            elif a[0] == RESPONSE_ID_MODE:       
-                self.one_cup_mode = a[1] != 0
-                self._log(f'One cups mode is {self.one_cup_mode}')
-            else:
-                self._log('Arrived message is not a carafe defect or one cup mode response - return')
-        except Exception:
-            return
-
-    def _parse_defaults(self, message):
+        if name == 'carafe':
+            self._answered_at[RESPONSE_ID_CARAFE] = time.monotonic()
+            self._observe('carafe_detection', not (fields['value'] != 0))
+            self._log(f'Carafe detection is {self.carafe_detection}')
+        elif name == 'mode':
+            self._answered_at[RESPONSE_ID_MODE] = time.monotonic()
+            self._observe('one_cup_mode', fields['value'] != 0)
+            self._log(f'One cups mode is {self.one_cup_mode}')
+
+    def _parse_defaults(self, fields):
         """Parse read defaults. Executed on main thread."""
-        try:
-            a = array('B', message)
-            if a[0] != RESPONSE_DEFAULTS:
-                self._log('Arrived message is not a defaults response - return')
-                return
-            
-            cups = a[1]
-            strength = a[2]
-            beans = a[3]
-            hot_plate_time = a[4]
-            self._log(f'arrived defaults - cups {cups}, strength {strength}, use beans {beans}, hot plate time {hot_plate_time}')
-            self.hot_plate_time = hot_plate_time
-        except Exception:
-            return
-
-    def _parse(self, message):
-        """Parse status response. Executed on main thread."""
-        try:
-            a = array('B', message)
-            hex_string = ''
-            for n in a:
-                hex_string += ' ' + hex(n)
-            self._log('arrived message: {}'.format(hex_string))
-
-            if a[0] != RESPONSE_ID_STATUS:
-                self._log('Arrived message is not a status message - return')
-                return
-
-            status = a[1]
-            water_level = a[2]
-            wifi_strength = a[3]
-            strength = a[4]
-            cups = a[5]
-        except Exception as ex:
-            self._log(f'Exception during parse {ex}')
-            return
+        self._log(f'arrived defaults - cups {fields["cups"]}, strength {fields["strength"]}, '
+                  f'use beans {fields["beans"]}, hot plate time {fields["hot_plate_time"]}')
+        self.hot_plate_time = fields['hot_plate_time']
+
+    def _parse(self, fields):
+        """Parse decoded status response. Executed on main thread."""
+        self._log(f'arrived status: {fields}')
+        status = fields['status']
+        water_level = fields['water_level']
+        wifi_strength = fields['wifi_strength']
+        strength = fields['strength']
+        cups = fields['cups']
 
         def is_set(x, n):
             return x & 2**n != 0
 
-        self.use_beans = is_set(status, 1)
+        self._observe('use_beans', is_set(status, 1))
         ready_hot_plate = is_set(status, 5) # set when hot plate turned off after being heating
         ready = is_set(status, 2)
         heater_on = is_set(status, 4)
         grinder_on = is_set(status, 3)
         # timer_event = is_set(status, 7)
         self.carafe = is_set(status, 0)
-        self.hot_plate = is_set(status, 6)
+        hot_plate = is_set(status, 6)
+        self._observe('hot_plate', hot_plate)
 
+        state = self._device_value('state')
         if ready or ready_hot_plate:
             if ready:
                 self._log(f'state_ready is on')
             if ready_hot_plate:
                 self._log(f'ready_hot_plate is on')
-            self.state = 'ready'
-        if self.hot_plate:
+            state = 'ready'
+        if hot_plate:
             self._log(f'hot_plate is on - state is heating plate')
-            self.state = 'heating plate'
+            state = 'heating plate'
         if heater_on:
-            self.state = 'brewing'
+            state = 'brewing'
         if grinder_on:
-            self.state = 'grinding'
+            state = 'grinding'
+        self._observe('state', state)
 
         self._log(f'new state is {self.state}')
 
@@ -600,12 +1058,26 @@ class SmarterCoffeeController:
             self.enoughwater = False
         
         self.wifi_Strength = wifi_strength
-        self.cups = cups % 16
+        self._observe('cups', cups % 16)
 
         try:
-            self.strength = strength_message_types[strength]
+            self._observe('strength', strength_message_types[strength])
         except Exception:
-            self.strength = 'strong'
+            self._observe('strength', 'strong')
+
+        self.status_history.append(state=self._device_value('state'),
+            water_level=self.water_level, cups=self._device_value('cups'),
+            strength=self._device_value('strength'),
+            hot_plate=self._device_value('hot_plate'), carafe=self.carafe,
+            use_beans=self._device_value('use_beans'), enoughwater=self.enoughwater)
+
+        events = self.brew_sessions.update(state=self._device_value('state'),
+            cups=self._device_value('cups'), strength=self._device_value('strength'),
+            use_beans=self._device_value('use_beans'), water_level=self.water_level)
+        for event_type, data in events:
+            self._log(f'brew session event {event_type}: {data}')
+            if self._event_handler is not None:
+                self._event_handler(self, event_type, data)
 
     def _constrained(self, value, min, max, default):
         constrained_value = default
@@ -627,32 +1099,4 @@ class SmarterCoffeeController:
                          self.strength)
 
 
-# print('\n\n\n=================\n')
-# print('Start brew engine')
-
-
-# def on_state_update(coffeemaker):
-#     print('state updated: {}'.format(coffeemaker))
-
-# loop = asyncio.get_event_loop()
-# coffee_maker = None
-# try:
-#     coffee_maker = SmarterCoffeeController(ip_address='192.168.1.88', loop=loop)
-#     # connected = await coffee_maker.connect()
-#     future = asyncio.ensure_future(coffee_maker.connect())
-#     # print('connected: {}'.format(future.result()))    
-    
-#     coffee_maker.start_monitoring(on_state_update)
-#     streight = asyncio.ensure_future(coffee_maker.set_strength(0))
-#     # loop.call_later(2, coffee_maker.set_strength(0))
-
-#     loop.run_forever()
-# except KeyboardInterrupt:
-#     pass
-# finally:
-#     print('finally')
-#     coffee_maker.stop_monitoring()
-#     # future = asyncio.ensure_future(coffee_maker.disconnect())
-#     # loop.run_until_complete(future)
-# # Close the server
-# loop.close()
+# command line tool is in __main__.py: python -m custom_components.smartercoffee --help
@@ -4,28 +4,133 @@
 # Copyright: 2019-2021 Sergiy Maysak. All rights reserved.
 
 import asyncio
-from array import array
+import errno
 import socket
 import struct
 import collections
+import ipaddress
 import re
 
+from .smartercodec import FRAMES, decode, split_frames
+
 BROADCAST_ADDR = '255.255.255.255'
 PORT = 2081
 DEVICE_TYPE_KETTLE = 0x1
 DEVICE_TYPE_COFFEEMAKER = 0x2
 
+# linux ioctl requests and interface flags used to enumerate IPv4 interfaces
+SIOCGIFFLAGS = 0x8913
+SIOCGIFADDR = 0x8915
+SIOCGIFNETMASK = 0x891b
+IFF_UP = 0x1
+IFF_BROADCAST = 0x2
+IFF_LOOPBACK = 0x8
+
+# errors meaning endpoint can never broadcast, others may be transient (icmp replies, buffers)
+FATAL_ENDPOINT_ERRNOS = (errno.EACCES, errno.EADDRNOTAVAIL, errno.ENODEV, errno.EINVAL)
+# endpoint stops broadcasting after that many errors in a row
+MAX_ENDPOINT_ERRORS = 3
+
 HostInfo = collections.namedtuple('HostInfo', 'ip_address, port')
-DeviceInfo = collections.namedtuple('DeviceInfo', 'device_type, fw_version, host_info, mac_address')
+# interface is InterfaceInfo reply arrived on, None if found by limited broadcast only
+DeviceInfo = collections.namedtuple('DeviceInfo',
+    'device_type, fw_version, host_info, mac_address, interface', defaults=(None,))
+InterfaceInfo = collections.namedtuple('InterfaceInfo', 'name, address, broadcast')
 
-class SmarterDiscoveryProtocol:
-    def __init__(self, loop, broadcast_addr, on_device_found):
+
+def local_interfaces() -> list[InterfaceInfo]:
+    """
+    Up, broadcast capable IPv4 interfaces with their primary address.
+    Empty list where interfaces can not be enumerated (non linux hosts).
+    """
+    try:
+        import fcntl
+    except ImportError:
+        return []
+
+    interfaces = []
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        for _, name in socket.if_nameindex():
+            request = struct.pack('256s', name.encode()[:15])
+            try:
+                flags = struct.unpack('H', fcntl.ioctl(sock.fileno(), SIOCGIFFLAGS, request)[16:18])[0]
+                if not flags & IFF_UP or not flags & IFF_BROADCAST or flags & IFF_LOOPBACK:
+                    continue
+                address = socket.inet_ntoa(fcntl.ioctl(sock.fileno(), SIOCGIFADDR, request)[20:24])
+                netmask = socket.inet_ntoa(fcntl.ioctl(sock.fileno(), SIOCGIFNETMASK, request)[20:24])
+            except OSError:
+                # interface without IPv4 address
+                continue
+            network = ipaddress.IPv4Network(f'{address}/{netmask}', strict=False)
+            interfaces.append(InterfaceInfo(name, address, str(network.broadcast_address)))
+    return interfaces
+
+
+class _DiscoveryResults:
+    """Devices found by all discovery endpoints, merged by ip address."""
+
+    def __init__(self, loop, on_device_found):
         self.on_device_found = on_device_found
+        self.devices = {}
+        self.endpoints = 0
+        self._failed = set()
+        self._loop = loop
+        self._lookups = []
+        self._report_handle = None
+
+    def add(self, addr, discovery_info, interface, fetch_mac_address):
+        found = self.devices.get(addr[0])
+        if found is not None:
+            # prefer interface tagged reply over limited broadcast one
+            if found.interface is None and interface is not None:
+                self.devices[addr[0]] = found._replace(interface=interface)
+            return
+
+        self.devices[addr[0]] = DeviceInfo(device_type=discovery_info[0],
+            fw_version=discovery_info[1], host_info=HostInfo(ip_address=addr[0], port=addr[1]),
+            mac_address=None, interface=interface)
+        self._lookups.append(asyncio.ensure_future(
+            self._add_mac_address(addr[0], fetch_mac_address), loop=self._loop))
+        # if at least one device found - let discovery work for more 1 sec
+        # and report results via Future object
+        if self._report_handle is None:
+            self._report_handle = self._loop.call_later(1, self._report)
+
+    async def _add_mac_address(self, ip_address, fetch_mac_address):
+        try:
+            mac = await fetch_mac_address(ip_address)
+        except Exception:
+            mac = ""
+        self.devices[ip_address] = self.devices[ip_address]._replace(mac_address=mac)
+
+    def _report(self):
+        async def _report_when_complete():
+            await asyncio.gather(*self._lookups, return_exceptions=True)
+            if not self.on_device_found.done():
+                self.on_device_found.set_result(list(self.devices.values()))
+        asyncio.ensure_future(_report_when_complete(), loop=self._loop)
+
+    def endpoint_failed(self, protocol, exc):
+        self._failed.add(protocol)
+        if len(self._failed) >= self.endpoints and not self.on_device_found.done():
+            self.on_device_found.set_exception(exc)
+
+    def cancel(self):
+        if self._report_handle is not None:
+            self._report_handle.cancel()
+        for lookup in self._lookups:
+            lookup.cancel()
+
+
+class SmarterDiscoveryProtocol:
+    def __init__(self, loop, broadcast_addr, results, interface=None):
+        self.results = results
+        self.interface = interface
         self.transport = None
         self.broadcast_addr = broadcast_addr
-        self.devices_found = []
         self._loop = loop
         self.next_broadcast_handle = None
+        self.errors = 0
 
     def connection_made(self, transport):
         self.transport = transport
@@ -46,8 +151,7 @@ class SmarterDiscoveryProtocol:
         
     def _broadcast(self):
         # print('Broadcast...')
-        command = bytearray([0x64, 0x7e])
-        self.transport.sendto(command, (self.broadcast_addr, PORT))
+        self.transport.sendto(FRAMES['discover'], (self.broadcast_addr, PORT))
 
         #repeat every 10 seconds
         self.next_broadcast_handle = self._loop.call_later(10, self._broadcast)
@@ -61,10 +165,11 @@ class SmarterDiscoveryProtocol:
             return hex_string
 
         print(f"Received: {as_hex(data)} from: {addr}")
+        self.errors = 0
 
         info = self._parse_data(data)
         if info is not None:
-            asyncio.ensure_future(self._add_device(addr, info), loop=self._loop)
+            self.results.add(addr, info, self.interface, self._fetch_mac_address)
         else:
             print("Continue looking for device...")
 
@@ -92,26 +197,17 @@ class SmarterDiscoveryProtocol:
 
         return result.group(0) if result else None
 
-    async def _add_device(self, addr, discovery_info):
-        host_info = HostInfo(ip_address=addr[0], port=addr[1])
-        try:
-            mac = await self._fetch_mac_address(host_info.ip_address)
-        except Exception as e:
-            mac = ""
-        deviceInfo = DeviceInfo(device_type=discovery_info[0], fw_version=discovery_info[1], 
-            host_info=host_info, mac_address = mac)
-
-        self.devices_found.append(deviceInfo)
-        # if at least one device found - let discovery work for more 1 sec
-        # and report results via Future object
-        self._loop.call_later(1, self._report_results)
-
     def error_received(self, exc):
-        print('Error received:', exc)
+        print(f'Error received on {self.broadcast_addr}:', exc)
+        self.errors += 1
+        if exc.errno not in FATAL_ENDPOINT_ERRNOS and self.errors < MAX_ENDPOINT_ERRORS:
+            # next broadcast is scheduled already
+            return
         if self.next_broadcast_handle is not None:
             self.next_broadcast_handle.cancel()
             self.next_broadcast_handle = None
-        self.on_device_found.set_exception(exc)
+        # other interfaces may still answer - fail only when no one broadcasts anymore
+        self.results.endpoint_failed(self, exc)
 
     def connection_lost(self, exc):
         # print("UDP connection closed")
@@ -121,60 +217,70 @@ class SmarterDiscoveryProtocol:
     
     def _parse_data(self, data):
         try:
-            message = array('B', data)
             # '0x65 type version 0x7e'
-            if message[0] != 0x65:
-                raise BaseException
+            name, fields = decode(split_frames(data)[0])
+            if name != 'discovery':
+                raise ValueError(f'unexpected {name} message')
             
-            type = message[1]
-            fw_version = message[2]
-            return (type, fw_version)
+            return (fields['device_type'], fields['fw_version'])
         except Exception as e:
             print(f'failed to parse arrived data with {e}')
         
         return None
-    
-    def _report_results(self):
-        if self.next_broadcast_handle is not None:
-            self.next_broadcast_handle.cancel()
-            self.next_broadcast_handle = None
-        if self.on_device_found.done() is not True:
-            self.on_device_found.set_result(self.devices_found)
+
 
 class SmarterDiscovery:
     def __init__(self, loop=None):
         self._loop = loop if loop is not None else asyncio.get_event_loop()
 
-    async def find(self):
-        """Discover Smarter Coffee / iKettle devices in local network."""
-        
+    async def find(self, interfaces=None):
+        """
+        Discover Smarter Coffee / iKettle devices in local network.
+        Broadcasts to 255.255.255.255 and concurrently to subnet broadcast address
+        of every interface (local_interfaces() if interfaces is None).
+        """
         on_found = self._loop.create_future()
-        
-        addrinfo = socket.getaddrinfo(BROADCAST_ADDR, None)[0]
-        sock = socket.socket(addrinfo[0], socket.SOCK_DGRAM)
-        (transport, _) = await self._loop.create_datagram_endpoint(
-            lambda: SmarterDiscoveryProtocol(self._loop, BROADCAST_ADDR, on_found),
-            sock=sock)
+        results = _DiscoveryResults(self._loop, on_found)
+        if interfaces is None:
+            interfaces = await self._loop.run_in_executor(None, local_interfaces)
 
-        devices = None
+        transports = []
         try:
-            devices = await on_found
+            endpoints = [(BROADCAST_ADDR, None)] + [(interface.broadcast, interface)
+                                                    for interface in interfaces]
+            # counted up front - first broadcast may fail before other endpoints are open
+            results.endpoints = len(endpoints)
+            # opened concurrently - slow interface does not delay the others
+            opened = await asyncio.gather(*[self._open_endpoint(broadcast_addr, interface, results)
+                                            for broadcast_addr, interface in endpoints],
+                                          return_exceptions=True)
+            transports.extend(outcome for outcome in opened if not isinstance(outcome, BaseException))
+            for (broadcast_addr, interface), outcome in zip(endpoints, opened):
+                if isinstance(outcome, OSError):
+                    print(f'Failed to broadcast on {interface or broadcast_addr}: {outcome}')
+                    results.endpoint_failed((broadcast_addr, interface), outcome)
+                elif isinstance(outcome, BaseException):
+                    raise outcome
+            # fails with error of the last endpoint if none of them works
+            return await on_found
         finally:
-            transport.close()
-        return devices
+            results.cancel()
+            for transport in transports:
+                transport.close()
 
-# async def main():
-#     loop = asyncio.get_running_loop()
-    
-#     try:
-#         where_is_my_coffee = SmarterDiscovery(loop=loop)
-#         # devices = await asyncio.wait_for(coffee_finder.find(), timeout=30.0)
-#         devices = await where_is_my_coffee.find()
-#         print(f'Found SmarterCoffee at: {devices}')
-
-#         # mac = await fetch_mac_address('192.168.1.88')
-#         # print(f'mac address: {mac}')
-#     except Exception as e:
-#         print(f'failed to find coffee {e}')
-
-# asyncio.run(main())
+    async def _open_endpoint(self, broadcast_addr, interface, results):
+        addrinfo = socket.getaddrinfo(broadcast_addr, None)[0]
+        sock = socket.socket(addrinfo[0], socket.SOCK_DGRAM)
+        try:
+            if interface is not None:
+                # replies come back to the interface address discovery was sent from
+                sock.bind((interface.address, 0))
+            (transport, _) = await self._loop.create_datagram_endpoint(
+                lambda: SmarterDiscoveryProtocol(self._loop, broadcast_addr, results, interface),
+                sock=sock)
+        except OSError:
+            sock.close()
+            raise
+        return transport
+
+# command line tool is in __main__.py: python -m custom_components.smartercoffee discover
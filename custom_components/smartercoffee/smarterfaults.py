@@ -0,0 +1,251 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Author Identity: Sergiy Maysak
+# Copyright: 2019-2023 Sergiy Maysak. All rights reserved.
+
+"""
+Fault injection around controller connection streams for resilience testing:
+SmarterCoffeeController(..., transport=FaultInjector(latency=0.1, transport=TcpTransport()))
+run_chaos() drives controller against local stand-in through injected faults.
+"""
+
+import asyncio
+import collections
+import random
+import threading
+
+from .smartercodec import COMMAND_SUFFIX
+from .smartercontroller import SmarterCoffeeController
+from .smarterstandin import SmarterCoffeeStandIn
+from .smartertransport import TcpTransport, MemoryTransport
+
+# bytes of garbage injected at once
+MAX_GARBAGE = 8
+
+# FaultInjector arguments of scenarios run by chaos command and tests
+CHAOS_SCENARIOS = {
+    'baseline': {},
+    'latency': {'latency': 0.05, 'jitter': 0.05},
+    'fragments': {'fragment': 0.5},
+    'merged': {'merge': 0.5},
+    'garbage': {'garbage': 0.3},
+    'drop': {'drop_after': 1.0},
+    'half_open': {'half_open_after': 1.0},
+}
+
+# seconds between commands sent by run_chaos
+CHAOS_COMMAND_INTERVAL = 0.1
+
+# outcome of run_chaos: recovery times are seconds since injected failure,
+# command_recovery is None if no command failed, available_again if monitor never reconnected
+ChaosResult = collections.namedtuple('ChaosResult', 'commands_ok, commands_failed, '
+    'failed_at, command_recovery, available_again, connections, leaked_tasks, leaked_threads, '
+    'faults')
+
+
+async def run_chaos(faults, duration=5.0, read_timeout=1.0, reconnect_delay=0.5,
+                    status_interval=0.1, seed=None, memory=True, logger=None) -> ChaosResult:
+    """
+    Send a command every CHAOS_COMMAND_INTERVAL to local stand-in through
+    FaultInjector(**faults) for duration seconds, over in-memory pipe or TCP.
+    Command recovery is measured from failure to the first success after
+    a failed or timed out command.
+    """
+    loop = asyncio.get_running_loop()
+    standin = SmarterCoffeeStandIn(status_interval=status_interval)
+    if memory:
+        port, transport = standin.port, MemoryTransport(standin.serve)
+    else:
+        port, transport = await standin.start(), TcpTransport()
+    injector = FaultInjector(seed=seed, transport=transport, **faults)
+    tasks_before = len(asyncio.all_tasks())
+
+    controller = SmarterCoffeeController(ip_address=standin.host, port=port, loop=loop,
+        logger=logger, transport=injector)
+    controller.read_timeout = read_timeout
+    controller.reconnect_delay = reconnect_delay
+    available_again = None
+    went_unavailable = False
+
+    def _state_changed(maker):
+        nonlocal available_again, went_unavailable
+        if not maker.available:
+            went_unavailable = True
+        elif went_unavailable and available_again is None and injector.failed_at is not None:
+            available_again = loop.time() - injector.failed_at
+
+    controller.start_monitoring(_state_changed)
+
+    ok = 0
+    failed = 0
+    recovery = None
+    failed_since_fault = False
+    deadline = loop.time() + duration
+    try:
+        cups = 1
+        while loop.time() < deadline:
+            cups = cups % 12 + 1
+            try:
+                result = await asyncio.wait_for(controller.set_cups(cups), timeout=read_timeout)
+            except asyncio.TimeoutError:
+                result = 'error: timeout'
+            if result == 'ok':
+                ok += 1
+                if failed_since_fault and recovery is None:
+                    recovery = loop.time() - injector.failed_at
+            else:
+                failed += 1
+                # commands in flight when fault hit may still succeed - they do not show recovery
+                failed_since_fault = injector.failed_at is not None
+            await asyncio.sleep(CHAOS_COMMAND_INTERVAL)
+    finally:
+        await controller.stop_monitoring()
+        await standin.stop()
+
+    # let closed transports run their callbacks
+    await asyncio.sleep(0.1)
+    return ChaosResult(commands_ok=ok, commands_failed=failed, failed_at=injector.failed_at,
+        command_recovery=recovery, available_again=available_again,
+        connections=injector.connections,
+        leaked_tasks=len(asyncio.all_tasks()) - tasks_before,
+        leaked_threads=len([thread for thread in threading.enumerate()
+                            if thread.name.startswith('smartercoffee-io-')]),
+        faults={kind: count for kind, count in injector.stats.items() if count > 0})
+
+
+class FaultInjector:
+    """
+    Transport opening connections through other transport and injecting faults into them.
+    Probabilities are per read. drop_after and half_open_after (seconds since
+    connect) apply to the first connection only so recovery can be measured.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, fragment=0.0, merge=0.0, garbage=0.0,
+                 drop_after=None, half_open_after=None, seed=None,
+                 transport=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.fragment = fragment
+        self.merge = merge
+        self.garbage = garbage
+        self.drop_after = drop_after
+        self.half_open_after = half_open_after
+        self.connections = 0
+        # monotonic time of injected drop or half open connection
+        self.failed_at = None
+        self.stats = {'delayed': 0, 'fragmented': 0, 'merged': 0, 'garbage': 0,
+                      'dropped': 0, 'half_open': 0}
+        self._random = random.Random(seed)
+        self._transport = transport if transport is not None else TcpTransport()
+
+    async def open_connection(self, host, port):
+        reader, writer = await self._transport.open_connection(host=host, port=port)
+        self.connections += 1
+        first = self.connections == 1
+        connection = _FaultyConnection(self, reader, writer,
+            drop_after=self.drop_after if first else None,
+            half_open_after=self.half_open_after if first else None)
+        return connection.reader, connection.writer
+
+    def _chance(self, probability) -> bool:
+        return probability > 0 and self._random.random() < probability
+
+    def _failed(self, kind):
+        self.stats[kind] += 1
+        self.failed_at = asyncio.get_running_loop().time()
+
+
+class _FaultyConnection:
+    def __init__(self, injector, reader, writer, drop_after, half_open_after):
+        loop = asyncio.get_running_loop()
+        self.injector = injector
+        self.inner_reader = reader
+        self.inner_writer = writer
+        self.drop_at = loop.time() + drop_after if drop_after is not None else None
+        self.half_open_at = loop.time() + half_open_after if half_open_after is not None else None
+        self.half_open = False
+        self.pending = b''
+        self.reader = FaultyStreamReader(self)
+        self.writer = FaultyStreamWriter(self)
+
+    def _due(self, deadline) -> bool:
+        return deadline is not None and asyncio.get_running_loop().time() >= deadline
+
+    async def read(self, n):
+        injector = self.injector
+        if len(self.pending) > 0:
+            data, self.pending = self.pending[:n], self.pending[n:]
+            return data
+
+        if self._due(self.half_open_at) and not self.half_open:
+            self.half_open = True
+            injector._failed('half_open')
+        if self.half_open:
+            # peer vanished without closing - nothing arrives ever again
+            await asyncio.Event().wait()
+
+        if self._due(self.drop_at):
+            self.drop_at = None
+            injector._failed('dropped')
+            self.inner_writer.close()
+            raise ConnectionResetError('connection dropped by fault injector')
+
+        data = await self.inner_reader.read(n)
+        if len(data) == 0:
+            return data
+
+        if injector._chance(injector.merge):
+            try:
+                data += await asyncio.wait_for(self.inner_reader.read(n), timeout=0.05)
+                injector.stats['merged'] += 1
+            except asyncio.TimeoutError:
+                pass
+
+        if injector._chance(injector.garbage):
+            garbage = bytes(injector._random.randrange(256)
+                            for _ in range(injector._random.randint(1, MAX_GARBAGE)))
+            data = garbage + bytes([COMMAND_SUFFIX]) + data
+            injector.stats['garbage'] += 1
+
+        if len(data) > 1 and injector._chance(injector.fragment):
+            cut = injector._random.randint(1, len(data) - 1)
+            data, self.pending = data[:cut], data[cut:]
+            injector.stats['fragmented'] += 1
+
+        if injector.latency > 0 or injector.jitter > 0:
+            await asyncio.sleep(injector.latency + injector._random.uniform(0, injector.jitter))
+            injector.stats['delayed'] += 1
+        return data
+
+
+class FaultyStreamReader:
+    def __init__(self, connection):
+        self._connection = connection
+
+    async def read(self, n=-1):
+        return await self._connection.read(n if n > 0 else 64)
+
+
+class FaultyStreamWriter:
+    def __init__(self, connection):
+        self._connection = connection
+
+    def write(self, data):
+        # writes into half open connection are silently lost
+        if not self._connection.half_open:
+            self._connection.inner_writer.write(data)
+
+    async def drain(self):
+        injector = self._connection.injector
+        if injector.latency > 0 or injector.jitter > 0:
+            await asyncio.sleep(injector.latency + injector._random.uniform(0, injector.jitter))
+        await self._connection.inner_writer.drain()
+
+    def close(self):
+        self._connection.inner_writer.close()
+
+    def is_closing(self) -> bool:
+        return self._connection.inner_writer.is_closing()
+
+    async def wait_closed(self):
+        await self._connection.inner_writer.wait_closed()
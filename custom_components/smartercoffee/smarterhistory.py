@@ -0,0 +1,108 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Author Identity: Sergiy Maysak
+# Copyright: 2019-2023 Sergiy Maysak. All rights reserved.
+
+"""Fixed size in-memory history of decoded SmarterCoffee statuses."""
+
+from array import array
+import time
+
+HISTORY_STATES = ('unknown', 'ready', 'heating plate', 'brewing', 'grinding')
+
+HISTORY_WATER_LEVELS = ('empty', 'low', 'half', 'full')
+
+HISTORY_STRENGTHS = ('weak', 'medium', 'strong')
+
+# hot_plate, carafe, use_beans and enoughwater packed into single byte
+_FLAG_HOT_PLATE = 0x1
+_FLAG_CARAFE = 0x2
+_FLAG_USE_BEANS = 0x4
+_FLAG_ENOUGH_WATER = 0x8
+
+
+def _index(table, value):
+    try:
+        return table.index(value)
+    except ValueError:
+        return 0
+
+
+class StatusHistory:
+    """
+    Ring buffer of timestamped statuses backed by preallocated arrays.
+    Memory does not grow after construction - see bytes_size.
+    """
+
+    DEFAULT_CAPACITY = 2048
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, clock=time.time):
+        self._capacity = capacity
+        self._clock = clock
+        self._timestamps = array('d', [0.0]) * capacity
+        self._states = array('B', [0]) * capacity
+        self._water_levels = array('B', [0]) * capacity
+        self._cups = array('B', [0]) * capacity
+        self._strengths = array('B', [0]) * capacity
+        self._flags = array('B', [0]) * capacity
+        self._next = 0
+        self._count = 0
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @property
+    def bytes_size(self) -> int:
+        """Memory used by records storage."""
+        return self._capacity * (self._timestamps.itemsize + 5)
+
+    def __len__(self):
+        return self._count
+
+    def append(self, state, water_level, cups, strength,
+               hot_plate, carafe, use_beans, enoughwater):
+        """Store status unless it equals the latest stored one."""
+        flags = ((_FLAG_HOT_PLATE if hot_plate else 0)
+                 | (_FLAG_CARAFE if carafe else 0)
+                 | (_FLAG_USE_BEANS if use_beans else 0)
+                 | (_FLAG_ENOUGH_WATER if enoughwater else 0))
+        record = (_index(HISTORY_STATES, state), _index(HISTORY_WATER_LEVELS, water_level),
+                  cups, _index(HISTORY_STRENGTHS, strength), flags)
+
+        if self._count > 0:
+            last = (self._next - 1) % self._capacity
+            if record == (self._states[last], self._water_levels[last], self._cups[last],
+                          self._strengths[last], self._flags[last]):
+                return False
+
+        i = self._next
+        self._timestamps[i] = self._clock()
+        (self._states[i], self._water_levels[i], self._cups[i],
+         self._strengths[i], self._flags[i]) = record
+        self._next = (i + 1) % self._capacity
+        self._count = min(self._count + 1, self._capacity)
+        return True
+
+    def records(self, since=None) -> list[dict]:
+        """Decoded records from oldest to newest, optionally newer than since timestamp."""
+        result = []
+        start = (self._next - self._count) % self._capacity
+        for n in range(self._count):
+            i = (start + n) % self._capacity
+            timestamp = self._timestamps[i]
+            if since is not None and timestamp <= since:
+                continue
+            flags = self._flags[i]
+            result.append({
+                'timestamp': timestamp,
+                'state': HISTORY_STATES[self._states[i]],
+                'water_level': HISTORY_WATER_LEVELS[self._water_levels[i]],
+                'cups': self._cups[i],
+                'strength': HISTORY_STRENGTHS[self._strengths[i]],
+                'hot_plate': flags & _FLAG_HOT_PLATE != 0,
+                'carafe': flags & _FLAG_CARAFE != 0,
+                'use_beans': flags & _FLAG_USE_BEANS != 0,
+                'enoughwater': flags & _FLAG_ENOUGH_WATER != 0,
+            })
+        return result
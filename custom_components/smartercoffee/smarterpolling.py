@@ -0,0 +1,75 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Author Identity: Sergiy Maysak
+# Copyright: 2019-2023 Sergiy Maysak. All rights reserved.
+
+"""Fleet wide scheduler of carafe detection and mode queries."""
+
+import asyncio
+import heapq
+import itertools
+import time
+
+from .smartercontroller import COMMAND_GET_CARAFE_REQUIRED, COMMAND_GET_MODE
+
+
+class SmarterPollingScheduler:
+    """
+    Polls makers for state which device does not report by itself.
+    Each maker is polled once per POLL_INTERVAL, at most MAX_POLLS_PER_TICK
+    makers per tick, so polls of a big fleet are spread over time.
+    """
+
+    # seconds between polls of the same maker - avoids ddos of coffee machine
+    POLL_INTERVAL = 600
+    # answers younger than this make poll unnecessary
+    FRESH_ANSWER_AGE = POLL_INTERVAL / 2
+    # seconds between scheduler ticks
+    POLL_TICK = 15
+    MAX_POLLS_PER_TICK = 4
+    QUERIES = (COMMAND_GET_CARAFE_REQUIRED, COMMAND_GET_MODE)
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._apis = {}
+        self._due = []
+        # sequence number of the only valid heap entry per maker
+        self._scheduled = {}
+        self._seq = itertools.count()
+
+    def add(self, key, api):
+        """Start polling controller - first poll happens on next tick."""
+        self._apis[key] = api
+        self._schedule(key, self._clock())
+
+    def remove(self, key):
+        self._apis.pop(key, None)
+        self._scheduled.pop(key, None)
+
+    def _schedule(self, key, due):
+        seq = next(self._seq)
+        self._scheduled[key] = seq
+        heapq.heappush(self._due, (due, seq, key))
+
+    async def async_tick(self) -> int:
+        """Poll makers which are due. Return amount of queries sent."""
+        now = self._clock()
+        polled = 0
+        queries = []
+        while self._due and self._due[0][0] <= now and polled < self.MAX_POLLS_PER_TICK:
+            _, seq, key = heapq.heappop(self._due)
+            if self._scheduled.get(key) != seq:
+                continue
+
+            api = self._apis[key]
+            polled += 1
+            self._schedule(key, now + self.POLL_INTERVAL)
+            if not api.available:
+                continue
+            for command_id in self.QUERIES:
+                # skip if answer is fresh enough or same query is still in flight
+                if api.query_needed(command_id, self.FRESH_ANSWER_AGE):
+                    queries.append(api.query(command_id))
+        # queries wait for replies - let makers answer concurrently
+        await asyncio.gather(*queries, return_exceptions=True)
+        return len(queries)
@@ -0,0 +1,161 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Author Identity: Sergiy Maysak
+# Copyright: 2019-2023 Sergiy Maysak. All rights reserved.
+
+"""Load balanced brewing on a pool of makers."""
+
+import asyncio
+import collections
+import time
+
+BUSY_STATES = ('brewing', 'boiling', 'grinding')
+
+# prefer makers with more water left so the next brew does not run dry
+WATER_LEVEL_RANK = {'full': 3, 'half': 2, 'low': 1, 'empty': 0}
+
+# seconds maker stays claimed after accepted brew until its status reports brewing
+CLAIM_HOLD = 10.0
+
+# amount of recent queue waits kept for stats
+WAIT_HISTORY = 100
+
+
+def brew_rank(api):
+    """Return rank of maker for brewing, higher is better, None if it can not brew now."""
+    # restored state may look ready - maker has to report since restart first
+    if not api.available or api.stale or api.state in BUSY_STATES or not api.enoughwater:
+        return None
+    if api.carafe_detection and not api.carafe:
+        return None
+    return (api.carafe, api.state == 'ready', WATER_LEVEL_RANK.get(api.water_level, 0))
+
+
+class _PoolRequest:
+    __slots__ = ('future', 'candidates', 'started')
+
+    def __init__(self, future, candidates, started):
+        self.future = future
+        self.candidates = candidates
+        self.started = started
+
+
+class BrewPool:
+    """
+    Hands brew requests to the best maker able to brew. Requests wait in FIFO
+    queue while no maker can brew and are served on notify() once makers
+    report new state. Claimed maker is not handed out again until brew command
+    is released and device reports brewing. Used on main loop only.
+    """
+
+    def __init__(self, makers, clock=time.monotonic):
+        """makers() returns controllers of the pool."""
+        self._makers = makers
+        self._clock = clock
+        self._requests = collections.deque()
+        # mac address: None while brew command runs, timer of claim hold afterwards
+        self._claimed = {}
+        # mac address: clock of last hand out - idle the longest wins a tie
+        self._handed_at = {}
+        self._waits = collections.deque(maxlen=WAIT_HISTORY)
+        self.served = 0
+        self.timed_out = 0
+
+    async def acquire(self, candidates=None):
+        """
+        Claim the best maker and return (controller, seconds waited in queue).
+        candidates limits pool to makers with these mac addresses.
+        Cancel caller to stop waiting.
+        """
+        started = self._clock()
+        candidates = set(candidates) if candidates is not None else None
+        if len(self._requests) == 0:
+            api = self._best(candidates)
+            if api is not None:
+                return self._hand_out(api, started)
+
+        request = _PoolRequest(asyncio.get_running_loop().create_future(), candidates, started)
+        self._requests.append(request)
+        # earlier requests pick first, a maker none of them can use goes to this one
+        self.notify()
+        try:
+            return await request.future
+        except asyncio.CancelledError:
+            if request.future.done() and not request.future.cancelled():
+                # maker was handed out after caller gave up
+                self.release(request.future.result()[0], brewing=False)
+            else:
+                self.timed_out += 1
+            raise
+        finally:
+            if request in self._requests:
+                self._requests.remove(request)
+
+    def release(self, api, brewing):
+        """Return claimed maker after brew command, keep it claimed a while if brew started."""
+        mac_address = api.mac_address
+        timer = self._claimed.pop(mac_address, None)
+        if timer is not None:
+            timer.cancel()
+        if brewing:
+            self._claimed[mac_address] = asyncio.get_running_loop().call_later(CLAIM_HOLD,
+                self._hold_expired, mac_address)
+        self.notify()
+
+    def notify(self):
+        """Serve waiting requests with makers able to brew now. Call on maker state changes."""
+        for api in self._makers():
+            # device confirmed brewing - state keeps maker out of the pool from now
+            timer = self._claimed.get(api.mac_address)
+            if timer is not None and api.state in BUSY_STATES:
+                timer.cancel()
+                del self._claimed[api.mac_address]
+
+        for request in list(self._requests):
+            if request.future.done():
+                self._requests.remove(request)
+                continue
+            api = self._best(request.candidates)
+            if api is None:
+                continue
+            self._requests.remove(request)
+            request.future.set_result(self._hand_out(api, request.started))
+
+    def stats(self) -> dict:
+        waits = list(self._waits)
+        return {
+            'waiting': len(self._requests),
+            'claimed': sorted(self._claimed),
+            'served': self.served,
+            'timed_out': self.timed_out,
+            'mean_wait': sum(waits) / len(waits) if len(waits) > 0 else 0.0,
+            'max_wait': max(waits, default=0.0),
+        }
+
+    def _best(self, candidates):
+        best, best_rank = None, None
+        for api in self._makers():
+            mac_address = api.mac_address
+            if mac_address in self._claimed:
+                continue
+            if candidates is not None and mac_address not in candidates:
+                continue
+            rank = brew_rank(api)
+            if rank is None:
+                continue
+            rank = rank + (-self._handed_at.get(mac_address, float('-inf')),)
+            if best_rank is None or rank > best_rank:
+                best, best_rank = api, rank
+        return best
+
+    def _hand_out(self, api, started):
+        now = self._clock()
+        self._claimed[api.mac_address] = None
+        self._handed_at[api.mac_address] = now
+        self.served += 1
+        self._waits.append(now - started)
+        return api, now - started
+
+    def _hold_expired(self, mac_address):
+        self._claimed.pop(mac_address, None)
+        self.notify()
@@ -0,0 +1,159 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Author Identity: Sergiy Maysak
+# Copyright: 2019-2023 Sergiy Maysak. All rights reserved.
+
+"""Timer based brew scheduling shared by all coffee makers."""
+
+import asyncio
+import heapq
+import time
+import uuid
+
+# schedules overdue for longer than this (e.g. while HA was stopped) are dropped
+MISSED_GRACE_SECONDS = 300
+
+
+class ScheduledBrew:
+    __slots__ = ('schedule_id', 'mac_address', 'when', 'params')
+
+    def __init__(self, schedule_id, mac_address, when, params):
+        self.schedule_id = schedule_id
+        self.mac_address = mac_address
+        self.when = when
+        self.params = params
+
+    def as_dict(self):
+        return {
+            'schedule_id': self.schedule_id,
+            'mac_address': self.mac_address,
+            'when': self.when,
+            'params': dict(self.params),
+        }
+
+    def __repr__(self):
+        return f'ScheduledBrew({self.schedule_id}, {self.mac_address}, at {self.when})'
+
+
+class BrewScheduler:
+    """
+    Min-heap of brew schedules of all makers with a single timer
+    armed for the earliest deadline only. Used on main loop only.
+    """
+
+    def __init__(self, loop, fire, on_change=None, clock=time.time):
+        """fire(scheduled_brew) coroutine is called when schedule is due."""
+        self._loop = loop
+        self._fire = fire
+        self._on_change = on_change
+        self._clock = clock
+        self._heap = []
+        self._schedules = {}
+        self._timer = None
+        self._timer_when = None
+        # ids of due schedules waiting for their maker to be known, by mac address
+        self._held = {}
+
+    def __len__(self):
+        return len(self._schedules)
+
+    @property
+    def schedules(self) -> list[ScheduledBrew]:
+        return sorted(self._schedules.values(), key=lambda entry: entry.when)
+
+    def add(self, mac_address, when, params, schedule_id=None) -> ScheduledBrew:
+        """Schedule brew on maker at unix timestamp when."""
+        entry = ScheduledBrew(schedule_id or uuid.uuid4().hex, mac_address, when, params)
+        self._schedules[entry.schedule_id] = entry
+        heapq.heappush(self._heap, (entry.when, entry.schedule_id))
+        self._arm()
+        self._changed()
+        return entry
+
+    def cancel(self, schedule_id) -> bool:
+        # heap entry is skipped lazily when it reaches the top
+        if self._schedules.pop(schedule_id, None) is None:
+            return False
+        self._changed()
+        return True
+
+    def cancel_maker(self, mac_address) -> int:
+        ids = [entry.schedule_id for entry in self._schedules.values()
+               if entry.mac_address == mac_address]
+        for schedule_id in ids:
+            self._schedules.pop(schedule_id)
+        if len(ids) > 0:
+            self._changed()
+        return len(ids)
+
+    def hold(self, entry):
+        """Keep due schedule until release() of its maker, e.g. not discovered yet after restart."""
+        self._schedules[entry.schedule_id] = entry
+        self._held.setdefault(entry.mac_address, []).append(entry.schedule_id)
+
+    def release(self, mac_address):
+        """Fire schedules held for maker which became known."""
+        for schedule_id in self._held.pop(mac_address, []):
+            entry = self._schedules.get(schedule_id)
+            # cancelled while held
+            if entry is not None:
+                heapq.heappush(self._heap, (entry.when, schedule_id))
+        self._arm()
+
+    def as_list(self) -> list[dict]:
+        return [entry.as_dict() for entry in self.schedules]
+
+    def load(self, items):
+        """Restore schedules stored by as_list, dropping long missed ones."""
+        now = self._clock()
+        for item in items or []:
+            if item['when'] < now - MISSED_GRACE_SECONDS:
+                continue
+            entry = ScheduledBrew(item['schedule_id'], item['mac_address'],
+                item['when'], item['params'])
+            self._schedules[entry.schedule_id] = entry
+            heapq.heappush(self._heap, (entry.when, entry.schedule_id))
+        self._arm()
+
+    def shutdown(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+            self._timer_when = None
+
+    def _changed(self):
+        if self._on_change is not None:
+            self._on_change()
+
+    def _arm(self):
+        """Keep single timer armed for the earliest live schedule."""
+        while self._heap and self._heap[0][1] not in self._schedules:
+            heapq.heappop(self._heap)
+        if not self._heap:
+            self.shutdown()
+            return
+
+        when = self._heap[0][0]
+        if self._timer is not None and self._timer_when <= when:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer_when = when
+        self._timer = self._loop.call_later(max(0.0, when - self._clock()), self._wakeup)
+
+    def _wakeup(self):
+        self._timer = None
+        self._timer_when = None
+        now = self._clock()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, schedule_id = heapq.heappop(self._heap)
+            entry = self._schedules.pop(schedule_id, None)
+            if entry is not None:
+                due.append(entry)
+
+        for entry in due:
+            asyncio.ensure_future(self._fire(entry), loop=self._loop)
+        if len(due) > 0:
+            self._changed()
+        self._arm()
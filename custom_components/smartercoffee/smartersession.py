@@ -0,0 +1,74 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Author Identity: Sergiy Maysak
+# Copyright: 2019-2023 Sergiy Maysak. All rights reserved.
+
+"""Detection of brew sessions from SmarterCoffee state transitions."""
+
+import time
+
+EVENT_BREW_STARTED = 'brew_started'
+EVENT_GRINDING_DONE = 'grinding_done'
+EVENT_BREW_FINISHED = 'brew_finished'
+
+BREWING_STATES = ('grinding', 'brewing')
+
+
+class BrewSessionTracker:
+    """
+    Turns stream of decoded states into discrete brew session events.
+    Repeated identical states never produce events.
+    """
+
+    def __init__(self, clock=time.monotonic, wall_clock=time.time):
+        self._clock = clock
+        self._wall_clock = wall_clock
+        self._state = None
+        self._session = None
+
+    @property
+    def session(self):
+        """Metadata of brew in progress or None."""
+        return None if self._session is None else dict(self._session)
+
+    def update(self, state, cups, strength, use_beans, water_level) -> list:
+        """Feed decoded state, return list of (event type, event data) tuples."""
+        previous = self._state
+        self._state = state
+        if previous == state:
+            return []
+
+        # first state after start does not tell us when brew has started
+        if previous is None or previous == 'unknown':
+            return []
+
+        events = []
+        if state in BREWING_STATES and previous not in BREWING_STATES:
+            self._session = {
+                'started': self._wall_clock(),
+                'cups': cups,
+                'strength': strength,
+                'mode': 'beans' if use_beans else 'filter',
+                'water_level_before': water_level,
+                '_started_at': self._clock(),
+            }
+            events.append((EVENT_BREW_STARTED, self._event_data()))
+
+        if self._session is None:
+            return events
+
+        if previous == 'grinding' and state == 'brewing':
+            self._session['grinding_duration'] = self._clock() - self._session['_started_at']
+            events.append((EVENT_GRINDING_DONE, self._event_data()))
+        elif previous in BREWING_STATES and state not in BREWING_STATES:
+            data = self._event_data()
+            data['duration'] = self._clock() - self._session['_started_at']
+            data['water_level_after'] = water_level
+            data['result'] = state
+            events.append((EVENT_BREW_FINISHED, data))
+            self._session = None
+
+        return events
+
+    def _event_data(self):
+        return {key: value for key, value in self._session.items() if not key.startswith('_')}
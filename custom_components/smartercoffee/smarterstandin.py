@@ -0,0 +1,124 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Author Identity: Sergiy Maysak
+# Copyright: 2019-2023 Sergiy Maysak. All rights reserved.
+
+"""Local stand-in of SmarterCoffee v1.0 device for benchmarks and experiments."""
+
+import asyncio
+
+from .smartercodec import encode_response, split_frames, COMMAND_SPECS
+
+_COMMAND_SPECS_BY_ID = {spec.id: spec for spec in COMMAND_SPECS}
+
+
+def _decode_command(frame):
+    """Decode command frame sent by controller into (name, fields)."""
+    spec = _COMMAND_SPECS_BY_ID.get(frame[0])
+    if spec is None:
+        return None, {}
+    values = frame[1:1 + len(spec.fields)]
+    return spec.name, {field.name: value for field, value in zip(spec.fields, values)}
+
+
+class SmarterCoffeeStandIn:
+    """
+    TCP server speaking SmarterCoffee protocol: acks every command,
+    keeps cups, strength, beans and hot plate state and pushes status frames.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, status_interval=1.0):
+        self.host = host
+        self.port = port
+        self.status_interval = status_interval
+        self.commands_received = 0
+        self.cups = 3
+        self.strength = 2
+        self.use_beans = True
+        self.hot_plate = False
+        self.brewing = False
+        self.carafe_required = True
+        self.one_cup = False
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self.serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def status_frame(self):
+        status = 0x1    # carafe present
+        status |= 0x2 if self.use_beans else 0
+        status |= 0x10 if self.brewing else 0x4
+        status |= 0x40 if self.hot_plate else 0
+        # 0x10 - enough water flag, 0x3 - full
+        return encode_response('status', status=status, water_level=0x13,
+            wifi_strength=3, strength=self.strength, cups=self.cups)
+
+    def handle_command(self, name, fields):
+        """Apply command and return reply frames."""
+        self.commands_received += 1
+        if name == 'get_defaults':
+            return encode_response('defaults', cups=self.cups, strength=self.strength,
+                beans=int(self.use_beans), hot_plate_time=5)
+        if name == 'get_carafe_required':
+            return encode_response('carafe', value=0 if self.carafe_required else 1)
+        if name == 'get_mode':
+            return encode_response('mode', value=int(self.one_cup))
+
+        if name == 'set_cups':
+            self.cups = fields['cups']
+        elif name == 'set_strength':
+            self.strength = fields['strength']
+        elif name == 'toggle_beans':
+            self.use_beans = not self.use_beans
+        elif name == 'hot_plate_on':
+            self.hot_plate = True
+        elif name == 'hot_plate_off':
+            self.hot_plate = False
+        elif name in ('brew', 'brew_default'):
+            if self.brewing:
+                return encode_response('command', result=0x1)
+            self.brewing = True
+            if name == 'brew':
+                self.cups = fields['cups']
+                self.strength = fields['strength']
+                self.use_beans = fields['grind'] != 0
+        elif name == 'stop_brew':
+            self.brewing = False
+        elif name == 'set_carafe_required':
+            self.carafe_required = fields['not_required'] == 0
+        elif name == 'set_mode':
+            self.one_cup = fields['one_cup'] != 0
+        elif name is None:
+            return encode_response('command', result=0x69)
+        return encode_response('command', result=0x0) + self.status_frame()
+
+    async def serve(self, reader, writer):
+        """Serve single connection, e.g. in-memory one of MemoryTransport."""
+        async def _push_status():
+            while True:
+                writer.write(self.status_frame())
+                await asyncio.sleep(self.status_interval)
+
+        pusher = asyncio.ensure_future(_push_status())
+        try:
+            while True:
+                data = await reader.read(64)
+                if len(data) == 0:
+                    break
+                for frame in split_frames(data):
+                    name, fields = _decode_command(frame)
+                    writer.write(self.handle_command(name, fields))
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            pusher.cancel()
+            writer.close()
@@ -0,0 +1,210 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Author Identity: Sergiy Maysak
+# Copyright: 2019-2023 Sergiy Maysak. All rights reserved.
+
+"""
+Streams of SmarterCoffee states and frames with independent subscribers
+and latest value handoff between io thread and main loop.
+Publishing never blocks: every subscriber has own bounded queue and
+slow subscribers lose items according to their policy.
+"""
+
+import asyncio
+import collections
+import threading
+
+# keep up to maxsize newest items, drop oldest one on overflow
+POLICY_DROP_OLDEST = 'drop_oldest'
+# keep only the newest item
+POLICY_LATEST = 'latest'
+
+POLICIES = (POLICY_DROP_OLDEST, POLICY_LATEST)
+
+
+class Subscription:
+    """
+    Bounded queue of single subscriber consumed with async for.
+    Items may be put from any thread, iteration happens on the loop
+    subscription was created on. Use as async context manager or call close().
+    """
+
+    def __init__(self, hub, loop, maxsize, policy):
+        if policy not in POLICIES:
+            raise ValueError(f'unknown policy {policy}')
+        if policy == POLICY_LATEST:
+            maxsize = 1
+        if maxsize < 1:
+            raise ValueError('maxsize must be positive')
+        self.policy = policy
+        self.maxsize = maxsize
+        self.dropped = 0
+        self.delivered = 0
+        self._hub = hub
+        self._loop = loop
+        self._queue = collections.deque(maxlen=maxsize)
+        self._lock = threading.Lock()
+        self._waiter = None
+        self._wake_pending = False
+        self._closed = False
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def put(self, item):
+        """Queue item dropping the oldest one if full. Never blocks."""
+        with self._lock:
+            if self._closed:
+                return
+            if len(self._queue) == self.maxsize:
+                self.dropped += 1
+            self._queue.append(item)
+        self._schedule_wake()
+
+    def close(self):
+        """Finish iteration once queued items are consumed."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._hub._remove(self)
+        self._schedule_wake()
+
+    def stats(self) -> dict:
+        return {
+            'policy': self.policy,
+            'maxsize': self.maxsize,
+            'queued': len(self._queue),
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+        }
+
+    def _schedule_wake(self):
+        # at most one wake up callback per subscription is pending on its loop
+        with self._lock:
+            if self._wake_pending:
+                return
+            self._wake_pending = True
+        try:
+            self._loop.call_soon_threadsafe(self._wake)
+        except RuntimeError:
+            # loop of subscriber is closed - nobody is waiting
+            pass
+
+    def _wake(self):
+        with self._lock:
+            self._wake_pending = False
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while True:
+            with self._lock:
+                if len(self._queue) > 0:
+                    self.delivered += 1
+                    return self._queue.popleft()
+                if self._closed:
+                    raise StopAsyncIteration
+            self._waiter = self._loop.create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class StreamHub:
+    """Fan out of published items to all subscriptions."""
+
+    def __init__(self):
+        # replaced on change so publishing from other thread iterates stable list
+        self._subscriptions = ()
+        self._lock = threading.Lock()
+
+    def __bool__(self):
+        return len(self._subscriptions) > 0
+
+    def subscribe(self, maxsize=1, policy=POLICY_LATEST) -> Subscription:
+        """Subscribe on the running loop."""
+        subscription = Subscription(self, asyncio.get_running_loop(), maxsize, policy)
+        with self._lock:
+            self._subscriptions = self._subscriptions + (subscription,)
+        return subscription
+
+    def publish(self, item):
+        for subscription in self._subscriptions:
+            subscription.put(item)
+
+    def close(self):
+        """Finish all current subscriptions."""
+        for subscription in self._subscriptions:
+            subscription.close()
+
+    def stats(self) -> list[dict]:
+        return [subscription.stats() for subscription in self._subscriptions]
+
+    def _remove(self, subscription):
+        with self._lock:
+            self._subscriptions = tuple(item for item in self._subscriptions
+                                        if item is not subscription)
+
+
+class LatestValueHandoff:
+    """
+    Bounded handoff of keyed values from producer thread to consumer loop.
+    A value replaces not yet consumed value with the same key, so memory is
+    bounded by amount of keys and stalled consumer catches up with the newest
+    values only. At most one drain callback is pending on consumer loop.
+    """
+
+    def __init__(self, loop, consume):
+        """consume(values) is called on loop with dict of key: latest value."""
+        self._loop = loop
+        self._consume = consume
+        self._lock = threading.Lock()
+        self._values = {}
+        self._drain_pending = False
+        self.handed = 0
+        self.dropped = 0
+        self.drains = 0
+
+    def put(self, key, value):
+        """Store value for consumer. Thread safe, never blocks."""
+        with self._lock:
+            if key in self._values:
+                self.dropped += 1
+            self._values[key] = value
+            self.handed += 1
+            if self._drain_pending:
+                return
+            self._drain_pending = True
+        try:
+            self._loop.call_soon_threadsafe(self._drain)
+        except RuntimeError:
+            # consumer loop is closed
+            pass
+
+    def stats(self) -> dict:
+        return {
+            'handed': self.handed,
+            'dropped': self.dropped,
+            'drains': self.drains,
+            'waiting': len(self._values),
+        }
+
+    def _drain(self):
+        with self._lock:
+            values, self._values = self._values, {}
+            self._drain_pending = False
+        self.drains += 1
+        if len(values) > 0:
+            self._consume(values)
@@ -0,0 +1,101 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Author Identity: Sergiy Maysak
+# Copyright: 2019-2023 Sergiy Maysak. All rights reserved.
+
+"""Binary capture of SmarterCoffee protocol traffic and its replay."""
+
+import asyncio
+import struct
+import time
+
+DIRECTION_RECEIVED = 0
+DIRECTION_SENT = 1
+
+# file starts with magic and format version
+TRACE_MAGIC = b'SCTR'
+TRACE_VERSION = 1
+
+# every record is: monotonic timestamp, direction, payload length, payload
+_RECORD_HEADER = struct.Struct('<dBH')
+
+
+class TraceWriter:
+    """Appends frames to capture file. Not thread safe - use from io thread only."""
+
+    def __init__(self, path, clock=time.monotonic):
+        self._clock = clock
+        self.path = path
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(TRACE_MAGIC + bytes([TRACE_VERSION]))
+
+    def write(self, direction, data):
+        data = bytes(data)
+        self._file.write(_RECORD_HEADER.pack(self._clock(), direction, len(data)))
+        self._file.write(data)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+def read_trace(path):
+    """Yield (timestamp, direction, data) records of capture file."""
+    with open(path, 'rb') as file:
+        header = file.read(len(TRACE_MAGIC) + 1)
+        if header[:len(TRACE_MAGIC)] != TRACE_MAGIC:
+            raise ValueError(f'{path} is not a SmarterCoffee trace')
+        if header[-1] != TRACE_VERSION:
+            raise ValueError(f'unsupported trace version {header[-1]}')
+
+        while True:
+            record = file.read(_RECORD_HEADER.size)
+            if len(record) < _RECORD_HEADER.size:
+                return
+            timestamp, direction, length = _RECORD_HEADER.unpack(record)
+            data = file.read(length)
+            if len(data) < length:
+                return
+            yield timestamp, direction, data
+
+
+class TraceReplay:
+    """
+    Feeds received reads of capture file through controller decoding on the
+    running loop. ReplayTransport replays them through connection instead.
+    """
+
+    def __init__(self, controller, path):
+        self._controller = controller
+        self._path = path
+
+    async def replay(self, speed=1.0, handler=None):
+        """
+        Replay received frames on the running loop.
+        speed scales recorded timing, None replays as fast as possible.
+        Return amount of frames replayed.
+        """
+        if handler is not None:
+            self._controller._handler = handler
+        frames = 0
+        first_timestamp = None
+        started = time.monotonic()
+        for timestamp, direction, data in read_trace(self._path):
+            if direction != DIRECTION_RECEIVED:
+                continue
+            if speed is not None:
+                if first_timestamp is None:
+                    first_timestamp = timestamp
+                delay = (timestamp - first_timestamp) / speed - (time.monotonic() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            # same path as reads of live connection - frames split across reads are reassembled
+            self._controller._received(data)
+            frames += 1
+        # let handed off messages be applied
+        await asyncio.sleep(0)
+        return frames
@@ -0,0 +1,159 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Author Identity: Sergiy Maysak
+# Copyright: 2019-2023 Sergiy Maysak. All rights reserved.
+
+"""
+Transports opening controller connections to SmarterCoffee device.
+Transport is any object with open_connection(host, port) coroutine
+returning (reader, writer) pair compatible with asyncio streams:
+reader.read(n), writer.write(data), drain(), close(), is_closing(), wait_closed().
+"""
+
+import asyncio
+import time
+
+from .smartertrace import read_trace, DIRECTION_RECEIVED
+
+
+class TcpTransport:
+    """Real device over TCP."""
+
+    async def open_connection(self, host, port):
+        return await asyncio.open_connection(host=host, port=port)
+
+
+class MemoryTransport:
+    """
+    In-memory pipe to device served by serve(reader, writer) coroutine,
+    e.g. SmarterCoffeeStandIn.serve. Device is served on the loop opening
+    connection, host and port are ignored. No sockets are involved,
+    so thousands of connections may be opened in one process.
+    """
+
+    def __init__(self, serve):
+        self._serve = serve
+        self._tasks = set()
+        self.connections = 0
+
+    async def open_connection(self, host, port):
+        client_reader = asyncio.StreamReader()
+        server_reader = asyncio.StreamReader()
+        client_writer = MemoryStreamWriter(server_reader)
+        server_writer = MemoryStreamWriter(client_reader)
+        task = asyncio.ensure_future(self._serve(server_reader, server_writer))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        self.connections += 1
+        return client_reader, client_writer
+
+
+class MemoryStreamWriter:
+    """Writes straight into reader of other end of pipe."""
+
+    def __init__(self, peer_reader):
+        self._peer_reader = peer_reader
+        self._closed = False
+        self.written = 0
+
+    def write(self, data):
+        if self._closed:
+            return
+        self.written += len(data)
+        self._peer_reader.feed_data(data)
+
+    async def drain(self):
+        if self._closed:
+            raise ConnectionResetError('memory pipe is closed')
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._peer_reader.feed_eof()
+
+    def is_closing(self) -> bool:
+        return self._closed
+
+    async def wait_closed(self):
+        pass
+
+
+class ReplayTransport:
+    """
+    Replays received reads of capture file as device output, written commands
+    are counted and dropped. speed scales recorded timing, None replays
+    as fast as possible. Connection reports EOF once capture is over.
+    """
+
+    def __init__(self, path, speed=None):
+        self._path = path
+        self.speed = speed
+        self.connections = 0
+
+    async def open_connection(self, host, port):
+        self.connections += 1
+        reader = ReplayStreamReader(read_trace(self._path), self.speed)
+        return reader, ReplayStreamWriter(reader)
+
+
+class ReplayStreamReader:
+    def __init__(self, records, speed):
+        self._records = records
+        self._speed = speed
+        self._pending = b''
+        self._first_timestamp = None
+        self._started = None
+        self.closed = False
+        self.replayed = 0
+
+    async def read(self, n=-1):
+        if len(self._pending) == 0:
+            self._pending = await self._next_read()
+        if n < 0:
+            n = len(self._pending)
+        data, self._pending = self._pending[:n], self._pending[n:]
+        return data
+
+    def close(self):
+        self.closed = True
+        # release capture file
+        self._records.close()
+
+    async def _next_read(self):
+        for timestamp, direction, data in self._records:
+            if self.closed:
+                break
+            if direction != DIRECTION_RECEIVED or len(data) == 0:
+                continue
+            if self._speed is not None:
+                if self._first_timestamp is None:
+                    self._first_timestamp = timestamp
+                    self._started = time.monotonic()
+                delay = (timestamp - self._first_timestamp) / self._speed - \
+                    (time.monotonic() - self._started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            self.replayed += 1
+            return data
+        return b''
+
+
+class ReplayStreamWriter:
+    def __init__(self, reader):
+        self._reader = reader
+        self.written = 0
+
+    def write(self, data):
+        self.written += len(data)
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        self._reader.close()
+
+    def is_closing(self) -> bool:
+        return self._reader.closed
+
+    async def wait_closed(self):
+        pass
@@ -0,0 +1,426 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Author Identity: Sergiy Maysak
+# Copyright: 2019-2023 Sergiy Maysak. All rights reserved.
+
+"""
+Optional sharding of SmarterCoffee controllers across worker processes.
+Each worker owns sockets and decoding for its shard of makers and sends
+only changed state fields to the main process through a pipe.
+"""
+
+import asyncio
+import functools
+import itertools
+import multiprocessing
+import time
+
+from .smarterhistory import StatusHistory
+from .smartercontroller import SmarterCoffeeController, STATE_FIELDS, RESTORED_FIELDS
+from .smarterstreams import StreamHub, POLICY_LATEST
+
+# controller coroutine methods callable from main process
+REMOTE_METHODS = (
+    'connect', 'brew', 'start_brew', 'stop_brew', 'set_cups', 'set_strength',
+    'toggle_grind', 'turn_use_beans_on', 'turn_use_beans_off', 'turn_hot_plate_on',
+    'turn_hot_plate_off', 'fetch_carafe_detection_status', 'fetch_one_cup_mode_status',
+    'query', 'turn_carafe_detection_on', 'turn_carafe_detection_off',
+    'turn_one_cup_mode_on', 'turn_one_cup_mode_off', 'fetch_stats',
+)
+
+# seconds given to worker process to stop its controllers
+WORKER_SHUTDOWN_TIMEOUT = 10.0
+
+
+def _snapshot(controller):
+    # counters change on every notify - they are fetched on demand by fetch_stats
+    values = {field: getattr(controller, field) for field in STATE_FIELDS}
+    values['pending_updates'] = sorted(controller.pending_updates)
+    values['restored_at'] = controller.restored_at
+    return values
+
+
+def _picklable(value):
+    if value is None or isinstance(value, (bool, int, float, str, bytes, list, dict, tuple)):
+        return value
+    return str(value)
+
+
+def _send_all(conn, messages):
+    """Write messages to pipe, blocks while pipe is full. Executed in executor thread."""
+    for message in messages:
+        conn.send(message)
+
+
+def _worker_main(conn, transport=None):
+    """Entry point of worker process."""
+    try:
+        asyncio.run(_worker_run(conn, transport))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _worker_run(conn, transport):
+    loop = asyncio.get_running_loop()
+    controllers = {}
+    last_sent = {}
+    calls = {}
+    stopped = loop.create_future()
+
+    def _send(message):
+        try:
+            conn.send(message)
+        except (BrokenPipeError, EOFError, OSError):
+            if not stopped.done():
+                stopped.set_result(None)
+
+    def _state_changed(mac, controller):
+        values = _snapshot(controller)
+        previous = last_sent.get(mac, {})
+        diff = {field: value for field, value in values.items() if previous.get(field) != value}
+        if len(diff) > 0:
+            last_sent[mac] = values
+            _send(('state', mac, diff))
+
+    def _brew_event(mac, controller, event_type, data):
+        _send(('event', mac, event_type, data))
+
+    async def _call(call_id, mac, method, args, kwargs):
+        try:
+            result = await getattr(controllers[mac], method)(*args, **kwargs)
+            _send(('result', call_id, True, _picklable(result)))
+        except asyncio.CancelledError:
+            # caller in main process is gone - nobody waits for result
+            pass
+        except Exception as exc:
+            _send(('result', call_id, False, repr(exc)))
+        finally:
+            calls.pop(call_id, None)
+
+    async def _remove(mac):
+        controller = controllers.pop(mac, None)
+        last_sent.pop(mac, None)
+        if controller is not None:
+            await controller.stop_monitoring()
+
+    def _handle(message):
+        kind = message[0]
+        if kind == 'add':
+            _, mac, ip_address, port, restored_state = message
+            controller = SmarterCoffeeController(ip_address=ip_address, port=port,
+                mac=mac, loop=loop, transport=transport, restored_state=restored_state)
+            controllers[mac] = controller
+        elif kind == 'monitor':
+            mac = message[1]
+            controllers[mac].start_monitoring(functools.partial(_state_changed, mac),
+                functools.partial(_brew_event, mac))
+            _state_changed(mac, controllers[mac])
+        elif kind == 'remove':
+            loop.create_task(_remove(message[1]))
+        elif kind == 'call':
+            _, call_id, mac, method, args, kwargs = message
+            calls[call_id] = loop.create_task(_call(call_id, mac, method, args, kwargs))
+        elif kind == 'cancel':
+            task = calls.get(message[1])
+            if task is not None:
+                task.cancel()
+        elif kind == 'stop' and not stopped.done():
+            stopped.set_result(None)
+
+    def _on_readable():
+        try:
+            while conn.poll():
+                _handle(conn.recv())
+        except (EOFError, OSError):
+            if not stopped.done():
+                stopped.set_result(None)
+
+    loop.add_reader(conn.fileno(), _on_readable)
+    try:
+        await stopped
+    finally:
+        loop.remove_reader(conn.fileno())
+        await asyncio.gather(*[controller.stop_monitoring() for controller in controllers.values()],
+            return_exceptions=True)
+        conn.close()
+
+
+class RemoteController:
+    """
+    Main process proxy of SmarterCoffeeController running in worker process.
+    Mirrors controller state and forwards command coroutines.
+    """
+
+    def __init__(self, pool, shard, ip_address, port, mac, restored_state=None):
+        self._pool = pool
+        self._shard = shard
+        self._ip_address = ip_address
+        self._port = port
+        self._mac_address = mac
+        self._handler = None
+        self._event_handler = None
+        self._queried_at = {}
+        self.monitoring = False
+        self.pending_updates = set()
+        self.status_history = StatusHistory()
+        self._state_streams = StreamHub()
+
+        self.available = True
+        self.state = 'unknown'
+        self.cups = 3
+        self.water_level = 'full'
+        self.enoughwater = True
+        self.wifi_strength = 3
+        self.strength = 'strong'
+        self.use_beans = True
+        self.hot_plate_time = 5
+        self.hot_plate = False
+        self.carafe = True
+        self.carafe_detection = True
+        self.one_cup_mode = False
+
+        # restored here as well so state is shown before worker reports it
+        self.restored_at = None
+        if restored_state is not None:
+            for field in RESTORED_FIELDS:
+                if field in restored_state:
+                    setattr(self, field, restored_state[field])
+            self.restored_at = restored_state.get('saved_at', time.time())
+
+        for method in REMOTE_METHODS:
+            if method not in ('connect', 'query'):
+                setattr(self, method, functools.partial(self._call, method))
+
+    @property
+    def mac_address(self):
+        return self._mac_address
+
+    async def connect(self, timeout=None):
+        if timeout is None:
+            return await self._call('connect')
+        return await self._call('connect', timeout)
+
+    async def query(self, command_id):
+        self._queried_at[command_id] = time.monotonic()
+        return await self._call('query', command_id)
+
+    def states(self, maxsize=1, policy=POLICY_LATEST):
+        """Subscribe to state snapshots mirrored from worker."""
+        return self._state_streams.subscribe(maxsize, policy)
+
+    def snapshot(self) -> dict:
+        values = {field: getattr(self, field) for field in STATE_FIELDS}
+        values['mac_address'] = self._mac_address
+        values['pending_updates'] = frozenset(self.pending_updates)
+        values['restored_at'] = self.restored_at
+        values['timestamp'] = time.time()
+        return values
+
+    @property
+    def stale(self) -> bool:
+        return self.restored_at is not None
+
+    def persistent_state(self) -> dict | None:
+        """Optimistic values are not told apart here - skip saving while any is pending."""
+        if self.stale or self.state == 'unknown' or len(self.pending_updates) > 0:
+            return None
+        values = {field: getattr(self, field) for field in RESTORED_FIELDS}
+        values['saved_at'] = time.time()
+        return values
+
+    def query_needed(self, command_id, max_age):
+        """Answers are not mirrored - rely on time of last query sent from here."""
+        queried_at = self._queried_at.get(command_id)
+        return queried_at is None or time.monotonic() - queried_at >= max_age
+
+    def start_monitoring(self, handler, event_handler=None):
+        if self.monitoring:
+            return
+        self.monitoring = True
+        self._handler = handler
+        self._event_handler = event_handler
+        self._pool._send(self._shard, ('monitor', self._mac_address))
+
+    async def stop_monitoring(self, timeout=None):
+        if not self.monitoring:
+            return
+        self.monitoring = False
+        self._pool._send(self._shard, ('remove', self._mac_address))
+        self._pool._forget(self)
+        self._state_streams.close()
+
+    async def _call(self, method, *args, **kwargs):
+        return await self._pool._call(self._shard, self._mac_address, method, args, kwargs)
+
+    def _apply(self, diff):
+        """Apply state fields changed in worker. Executed on main thread."""
+        for field, value in diff.items():
+            if field == 'pending_updates':
+                value = set(value)
+            setattr(self, field, value)
+        if any(field in STATE_FIELDS for field in diff):
+            self.status_history.append(state=self.state, water_level=self.water_level,
+                cups=self.cups, strength=self.strength, hot_plate=self.hot_plate,
+                carafe=self.carafe, use_beans=self.use_beans, enoughwater=self.enoughwater)
+        elif 'restored_at' not in diff:
+            # only pending updates changed - nothing entities show
+            return
+        if self._state_streams:
+            self._state_streams.publish(self.snapshot())
+        if self._handler is not None:
+            self._handler(self)
+
+    def _event(self, event_type, data):
+        if self._event_handler is not None:
+            self._event_handler(self, event_type, data)
+
+    def __repr__(self):
+        return ('SmarterCoffee (remote) state: {}, use: {}, water level: {}, cups: {},'
+                ' strength: {}'
+                ).format(self.state,
+                         'beans' if self.use_beans else 'filter only',
+                         self.water_level, self.cups,
+                         self.strength)
+
+
+class _Worker:
+    __slots__ = ('process', 'conn', 'outbox', 'sender')
+
+    def __init__(self, process, conn, outbox, sender):
+        self.process = process
+        self.conn = conn
+        self.outbox = outbox
+        self.sender = sender
+
+
+class ShardedControllerPool:
+    """
+    Small pool of worker processes, each running controllers of its shard.
+    Messages to workers are written by executor thread, so full pipe never
+    blocks the event loop.
+    """
+
+    def __init__(self, loop, processes=2, transport=None):
+        """transport of worker controllers is pickled into workers, TcpTransport if None."""
+        self._loop = loop
+        self._processes = processes
+        self._transport = transport
+        self._workers = []
+        self._shard_sizes = []
+        self._controllers = {}
+        self._calls = {}
+        self._call_ids = itertools.count()
+
+    @property
+    def started(self) -> bool:
+        return len(self._workers) > 0
+
+    def start(self):
+        context = multiprocessing.get_context('spawn')
+        for shard in range(self._processes):
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(target=_worker_main, args=(child_conn, self._transport),
+                name=f'smartercoffee-io-{shard}', daemon=True)
+            process.start()
+            child_conn.close()
+            outbox = asyncio.Queue()
+            sender = self._loop.create_task(self._run_sender(parent_conn, outbox))
+            self._workers.append(_Worker(process, parent_conn, outbox, sender))
+            self._shard_sizes.append(0)
+            self._loop.add_reader(parent_conn.fileno(),
+                functools.partial(self._on_readable, shard))
+
+    def controller(self, ip_address, port, mac, restored_state=None) -> RemoteController:
+        """Create controller proxy in the least loaded shard."""
+        if not self.started:
+            self.start()
+        shard = min(range(len(self._workers)), key=lambda index: self._shard_sizes[index])
+        self._shard_sizes[shard] += 1
+        controller = RemoteController(self, shard, ip_address, port, mac, restored_state)
+        self._controllers[mac] = controller
+        self._send(shard, ('add', mac, ip_address, port, restored_state))
+        return controller
+
+    async def shutdown(self, timeout=WORKER_SHUTDOWN_TIMEOUT):
+        workers, self._workers = self._workers, []
+        for worker in workers:
+            self._loop.remove_reader(worker.conn.fileno())
+            # sender ends after stop message is written
+            worker.outbox.put_nowait(('stop',))
+        if len(workers) > 0:
+            await asyncio.wait([worker.sender for worker in workers], timeout=timeout)
+        for worker in workers:
+            await self._loop.run_in_executor(None, worker.process.join, timeout)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            worker.sender.cancel()
+            worker.conn.close()
+        for future in self._calls.values():
+            if not future.done():
+                future.cancel()
+        self._calls = {}
+
+    def _forget(self, controller):
+        if self._controllers.pop(controller.mac_address, None) is not None:
+            self._shard_sizes[controller._shard] -= 1
+
+    def _send(self, shard, message):
+        if shard < len(self._workers):
+            self._workers[shard].outbox.put_nowait(message)
+
+    async def _run_sender(self, conn, outbox):
+        """Write queued messages to worker pipe in order, batching ones queued meanwhile."""
+        while True:
+            messages = [await outbox.get()]
+            while not outbox.empty():
+                messages.append(outbox.get_nowait())
+            try:
+                await self._loop.run_in_executor(None, _send_all, conn, messages)
+            except (BrokenPipeError, OSError):
+                return
+            if messages[-1] == ('stop',):
+                return
+
+    async def _call(self, shard, mac, method, args, kwargs):
+        call_id = next(self._call_ids)
+        future = self._loop.create_future()
+        self._calls[call_id] = future
+        try:
+            self._send(shard, ('call', call_id, mac, method, args, kwargs))
+            return await future
+        except asyncio.CancelledError:
+            # cancel command in worker too
+            self._send(shard, ('cancel', call_id))
+            raise
+        finally:
+            self._calls.pop(call_id, None)
+
+    def _on_readable(self, shard):
+        conn = self._workers[shard].conn
+        try:
+            while conn.poll():
+                self._dispatch(conn.recv())
+        except (EOFError, OSError):
+            self._loop.remove_reader(conn.fileno())
+            for controller in self._controllers.values():
+                if controller._shard == shard:
+                    controller._apply({'available': False})
+
+    def _dispatch(self, message):
+        kind = message[0]
+        if kind == 'state':
+            controller = self._controllers.get(message[1])
+            if controller is not None:
+                controller._apply(message[2])
+        elif kind == 'event':
+            controller = self._controllers.get(message[1])
+            if controller is not None:
+                controller._event(message[2], message[3])
+        elif kind == 'result':
+            _, call_id, succeed, value = message
+            future = self._calls.get(call_id)
+            if future is not None and not future.done():
+                if succeed:
+                    future.set_result(value)
+                else:
+                    future.set_exception(RuntimeError(value))
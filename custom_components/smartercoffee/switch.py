@@ -7,7 +7,7 @@
 
 import asyncio
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime
 import async_timeout
 
 from homeassistant.components.switch import SwitchEntity
@@ -17,17 +17,12 @@ from homeassistant.const import STATE_OFF, STATE_ON, STATE_STANDBY, STATE_UNKNOW
 from homeassistant.core import callback
 from homeassistant.helpers.dispatcher import (
     async_dispatcher_send,
-    async_dispatcher_connect
 )
 
 from .const import DOMAIN as SMARTER_COFFEE_DOMAIN
 from .const import MAKERS
-from . import SmarterCoffeeBaseEntity
-from . import SMARTERCOFFEE_UPDATE
-
-# define polling interval in 10 minutes - this allows 
-# to avoid ddos of coffee machine
-SCAN_INTERVAL = timedelta(minutes=10)
+from .coordinator import SmarterCoffeeBaseEntity
+from .coordinator import async_setup_maker_entities
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -42,14 +37,13 @@ async def async_setup_entry(hass, config_entry, async_add_entities):
             [
                 SmarterCoffeeSwitch(maker, 'Use Beans', 'use_beans', True, 'mdi:seed', 'mdi:filter'),
                 SmarterCoffeeSwitch(maker, 'Brew', 'brew', False, 'mdi:coffee-to-go', 'mdi:coffee-to-go'),
-                SmarterCoffeePollingSwitch(maker, 'Detect Carafe', 'carafe_detection', False, 'mdi:coffee-maker', 'mdi:coffee-maker-outline'),
-                # SmarterCoffeePollingSwitch(maker, 'One Cup Mode', 'one_cup_mode', False, 'mdi:cup', 'mdi:cup-off')
+                # state of these switches is polled by coordinator for all makers at once
+                SmarterCoffeeSwitch(maker, 'Detect Carafe', 'carafe_detection', False, 'mdi:coffee-maker', 'mdi:coffee-maker-outline'),
+                # SmarterCoffeeSwitch(maker, 'One Cup Mode', 'one_cup_mode', False, 'mdi:cup', 'mdi:cup-off')
             ]
         )
 
-    coordinator = hass.data[SMARTER_COFFEE_DOMAIN]
-    for maker in coordinator.makers:
-        build_entities(maker)
+    async_setup_maker_entities(hass, config_entry, build_entities)
 
 
 class SmarterCoffeeSwitch(SmarterCoffeeBaseEntity, SwitchEntity):
@@ -88,35 +82,3 @@ class SmarterCoffeeSwitch(SmarterCoffeeBaseEntity, SwitchEntity):
         """Return a unique, unchanging string that represents this sensor."""
         return f"{self._mac_address}_{self._switch_class}"
 
-
-class SmarterCoffeePollingSwitch(SmarterCoffeeSwitch):
-    """Representation of a SmarterCoffee switch which needs polling to get state."""
-
-    def __init__(self, maker, name, switch_class, default, icon_on, icon_off):
-        """Initialize the SmarterCoffee polling-based switch."""
-        super().__init__(maker, name, switch_class, default, icon_on, icon_off)
-
-    @property
-    def should_poll(self):
-        """Return the polling state."""
-        return True
-
-    async def async_update(self):
-        """Fetch switch state."""
-        _LOGGER.info(f'Requested update for switch: {self._switch_class}')
-        if self._switch_class == 'carafe_detection':
-            await self.coffemaker.api.fetch_carafe_detection_status()            
-        elif self._switch_class == 'one_cup_mode':
-            await self.coffemaker.api.fetch_one_cup_mode_status()
-
-    async def async_added_to_hass(self):
-        """Set up a listener when this entity is added to HA."""
-        @callback
-        def _refresh():
-            self.async_schedule_update_ha_state()  # do not use forse update here to avoid recursion
-
-        self._unsub_dispatcher = async_dispatcher_connect(self.hass,
-            SMARTERCOFFEE_UPDATE, _refresh)
-
-        # request initial forse update
-        self.async_schedule_update_ha_state(force_refresh=True)
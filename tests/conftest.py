@@ -0,0 +1,17 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Author Identity: Sergiy Maysak
+# Copyright: 2019-2023 Sergiy Maysak. All rights reserved.
+
+"""
+Tests cover Home Assistant independent smarter* modules, imported as package
+smartercoffee. Path is set for worker processes spawned by tests as well.
+"""
+
+import pathlib
+import sys
+
+COMPONENTS_DIR = pathlib.Path(__file__).parent.parent / 'custom_components'
+
+if str(COMPONENTS_DIR) not in sys.path:
+    sys.path.insert(0, str(COMPONENTS_DIR))
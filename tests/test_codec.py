@@ -0,0 +1,106 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Author Identity: Sergiy Maysak
+# Copyright: 2019-2023 Sergiy Maysak. All rights reserved.
+
+"""Round trips of every message spec of SmarterCoffee wire protocol."""
+
+import pytest
+
+from smartercoffee.smartercodec import (
+    COMMAND_SPECS, RESPONSE_SPECS, COMMAND_SUFFIX, FRAMES,
+    encode, encode_response, decode, decode_buffer, split_frames,
+)
+
+
+def _values(spec, pick):
+    return {field.name: pick(field) for field in spec.fields}
+
+
+def _decode_command(spec, frame):
+    assert frame[-1] == COMMAND_SUFFIX
+    assert frame[0] == spec.id
+    return dict(zip((field.name for field in spec.fields), frame[1:-1]))
+
+
+@pytest.mark.parametrize('spec', COMMAND_SPECS, ids=lambda spec: spec.name)
+@pytest.mark.parametrize('pick', [
+    lambda field: field.min, lambda field: field.max, lambda field: field.default,
+], ids=['min', 'max', 'default'])
+def test_command_round_trip(spec, pick):
+    values = _values(spec, pick)
+    frame = encode(spec.name, **values)
+    assert len(frame) == len(spec.fields) + 2
+    assert _decode_command(spec, frame) == values
+    assert encode(spec.name, *values.values()) == frame
+
+
+@pytest.mark.parametrize('spec', COMMAND_SPECS, ids=lambda spec: spec.name)
+def test_command_out_of_range_gets_default(spec):
+    values = {field.name: field.max + 1 for field in spec.fields}
+    defaults = _values(spec, lambda field: field.default)
+    assert _decode_command(spec, encode(spec.name, **values)) == defaults
+
+
+def test_command_without_fields_is_prebuilt():
+    for spec in COMMAND_SPECS:
+        if len(spec.fields) == 0:
+            assert FRAMES[spec.name] == bytes([spec.id, COMMAND_SUFFIX])
+
+
+def test_command_with_too_many_fields_is_rejected():
+    with pytest.raises(TypeError):
+        encode('set_cups', 3, 4)
+
+
+@pytest.mark.parametrize('spec', RESPONSE_SPECS, ids=lambda spec: spec.name)
+@pytest.mark.parametrize('pick', [
+    lambda field: field.min, lambda field: field.max, lambda field: field.default,
+], ids=['min', 'max', 'default'])
+def test_response_round_trip(spec, pick):
+    values = _values(spec, pick)
+    frame = encode_response(spec.name, **values)
+    assert frame[-1] == COMMAND_SUFFIX
+    assert decode(split_frames(frame)[0]) == (spec.name, values)
+    assert decode_buffer(frame) == [(spec.name, values)]
+
+
+def test_buffer_of_all_responses_decodes_in_order():
+    buffer = b''.join(encode_response(spec.name) for spec in RESPONSE_SPECS)
+    assert [name for name, _ in decode_buffer(buffer)] == [spec.name for spec in RESPONSE_SPECS]
+
+
+@pytest.mark.parametrize('spec', [spec for spec in RESPONSE_SPECS if len(spec.fields) > 0],
+                         ids=lambda spec: spec.name)
+def test_too_short_frame(spec):
+    frame = split_frames(encode_response(spec.name))[0][:-1]
+    with pytest.raises(ValueError):
+        decode(frame)
+    assert decode_buffer(frame + bytes([COMMAND_SUFFIX])) == []
+
+
+@pytest.mark.parametrize('spec', RESPONSE_SPECS, ids=lambda spec: spec.name)
+def test_too_long_frame_decodes_known_fields(spec):
+    values = _values(spec, lambda field: field.max)
+    frame = split_frames(encode_response(spec.name, **values))[0] + b'\x01\x02'
+    assert decode(frame) == (spec.name, values)
+
+
+def test_unknown_message_id():
+    with pytest.raises(ValueError):
+        decode(b'\x01\x02')
+
+
+def test_malformed_frames_are_skipped():
+    status = encode_response('status', status=0x15, water_level=0x13, cups=7)
+    buffer = (b'\x01\x02\x03' + bytes([COMMAND_SUFFIX])    # unknown id
+              + bytes([COMMAND_SUFFIX] * 3)                 # empty frames
+              + b'\x32\x15' + bytes([COMMAND_SUFFIX])       # truncated status
+              + status)
+    assert decode_buffer(buffer) == [('status', {'status': 0x15, 'water_level': 0x13,
+        'wifi_strength': 0, 'strength': 0, 'cups': 7})]
+
+
+def test_empty_buffer():
+    assert decode_buffer(b'') == []
+    assert split_frames(b'') == []
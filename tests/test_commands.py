@@ -0,0 +1,170 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Author Identity: Sergiy Maysak
+# Copyright: 2019-2023 Sergiy Maysak. All rights reserved.
+
+"""Command scheduler ordering, superseding, depth bound and token bucket."""
+
+import asyncio
+
+from smartercoffee.smartercommands import (
+    CommandScheduler, TokenBucket, PRIORITY_SAFETY, PRIORITY_NORMAL, PRIORITY_POLL,
+    QUEUE_FULL, SUPERSEDED,
+)
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def _scheduler(**kwargs):
+    sent = []
+
+    async def _execute(command):
+        sent.append(command)
+        return 'ok'
+
+    return CommandScheduler(_execute, clock=_Clock(), **kwargs), sent
+
+
+def test_more_urgent_commands_are_sent_first():
+    async def _scenario():
+        scheduler, sent = _scheduler()
+        futures = [scheduler.submit('status', PRIORITY_POLL),
+                   scheduler.submit('cups', PRIORITY_NORMAL),
+                   scheduler.submit('strength', PRIORITY_NORMAL),
+                   scheduler.submit('stop', PRIORITY_SAFETY)]
+        assert scheduler.depth == 4
+        assert await asyncio.gather(*futures) == ['ok'] * 4
+        return sent, scheduler.stats()
+
+    sent, stats = asyncio.run(_scenario())
+    # submission order within the same priority
+    assert sent == ['stop', 'cups', 'strength', 'status']
+    assert stats['normal']['sent'] == 2
+    assert stats['safety']['sent'] == 1
+
+
+def test_queued_command_is_superseded_by_key():
+    async def _scenario():
+        scheduler, sent = _scheduler()
+        first = scheduler.submit('cups 2', key='cups')
+        hot_plate = scheduler.submit('hot plate on', key='hot_plate')
+        second = scheduler.submit('cups 5', key='cups')
+        # brew makes queued settings changes pointless
+        brew = scheduler.submit('brew', supersedes=('hot_plate',))
+        results = await asyncio.gather(first, hot_plate, second, brew)
+        return results, sent, scheduler.stats()
+
+    results, sent, stats = asyncio.run(_scenario())
+    assert results == [SUPERSEDED, SUPERSEDED, 'ok', 'ok']
+    assert sent == ['cups 5', 'brew']
+    assert stats['normal']['superseded'] == 2
+
+
+def test_less_urgent_command_does_not_supersede():
+    async def _scenario():
+        scheduler, sent = _scheduler()
+        stop = scheduler.submit('stop', PRIORITY_SAFETY, key='brew')
+        brew = scheduler.submit('brew', PRIORITY_NORMAL, key='brew')
+        return await asyncio.gather(stop, brew), sent
+
+    results, sent = asyncio.run(_scenario())
+    assert results == ['ok', 'ok']
+    assert sent == ['stop', 'brew']
+
+
+def test_queue_depth_is_bounded():
+    async def _scenario():
+        scheduler, sent = _scheduler(max_depth=2)
+        poll = scheduler.submit('status', PRIORITY_POLL)
+        cups = scheduler.submit('cups', PRIORITY_NORMAL)
+        # full - the least urgent queued command makes room
+        strength = scheduler.submit('strength', PRIORITY_NORMAL)
+        assert scheduler.depth == 2
+        # full of commands as urgent as this one - rejected
+        rejected = scheduler.submit('grind', PRIORITY_NORMAL)
+        assert rejected.result() == QUEUE_FULL
+        # safety commands still get in
+        stop = scheduler.submit('stop', PRIORITY_SAFETY)
+        assert scheduler.depth == 2
+        results = await asyncio.gather(poll, cups, strength, stop)
+        return results, sent, scheduler.stats()
+
+    results, sent, stats = asyncio.run(_scenario())
+    assert results == [QUEUE_FULL, 'ok', QUEUE_FULL, 'ok']
+    assert sent == ['stop', 'cups']
+    assert stats['poll']['rejected'] == 1
+    assert stats['normal']['rejected'] == 2
+
+
+def test_cancelled_queued_command_frees_its_slot():
+    async def _scenario():
+        scheduler, sent = _scheduler(max_depth=1)
+        cups = scheduler.submit('cups')
+        cups.cancel()
+        # done callbacks run on the next loop iteration
+        await asyncio.sleep(0)
+        assert scheduler.depth == 0
+        assert await scheduler.submit('strength') == 'ok'
+        return sent, scheduler.stats()
+
+    sent, stats = asyncio.run(_scenario())
+    assert sent == ['strength']
+    assert stats['normal']['cancelled'] == 1
+
+
+def test_queueing_delay_is_measured_with_scheduler_clock():
+    async def _scenario():
+        scheduler, _ = _scheduler()
+        future = scheduler.submit('cups')
+        scheduler._clock.now += 0.25
+        await future
+        return scheduler.stats()['normal']
+
+    stats = asyncio.run(_scenario())
+    assert stats['avg_delay'] == 0.25
+    assert stats['max_delay'] == 0.25
+
+
+def test_token_bucket_allows_burst_then_rate():
+    clock = _Clock()
+    bucket = TokenBucket(rate=2.0, burst=3, clock=clock)
+    assert [bucket.try_acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.try_acquire() == 0.5
+
+    clock.now += 0.25
+    assert bucket.try_acquire() == 0.25
+    clock.now += 0.25
+    assert bucket.try_acquire() == 0.0
+
+    # idle time refills up to burst only
+    clock.now += 60.0
+    assert [bucket.try_acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.try_acquire() > 0.0
+
+
+def test_rate_limit_does_not_delay_safety_commands():
+    async def _scenario():
+        clock = _Clock()
+        scheduler, sent = _scheduler(limiter=TokenBucket(rate=1.0, burst=1, clock=clock))
+        assert await scheduler.submit('cups') == 'ok'
+        # bucket is empty and clock stands still - normal command waits
+        throttled = scheduler.submit('strength')
+        stop = scheduler.submit('stop', PRIORITY_SAFETY)
+        assert await stop == 'ok'
+        await asyncio.sleep(0.05)
+        assert not throttled.done()
+
+        clock.now += 1.0
+        assert await asyncio.wait_for(throttled, timeout=2.0) == 'ok'
+        return sent, scheduler.stats()
+
+    sent, stats = asyncio.run(_scenario())
+    assert sent == ['cups', 'stop', 'strength']
+    assert stats['normal']['throttled'] == 1
+    assert stats['safety']['throttled'] == 0
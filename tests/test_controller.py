@@ -0,0 +1,110 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Author Identity: Sergiy Maysak
+# Copyright: 2019-2023 Sergiy Maysak. All rights reserved.
+
+"""Controller io against local stand-in over in-memory pipe."""
+
+import asyncio
+
+from smartercoffee import smartercontroller
+from smartercoffee.smartercodec import COMMAND_SET_CUPS, encode_response, split_frames
+from smartercoffee.smartercommands import SUPERSEDED
+from smartercoffee.smartercontroller import SmarterCoffeeController, SHUTTING_DOWN, NO_REPLY
+from smartercoffee.smarterstandin import SmarterCoffeeStandIn
+from smartercoffee.smartertransport import MemoryTransport
+
+
+class _SilentStandIn(SmarterCoffeeStandIn):
+    """Pushes status but never answers commands."""
+
+    def handle_command(self, name, fields):
+        self.commands_received += 1
+        return b''
+
+
+class _HangingTransport:
+    """Connection attempts never complete."""
+
+    async def open_connection(self, host, port):
+        await asyncio.Event().wait()
+
+
+async def _serve_late_first_reply(reader, writer):
+    """Answers set_cups in order, the first one late and with error."""
+    late = True
+    while True:
+        data = await reader.read(64)
+        if len(data) == 0:
+            break
+        for frame in split_frames(data):
+            if frame[0] != COMMAND_SET_CUPS:
+                continue
+            if late:
+                late = False
+                await asyncio.sleep(0.4)
+                writer.write(encode_response('command', result=0x1))
+            else:
+                writer.write(encode_response('command', result=0x0))
+    writer.close()
+
+
+def _controller(device=None, transport=None):
+    if transport is None:
+        transport = MemoryTransport(device.serve)
+    return SmarterCoffeeController('stand-in', transport=transport,
+        logger=None, command_rate=1000.0, command_burst=1000)
+
+
+def test_stop_answers_commands_in_flight():
+    async def _scenario():
+        device = _SilentStandIn(status_interval=0.1)
+        controller = _controller(device)
+        controller.start_monitoring(lambda _: None)
+        assert await controller.connect(timeout=2.0)
+        waiting = asyncio.ensure_future(controller.start_brew())
+        queued = [asyncio.ensure_future(controller.set_cups(cups)) for cups in range(1, 4)]
+        # commands are written to device and wait for replies that never come
+        while device.commands_received < 2:
+            await asyncio.sleep(0.01)
+        await controller.stop_monitoring()
+        return await waiting, await asyncio.gather(*queued)
+
+    waiting, queued = asyncio.run(_scenario())
+    assert waiting == SHUTTING_DOWN
+    # set_cups is latest wins - older queued ones are superseded by the last one
+    assert queued[-1] == SHUTTING_DOWN
+    assert set(queued) <= {SHUTTING_DOWN, SUPERSEDED}
+
+
+def test_late_reply_is_not_taken_by_next_command(monkeypatch):
+    monkeypatch.setattr(smartercontroller, 'COMMAND_REPLY_TIMEOUT', 0.2)
+
+    async def _scenario():
+        controller = _controller(transport=MemoryTransport(_serve_late_first_reply))
+        controller.start_monitoring(lambda _: None)
+        try:
+            assert await controller.connect(timeout=2.0)
+            first = await controller.set_cups(3)
+            # device answers first command while second one waits for its reply
+            second = await controller.set_cups(4)
+        finally:
+            await controller.stop_monitoring()
+        return first, second
+
+    assert asyncio.run(_scenario()) == (NO_REPLY, 'ok')
+
+
+def test_connect_timeout_of_command_is_reported(monkeypatch):
+    monkeypatch.setattr(smartercontroller, 'CONNECT_TIMEOUT', 0.1)
+
+    async def _scenario():
+        controller = _controller(transport=_HangingTransport())
+        controller.reconnect_delay = 0.1
+        controller.start_monitoring(lambda _: None)
+        try:
+            return await asyncio.wait_for(controller.set_cups(3), timeout=2.0)
+        finally:
+            await controller.stop_monitoring()
+
+    assert asyncio.run(_scenario()) == 'error: no connection to device'
@@ -0,0 +1,103 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Author Identity: Sergiy Maysak
+# Copyright: 2019-2023 Sergiy Maysak. All rights reserved.
+
+"""Discovery endpoints: concurrent opening and error handling."""
+
+import asyncio
+import errno
+
+import pytest
+
+from smartercoffee.smarterdiscovery import (
+    SmarterDiscovery, SmarterDiscoveryProtocol, InterfaceInfo, MAX_ENDPOINT_ERRORS,
+)
+
+INTERFACES = [InterfaceInfo(f'eth{index}', f'10.0.{index}.2', f'10.0.{index}.255')
+              for index in range(3)]
+
+
+class _Results:
+    def __init__(self):
+        self.failed = []
+
+    def endpoint_failed(self, protocol, exc):
+        self.failed.append(exc)
+
+
+class _Transport:
+    def close(self):
+        pass
+
+
+class _SlowDiscovery(SmarterDiscovery):
+    """Endpoints take OPEN_DELAY to open, interface eth1 can not be opened."""
+
+    OPEN_DELAY = 0.2
+
+    def __init__(self, loop):
+        super().__init__(loop)
+        self.open = 0
+        self.max_open = 0
+
+    async def _open_endpoint(self, broadcast_addr, interface, results):
+        self.open += 1
+        self.max_open = max(self.max_open, self.open)
+        try:
+            await asyncio.sleep(self.OPEN_DELAY)
+        finally:
+            self.open -= 1
+        if interface is not None and interface.name == 'eth1':
+            raise OSError(errno.EADDRNOTAVAIL, 'address not available')
+        return _Transport()
+
+
+def _protocol():
+    loop = asyncio.new_event_loop()
+    protocol = SmarterDiscoveryProtocol(loop, '10.0.0.255', _Results())
+    protocol.next_broadcast_handle = loop.call_later(10, lambda: None)
+    return loop, protocol
+
+
+def test_endpoints_are_opened_concurrently():
+    async def _scenario():
+        discovery = _SlowDiscovery(asyncio.get_running_loop())
+        with pytest.raises(asyncio.TimeoutError):
+            # nothing answers - find waits for devices until timeout
+            await asyncio.wait_for(discovery.find(INTERFACES), timeout=0.5)
+        return discovery.max_open
+
+    # limited broadcast and every interface at once
+    assert asyncio.run(_scenario()) == len(INTERFACES) + 1
+
+
+def test_transient_errors_keep_broadcasting():
+    loop, protocol = _protocol()
+    try:
+        for _ in range(MAX_ENDPOINT_ERRORS - 1):
+            protocol.error_received(ConnectionRefusedError(errno.ECONNREFUSED, 'refused'))
+        assert protocol.results.failed == []
+        assert protocol.next_broadcast_handle is not None
+
+        # reply resets error count
+        protocol.datagram_received(b'\x7e', ('10.0.0.7', 2081))
+        protocol.error_received(ConnectionRefusedError(errno.ECONNREFUSED, 'refused'))
+        assert protocol.results.failed == []
+
+        for _ in range(MAX_ENDPOINT_ERRORS - 1):
+            protocol.error_received(ConnectionRefusedError(errno.ECONNREFUSED, 'refused'))
+        assert len(protocol.results.failed) == 1
+        assert protocol.next_broadcast_handle is None
+    finally:
+        loop.close()
+
+
+def test_fatal_error_stops_endpoint():
+    loop, protocol = _protocol()
+    try:
+        protocol.error_received(OSError(errno.EADDRNOTAVAIL, 'address not available'))
+        assert len(protocol.results.failed) == 1
+        assert protocol.next_broadcast_handle is None
+    finally:
+        loop.close()
@@ -0,0 +1,60 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Author Identity: Sergiy Maysak
+# Copyright: 2019-2023 Sergiy Maysak. All rights reserved.
+
+"""Controller against local stand-in through injected faults: recovery time and leaks."""
+
+import asyncio
+
+import pytest
+
+from smartercoffee.smarterfaults import CHAOS_SCENARIOS, run_chaos
+
+# seconds every scenario runs, failures are injected after 1 second
+DURATION = 3.0
+READ_TIMEOUT = 0.5
+RECONNECT_DELAY = 0.3
+
+# fault is noticed within read timeout, then monitor waits reconnect delay
+RECOVERY_LIMIT = 2 * READ_TIMEOUT + RECONNECT_DELAY + 0.5
+
+CONNECTION_FAULTS = ('drop', 'half_open')
+
+
+def _run(name, memory=True):
+    return asyncio.run(run_chaos(CHAOS_SCENARIOS[name], duration=DURATION,
+        read_timeout=READ_TIMEOUT, reconnect_delay=RECONNECT_DELAY, seed=1, memory=memory))
+
+
+def _assert_no_leaks(result):
+    assert result.leaked_tasks == 0
+    assert result.leaked_threads == 0
+
+
+@pytest.mark.parametrize('name', [name for name in CHAOS_SCENARIOS if name not in CONNECTION_FAULTS])
+def test_stream_faults_lose_no_commands(name):
+    result = _run(name)
+    _assert_no_leaks(result)
+    assert result.commands_ok > 0
+    assert result.commands_failed == 0
+    assert result.connections == 1
+
+
+@pytest.mark.parametrize('name', CONNECTION_FAULTS)
+def test_recovery_after_connection_failure(name):
+    result = _run(name)
+    _assert_no_leaks(result)
+    assert result.failed_at is not None
+    assert result.connections == 2
+    assert result.available_again is not None
+    assert result.available_again < RECOVERY_LIMIT
+    if result.command_recovery is not None:
+        assert result.command_recovery < RECOVERY_LIMIT
+
+
+def test_recovery_over_tcp():
+    result = _run('drop', memory=False)
+    assert result.available_again is not None
+    assert result.available_again < RECOVERY_LIMIT
+    _assert_no_leaks(result)
@@ -0,0 +1,68 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Author Identity: Sergiy Maysak
+# Copyright: 2019-2023 Sergiy Maysak. All rights reserved.
+
+"""Status history ring buffer."""
+
+from smartercoffee.smarterhistory import StatusHistory
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        self.now += 1.0
+        return self.now
+
+
+def _status(cups, state='ready', hot_plate=False):
+    return dict(state=state, water_level='full', cups=cups, strength='medium',
+                hot_plate=hot_plate, carafe=True,
+                use_beans=False, enoughwater=True)
+
+
+def test_repeated_status_is_stored_once():
+    history = StatusHistory(capacity=4, clock=_Clock())
+    assert history.append(**_status(1))
+    assert not history.append(**_status(1))
+    assert history.append(**_status(1, hot_plate=True))
+    assert len(history) == 2
+
+    records = history.records()
+    assert records[0] == {'timestamp': 1001.0, 'state': 'ready', 'water_level': 'full',
+                          'cups': 1, 'strength': 'medium', 'hot_plate': False,
+                          'carafe': True, 'use_beans': False, 'enoughwater': True}
+    assert records[1]['hot_plate'] is True
+
+
+def test_ring_buffer_wraps_around_keeping_newest():
+    history = StatusHistory(capacity=3, clock=_Clock())
+    for cups in range(1, 8):
+        history.append(**_status(cups))
+
+    assert len(history) == 3
+    records = history.records()
+    assert [record['cups'] for record in records] == [5, 6, 7]
+    assert [record['timestamp'] for record in records] == [1005.0, 1006.0, 1007.0]
+    # newest is compared across wrap around too
+    assert not history.append(**_status(7))
+
+    assert [record['cups'] for record in history.records(since=1005.0)] == [6, 7]
+
+
+def test_unknown_values_are_stored_as_first_table_entry():
+    history = StatusHistory(capacity=2, clock=_Clock())
+    history.append(**_status(3, state='descaling'))
+    assert history.records()[0]['state'] == 'unknown'
+
+
+def test_size_does_not_grow_with_records():
+    history = StatusHistory(capacity=16, clock=_Clock())
+    # 8 byte timestamp and 5 single byte fields per record
+    assert history.bytes_size == 16 * 13
+    for cups in range(100):
+        history.append(**_status(cups % 12 + 1))
+    assert history.bytes_size == 16 * 13
+    assert len(history) == history.capacity == 16
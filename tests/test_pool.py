@@ -0,0 +1,147 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Author Identity: Sergiy Maysak
+# Copyright: 2019-2023 Sergiy Maysak. All rights reserved.
+
+"""Brew pool ranking, claims and queued requests."""
+
+import asyncio
+
+import pytest
+
+from smartercoffee import smarterpool
+from smartercoffee.smarterpool import BrewPool, brew_rank
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 10.0
+
+    def __call__(self):
+        return self.now
+
+
+class _Maker:
+    def __init__(self, mac_address, water_level='full', state='ready'):
+        self.mac_address = mac_address
+        self.available = True
+        self.stale = False
+        self.state = state
+        self.enoughwater = True
+        self.carafe_detection = True
+        self.carafe = True
+        self.water_level = water_level
+
+
+def _pool(*makers):
+    clock = _Clock()
+    return BrewPool(lambda: makers, clock=clock), clock
+
+
+def test_rank_excludes_makers_unable_to_brew():
+    assert brew_rank(_Maker('a')) is not None
+    for change in ({'available': False}, {'stale': True}, {'state': 'brewing'},
+                   {'enoughwater': False}, {'carafe': False}):
+        maker = _Maker('a')
+        for name, value in change.items():
+            setattr(maker, name, value)
+        assert brew_rank(maker) is None, change
+
+    maker = _Maker('a')
+    maker.carafe_detection, maker.carafe = False, False
+    assert brew_rank(maker) is not None
+    assert brew_rank(_Maker('a', water_level='full')) > brew_rank(_Maker('a', water_level='low'))
+
+
+def test_claimed_maker_is_not_handed_out_twice():
+    async def _scenario():
+        low, full = _Maker('low', water_level='low'), _Maker('full')
+        pool, clock = _pool(low, full)
+        assert await pool.acquire() == (full, 0.0)
+        clock.now += 1.0
+        assert await pool.acquire() == (low, 0.0)
+        assert pool.stats()['claimed'] == ['full', 'low']
+
+        # brew command failed - maker is free at once
+        pool.release(full, brewing=False)
+        pool.release(low, brewing=False)
+        assert await pool.acquire(candidates=['low']) == (low, 0.0)
+        pool.release(low, brewing=False)
+
+        # tie goes to the maker idle the longest
+        full.water_level = 'low'
+        assert (await pool.acquire())[0] is full
+
+    asyncio.run(_scenario())
+
+
+def test_queued_request_is_served_on_notify():
+    async def _scenario():
+        maker = _Maker('a', state='brewing')
+        pool, clock = _pool(maker)
+        request = asyncio.ensure_future(pool.acquire())
+        await asyncio.sleep(0)
+        assert pool.stats()['waiting'] == 1
+
+        clock.now += 4.0
+        maker.state = 'ready'
+        pool.notify()
+        assert await request == (maker, 4.0)
+        return pool.stats()
+
+    stats = asyncio.run(_scenario())
+    assert stats['served'] == 1
+    assert stats['waiting'] == 0
+    assert stats['max_wait'] == 4.0
+
+
+def test_cancelled_request_counts_as_timed_out():
+    async def _scenario():
+        pool, _ = _pool(_Maker('a', state='brewing'))
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(pool.acquire(), timeout=0.01)
+        return pool.stats()
+
+    stats = asyncio.run(_scenario())
+    assert stats['timed_out'] == 1
+    assert stats['waiting'] == 0
+
+
+def test_claim_expires_after_hold(monkeypatch):
+    monkeypatch.setattr(smarterpool, 'CLAIM_HOLD', 0.05)
+
+    async def _scenario():
+        maker = _Maker('a')
+        pool, _ = _pool(maker)
+        await pool.acquire()
+        # brew accepted but device still reports ready - claim is kept
+        pool.release(maker, brewing=True)
+        request = asyncio.ensure_future(pool.acquire())
+        await asyncio.sleep(0.01)
+        assert not request.done()
+        assert pool.stats()['claimed'] == ['a']
+
+        # device never reported brewing - maker goes back to the pool
+        assert await asyncio.wait_for(request, timeout=1.0) == (maker, 0.0)
+
+    asyncio.run(_scenario())
+
+
+def test_brewing_state_ends_claim_hold(monkeypatch):
+    monkeypatch.setattr(smarterpool, 'CLAIM_HOLD', 60.0)
+
+    async def _scenario():
+        maker = _Maker('a')
+        pool, _ = _pool(maker)
+        await pool.acquire()
+        pool.release(maker, brewing=True)
+
+        maker.state = 'brewing'
+        pool.notify()
+        # busy state keeps maker out of the pool from now
+        assert pool.stats()['claimed'] == []
+
+        maker.state = 'ready'
+        assert await pool.acquire() == (maker, 0.0)
+
+    asyncio.run(_scenario())
@@ -0,0 +1,154 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Author Identity: Sergiy Maysak
+# Copyright: 2019-2023 Sergiy Maysak. All rights reserved.
+
+"""Brew scheduler timer, hold and release and missed schedules."""
+
+import asyncio
+
+from smartercoffee.smarterschedule import BrewScheduler, MISSED_GRACE_SECONDS
+
+MAC = '00:11:22:33:44:55'
+OTHER_MAC = '00:11:22:33:44:66'
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1700000000.0
+
+    def __call__(self):
+        return self.now
+
+
+class _Scheduler:
+    """Scheduler with fired schedules recorded and optional fire override."""
+
+    def __init__(self, fire=None):
+        self.clock = _Clock()
+        self.fired = []
+        self.changes = 0
+        self._fire_override = fire
+        self.scheduler = BrewScheduler(asyncio.get_running_loop(), self._fire,
+            on_change=self._changed, clock=self.clock)
+
+    async def _fire(self, entry):
+        if self._fire_override is not None:
+            self._fire_override(self, entry)
+            return
+        self.fired.append(entry.schedule_id)
+
+    def _changed(self):
+        self.changes += 1
+
+    async def run_due(self):
+        # timer of due schedule is armed with zero delay, firing is a task
+        for _ in range(3):
+            await asyncio.sleep(0)
+
+
+def test_due_schedules_fire_in_time_order():
+    async def _scenario():
+        test = _Scheduler()
+        scheduler = test.scheduler
+        now = test.clock.now
+        scheduler.add(MAC, now + 20, {'cups': 2}, schedule_id='later')
+        scheduler.add(OTHER_MAC, now + 10, {'cups': 1}, schedule_id='sooner')
+        scheduler.add(MAC, now + 30, {'cups': 3}, schedule_id='cancelled')
+        assert [entry.schedule_id for entry in scheduler.schedules] == [
+            'sooner', 'later', 'cancelled']
+        assert scheduler.cancel('cancelled')
+        assert not scheduler.cancel('cancelled')
+
+        await test.run_due()
+        assert test.fired == []
+
+        test.clock.now = now + 25
+        # timer was armed for real time - fire it now
+        scheduler.shutdown()
+        scheduler._wakeup()
+        await test.run_due()
+        assert test.fired == ['sooner', 'later']
+        assert len(scheduler) == 0
+        assert scheduler._timer is None
+        return test.changes
+
+    # three added, one cancelled, one wake up with due schedules
+    assert asyncio.run(_scenario()) == 5
+
+
+def test_cancel_maker_drops_its_schedules_only():
+    async def _scenario():
+        test = _Scheduler()
+        now = test.clock.now
+        test.scheduler.add(MAC, now + 10, {}, schedule_id='first')
+        test.scheduler.add(MAC, now + 20, {}, schedule_id='second')
+        test.scheduler.add(OTHER_MAC, now + 30, {}, schedule_id='other')
+        assert test.scheduler.cancel_maker(MAC) == 2
+        assert [entry['schedule_id'] for entry in test.scheduler.as_list()] == ['other']
+        test.scheduler.shutdown()
+
+    asyncio.run(_scenario())
+
+
+def test_held_schedule_fires_on_release_of_its_maker():
+    known = set()
+
+    def _fire(test, entry):
+        if entry.mac_address not in known:
+            test.scheduler.hold(entry)
+            return
+        test.fired.append(entry.schedule_id)
+
+    async def _scenario():
+        test = _Scheduler(fire=_fire)
+        scheduler = test.scheduler
+        scheduler.add(MAC, test.clock.now - 1, {}, schedule_id='held')
+        scheduler.add(MAC, test.clock.now - 1, {}, schedule_id='cancelled')
+        await test.run_due()
+        # held schedules are kept and stored
+        assert test.fired == []
+        assert len(scheduler) == 2
+        assert scheduler.cancel('cancelled')
+
+        scheduler.release(OTHER_MAC)
+        await test.run_due()
+        assert test.fired == []
+
+        known.add(MAC)
+        scheduler.release(MAC)
+        await test.run_due()
+        assert test.fired == ['held']
+        assert len(scheduler) == 0
+
+        # released once only
+        scheduler.release(MAC)
+        await test.run_due()
+        assert test.fired == ['held']
+
+    asyncio.run(_scenario())
+
+
+def test_load_drops_schedules_missed_longer_than_grace():
+    async def _scenario():
+        test = _Scheduler()
+        now = test.clock.now
+        test.scheduler.load([
+            {'schedule_id': 'missed', 'mac_address': MAC,
+             'when': now - MISSED_GRACE_SECONDS - 1, 'params': {}},
+            {'schedule_id': 'overdue', 'mac_address': MAC,
+             'when': now - MISSED_GRACE_SECONDS + 1, 'params': {'cups': 2}},
+            {'schedule_id': 'future', 'mac_address': MAC, 'when': now + 60, 'params': {}},
+        ])
+        assert [entry['schedule_id'] for entry in test.scheduler.as_list()] == [
+            'overdue', 'future']
+        await test.run_due()
+        assert test.fired == ['overdue']
+        assert [entry['schedule_id'] for entry in test.scheduler.as_list()] == ['future']
+        test.scheduler.shutdown()
+
+        test.scheduler.load(None)
+        assert len(test.scheduler) == 1
+        test.scheduler.shutdown()
+
+    asyncio.run(_scenario())
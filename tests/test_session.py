@@ -0,0 +1,82 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Author Identity: Sergiy Maysak
+# Copyright: 2019-2023 Sergiy Maysak. All rights reserved.
+
+"""Brew session events from state transitions."""
+
+from smartercoffee.smartersession import (
+    BrewSessionTracker, EVENT_BREW_STARTED, EVENT_GRINDING_DONE, EVENT_BREW_FINISHED,
+)
+
+
+class _Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def _tracker():
+    clock = _Clock(50.0)
+    return BrewSessionTracker(clock=clock, wall_clock=_Clock(1700000000.0)), clock
+
+
+def _update(tracker, state, water_level='full'):
+    return tracker.update(state, cups=4, strength='strong', use_beans=True,
+                          water_level=water_level)
+
+
+def test_beans_brew_session():
+    tracker, clock = _tracker()
+    assert _update(tracker, 'ready') == []
+
+    events = _update(tracker, 'grinding')
+    assert events == [(EVENT_BREW_STARTED, {'started': 1700000000.0, 'cups': 4,
+        'strength': 'strong', 'mode': 'beans', 'water_level_before': 'full'})]
+    assert _update(tracker, 'grinding') == []
+
+    clock.now += 30.0
+    [(event, data)] = _update(tracker, 'brewing')
+    assert event == EVENT_GRINDING_DONE
+    assert data['grinding_duration'] == 30.0
+
+    clock.now += 270.0
+    [(event, data)] = _update(tracker, 'heating plate', water_level='low')
+    assert event == EVENT_BREW_FINISHED
+    assert data['duration'] == 300.0
+    assert data['grinding_duration'] == 30.0
+    assert data['water_level_after'] == 'low'
+    assert data['result'] == 'heating plate'
+    assert tracker.session is None
+
+
+def test_aborted_brew_finishes_session():
+    tracker, clock = _tracker()
+    _update(tracker, 'ready')
+    _update(tracker, 'grinding')
+    assert tracker.session['cups'] == 4
+
+    clock.now += 5.0
+    [(event, data)] = _update(tracker, 'ready')
+    assert event == EVENT_BREW_FINISHED
+    assert data['result'] == 'ready'
+    assert data['duration'] == 5.0
+    assert 'grinding_duration' not in data
+    assert tracker.session is None
+
+    # next brew is a new session
+    [(event, _)] = _update(tracker, 'brewing')
+    assert event == EVENT_BREW_STARTED
+
+
+def test_brew_in_progress_at_start_is_not_reported():
+    tracker, _ = _tracker()
+    assert _update(tracker, 'brewing') == []
+    assert tracker.session is None
+    assert _update(tracker, 'ready') == []
+
+    tracker, _ = _tracker()
+    _update(tracker, 'unknown')
+    assert _update(tracker, 'grinding') == []
@@ -0,0 +1,62 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Author Identity: Sergiy Maysak
+# Copyright: 2019-2023 Sergiy Maysak. All rights reserved.
+
+"""Latest value handoff from producer thread to consumer loop."""
+
+import asyncio
+import threading
+
+from smartercoffee.smarterstreams import LatestValueHandoff
+
+
+def test_newer_value_overwrites_not_consumed_one():
+    async def _scenario():
+        consumed = []
+        handoff = LatestValueHandoff(asyncio.get_running_loop(), consumed.append)
+        for cups in range(1, 6):
+            handoff.put('state', {'cups': cups})
+        handoff.put('frame', b'\x32')
+        assert handoff.stats()['waiting'] == 2
+
+        await asyncio.sleep(0)
+        assert consumed == [{'state': {'cups': 5}, 'frame': b'\x32'}]
+
+        handoff.put('state', {'cups': 6})
+        await asyncio.sleep(0)
+        assert consumed[-1] == {'state': {'cups': 6}}
+        return handoff.stats()
+
+    stats = asyncio.run(_scenario())
+    assert stats == {'handed': 7, 'dropped': 4, 'drains': 2, 'waiting': 0}
+
+
+def test_producer_thread_gets_single_drain_per_batch():
+    async def _scenario():
+        consumed = []
+        handoff = LatestValueHandoff(asyncio.get_running_loop(), consumed.append)
+
+        def _produce():
+            for cups in range(1000):
+                handoff.put('state', cups)
+
+        # consumer loop is stalled while producer runs
+        producer = threading.Thread(target=_produce)
+        producer.start()
+        producer.join()
+        await asyncio.sleep(0)
+        assert consumed == [{'state': 999}]
+        return handoff.stats()
+
+    stats = asyncio.run(_scenario())
+    assert stats['drains'] == 1
+    assert stats['dropped'] == 999
+
+
+def test_put_after_consumer_loop_closed_is_ignored():
+    loop = asyncio.new_event_loop()
+    handoff = LatestValueHandoff(loop, lambda values: None)
+    loop.close()
+    handoff.put('state', 1)
+    assert handoff.stats()['waiting'] == 1
@@ -0,0 +1,75 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Author Identity: Sergiy Maysak
+# Copyright: 2019-2023 Sergiy Maysak. All rights reserved.
+
+"""Controllers in worker process against local stand-in over in-memory pipe."""
+
+import asyncio
+
+from smartercoffee.smarterstandin import SmarterCoffeeStandIn
+from smartercoffee.smartertransport import MemoryTransport
+from smartercoffee.smarterworkers import ShardedControllerPool
+
+MAC = '00:11:22:33:44:55'
+
+# spawning worker imports the package in a fresh interpreter
+START_TIMEOUT = 30.0
+
+
+async def _until(condition, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.02)
+
+
+def test_worker_mirrors_state_and_runs_commands():
+    async def _scenario():
+        device = SmarterCoffeeStandIn(status_interval=0.1)
+        pool = ShardedControllerPool(asyncio.get_running_loop(), processes=1,
+            transport=MemoryTransport(device.serve))
+        updates = []
+        try:
+            controller = pool.controller('stand-in', 2081, MAC)
+            controller.start_monitoring(lambda api: updates.append(api.snapshot()))
+            assert await asyncio.wait_for(controller.connect(), START_TIMEOUT)
+            await _until(lambda: controller.state == 'ready')
+
+            assert await controller.set_cups(7) == 'ok'
+            await _until(lambda: controller.cups == 7)
+
+            stats = await controller.fetch_stats()
+            assert stats['command_queue']['normal']['sent'] >= 1
+            assert stats['handoff']['handed'] >= 1
+
+            # stand-in repeats unchanged status - nothing is streamed for it
+            updates_before = len(updates)
+            await asyncio.sleep(0.5)
+            assert len(updates) == updates_before
+            return updates
+        finally:
+            await pool.shutdown()
+
+    updates = asyncio.run(_scenario())
+    assert updates[-1]['cups'] == 7
+    assert updates[-1]['mac_address'] == MAC
+
+
+def test_pending_updates_only_diff_does_not_notify():
+    async def _scenario():
+        pool = ShardedControllerPool(asyncio.get_running_loop(), processes=1)
+        controller = pool.controller('stand-in', 2081, MAC)
+        calls = []
+        controller._handler = calls.append
+        controller._apply({'pending_updates': ['cups']})
+        assert controller.pending_updates == {'cups'}
+        assert calls == []
+        assert len(controller.status_history) == 0
+
+        controller._apply({'cups': 5, 'pending_updates': []})
+        assert calls == [controller]
+        assert len(controller.status_history) == 1
+        await pool.shutdown()
+
+    asyncio.run(_scenario())